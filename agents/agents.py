@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from typing import Optional, Sequence
 from agno.agent import Agent
 from agno.tools.python import PythonTools
 from agno.models.openai import OpenAIChat
@@ -7,18 +8,30 @@ from core.tools import (
     read_file_utf8, save_file_utf8, initial_data_scout, excel_structure_parser,
     extract_and_analyze_charts_tool, extract_and_analyze_images_tool,
     analyze_extracted_image_content_tool, compile_latex, escape_latex,
-    proper_write_latex, list_available_visualizations)
+    proper_write_latex, list_available_visualizations, search_workbook_text,
+    find_relevant_columns, get_column_details, get_formula_dependencies, profile_table_columns, prepare_report_figures, render_table)
+from core.column_index import relevant_columns_summary
+from core.regions import regions_summary
+from core.formulas import formula_summary
+from core.sampling import sampling_summary
+from core.revisions import revision_summary
+from core.script_library import script_library
+from core.artifacts import workspace_registry
+from core.model_router import model_router, estimate_tokens
+from core.config import MODEL_API_KEY
 
 from core.paths import (
     repo_path, scripts_path, profiler_notes_path, excel_path,
-    summary_path, cleaned_excel, plot_output_path, queries_path, report_path)
+    summary_path, cleaned_excel, plot_output_path, queries_path, report_path,
+    context_path, workspace_path, media_json_path)
 
 from core.Structured_Output import (
     OrchestratorDecision, CleanerResponse, FilterResponse,
     PlotResponse, ReportResponse, SummaryResponse, DeliveryResponse)
 
 class AgentManager:
-    def __init__(self, model_name: str):
+    def __init__(self, model_name: Optional[str] = None):
+        # A model name pins every agent to that model; without one each agent gets the model the router picks for its role
         self.model_name = model_name
         self.repo_path = repo_path
         self.scripts_path = scripts_path
@@ -30,13 +43,76 @@ class AgentManager:
             read_file_utf8, save_file_utf8, excel_structure_parser,
             extract_and_analyze_charts_tool, extract_and_analyze_images_tool,
             analyze_extracted_image_content_tool, compile_latex, escape_latex,
-            proper_write_latex
+            proper_write_latex, find_relevant_columns, get_column_details, get_formula_dependencies, profile_table_columns
         ]
+        self.column_tools = [find_relevant_columns, get_column_details, get_formula_dependencies]
+        # Set by the preprocessing when the workbook is a revision of an earlier upload or has a known layout
+        self.revision = None
+        self.schema = None
+
+    def _model(self, role: str, temperature: float, texts: Sequence[str] = (), files: Sequence[Path] = ()) -> OpenAIChat:
+        router = model_router()
+        model = self.model_name or router.pick(role, estimate_tokens(texts, files))["model"]
+        # Retries are left to the rate-limited transport, which spaces them out across every agent
+        return OpenAIChat(model, temperature=temperature, base_url=router.base_url or None, api_key=MODEL_API_KEY or None, max_retries=0,
+                          http_client=router.http_client(), default_headers=router.headers(role))
+
+    def _columns_hint(self, task: str) -> str:
+        """Prompt section listing only the columns relevant to the task, so wide sheets do not flood the prompt"""
+        summary = relevant_columns_summary(task)
+        reader = "\nRead sheets with `from core.readers import read_sheet` then `read_sheet(path, sheet_name=..., usecols=[...])`: same arguments as pd.read_excel, on the fastest installed engine."
+        tables = regions_summary(self.excel_path)
+        if tables:
+            reader += ("\n## Tables found in the workbook:\n" + tables +
+                       "\nLoad them with `from core.readers import read_tables` (yields label, region, DataFrame with the real header) instead of reading whole sheets.")
+        if not summary:
+            return "## Relevant columns: not indexed yet, inspect the file with pandas." + reader
+        return ("## Most relevant columns for this task (the sheets may have more):\n" + summary +
+                "\nOnly load these columns (pandas usecols) unless the task needs others; use find_relevant_columns or get_column_details to look up more." + reader)
+
+    def _writer_hint(self) -> str:
+        return ("Write every Excel output with `from core.writers import write_excel` then `write_excel(path, df)` "
+                "(or `write_excel(path, {'Sheet name': df, ...})` for several sheets) instead of df.to_excel or pd.ExcelWriter: "
+                "it streams rows to disk, keeps dates and numbers typed and adds a bold frozen header with filters.")
+
+    def _formulas_hint(self) -> str:
+        """Computed columns read from the workbook formulas, so agents do not have to guess them from sample values"""
+        summary = formula_summary()
+        if not summary:
+            return "## Computed columns: the workbook has no formulas over its tables."
+        return ("## Computed columns (from the Excel formulas; trust these instead of inferring them from values):\n" + summary +
+                "\nUse get_formula_dependencies for the full list or one column's sources and dependents.")
+
+    def _sampling_hint(self) -> str:
+        """Large tables are described from a sample; agents must not present those figures as exact counts"""
+        summary = sampling_summary(self.excel_path)
+        if not summary:
+            return ""
+        return ("## Large tables (statistics estimated from a stratified sample, with 95% bounds):\n" + summary +
+                "\nKeep the 'sampling' section of context.json and report these figures as estimates with their bounds. "
+                "Use profile_table_columns for statistics (exact=True only when an exact figure is required, it reads the whole table) "
+                "and `from core.readers import read_tables` with sample=True in scripts instead of loading every row.")
+
+    def _revision_hint(self) -> str:
+        """On a re-uploaded workbook, point the agents at what changed so the rest of the previous analysis is kept"""
+        changes = revision_summary(self.revision)
+        if not changes:
+            return ""
+        return ("## This workbook is a revision of an earlier upload. Changes since then:\n" + changes +
+                "\nThe previous analysis was restored: context_notes.txt and workspace.json are the previous versions, the previous report is in previous_context.json. "
+                "Only re-analyse the changed sheets and rows listed above, carry the findings of the unchanged sheets over as they are, "
+                "and drop the findings of removed sheets.")
+
+    def _schema_hint(self) -> str:
+        if not self.schema or self.schema.get("status") != "matched":
+            return ""
+        return ("## Known layout: context_notes.txt comes from an earlier workbook with the same tables, column labels and types. "
+                "Take the column meanings from it as established; every statistic, count and anomaly must still be computed on this file.")
 
     def get_data_extractor_agent(self):
         return Agent(
             name="Data_Extractor_Agent",
-            model=OpenAIChat(self.model_name, temperature=0.0),
+            model=self._model("data_extractor", 0.0),
             tools=self.toolset,
             #debug_mode=True,
             instructions=[
@@ -56,12 +132,12 @@ class AgentManager:
         )
         
     def get_scout_agent(self) -> Agent:
-        return Agent( name="scout_agent", model=OpenAIChat(self.model_name , temperature=0.0), tools=[initial_data_scout], instructions=["You are a script-running assistant.", "Your only job is to call the initial_data_scout tool with the file paths you are given."])
+        return Agent( name="scout_agent", model=self._model("scout", 0.0), tools=[initial_data_scout], instructions=["You are a script-running assistant.", "Your only job is to call the initial_data_scout tool with the file paths you are given."])
 
     def get_profiler_agent(self) -> Agent:
         return Agent( 
             name="profiler_agent",
-            model=OpenAIChat(self.model_name, temperature=0.0),
+            model=self._model("profiler", 0.0, files=[context_path]),
             tools=self.toolset,
             instructions=[
                 "You are a Business Intelligence Analyst. Your goal is to understand and document the business context of a dataset from an Excel file.",
@@ -69,12 +145,13 @@ class AgentManager:
                 "2. *Analyze Columns*: Examine the column names and sample data to infer the business purpose of each column.",
                 "3. *Document Findings*: Write a clear summary of your findings into a string.",
                 "4. *Save the Output*: Use the save_file_utf8 tool to save your summary to the specified file path." ,
-                f"stock the python scripts you create in {self.scripts_path}"
+                f"stock the python scripts you create in {self.scripts_path}",
+                self._formulas_hint(), self._sampling_hint(), self._revision_hint()
             ]
         )
 
     def get_analyst_agent(self) -> Agent:
-        return Agent(  name="analyst_agent", model=OpenAIChat(self.model_name, temperature=0.0), tools=self.toolset, instructions=[
+        return Agent(  name="analyst_agent", model=self._model("analyst", 0.0, files=[context_path, profiler_notes_path]), tools=self.toolset, instructions=[
             """You are an expert-level senior data analyst. Your goal is to produce a comprehensive data quality report by performing both a systematic check and an exploratory analysis.
             *Part 1: Systematic Quality Check*
             Write and execute a Python script to perform a thorough analysis of the Excel file. Your script MUST check for the following common issues:
@@ -95,12 +172,12 @@ class AgentManager:
 
             *Final Report Generation:*
             - Combine all findings from both Part 1 and Part 2 into a single, comprehensive JSON report.
-            - Use save_file_utf8 to overwrite context.json with the final report."""])
+            - Use save_file_utf8 to overwrite context.json with the final report.""", self._formulas_hint(), self._sampling_hint(), self._revision_hint(), self._schema_hint()])
 
     def get_preprocessing_reviewer_agent(self) -> Agent:
         return Agent(
             name="reviewer_agent",
-            model=OpenAIChat(self.model_name, temperature=0.0),
+            model=self._model("preprocessing_reviewer", 0.0, files=[context_path, profiler_notes_path]),
             tools=[read_file_utf8, save_file_utf8],
             instructions=[
                 "You are a meticulous Quality Assurance analyst. Your job is to review a JSON data quality report and find logical flaws in the analysis itself.",
@@ -114,7 +191,7 @@ class AgentManager:
     def get_workspace_agent(self, context_note_path: Path, context_path: Path, repo_path: Path, media_json_path: Path):
         return Agent(
             name="Workspace_Agent",
-            model=OpenAIChat(self.model_name, temperature=0.0),
+            model=self._model("workspace", 0.0, files=[context_note_path, context_path, media_json_path]),
             tools=self.toolset,
             #debug_mode=True,
             instructions=[
@@ -125,14 +202,15 @@ class AgentManager:
                 f"2. use read_file_utf8 to read the context_notes file located at {context_note_path} it contain all the columns analysis, then use save_file_utf8 to save the relevant information to workspace.json",
                 f"3. use read_file_utf8 to read the context file located at {context_path} it contain all the anomalies and problems found by the profiler agent, then use save_file_utf8 to append the relevant information to workspace.json",
                 f"4. use read_file_utf8 to read the media file located at {media_json_path} it contain all the media information, then use save_file_utf8 to append the relevant information to workspace.json",
-                f"5. make sure that the json file is well structured and save it in the {repo_path} folder as workspace.json"
+                f"5. make sure that the json file is well structured and save it in the {repo_path} folder as workspace.json",
+                self._revision_hint()
             ]
         )
         
     def get_planner_agent(self, query: str , todo : Path ):
         return Agent(
             name="planner_agent",
-            model=OpenAIChat(self.model_name, temperature=0.2),
+            model=self._model("planner", 0.2, texts=[query], files=[profiler_notes_path]),
             tools=[save_file_utf8],
             instructions = [
                 "You are the PeaQockManus Planner, a master workflow architect. Your job is to convert user requests into a high-level, strategic plan.",
@@ -173,7 +251,7 @@ class AgentManager:
     def get_orchestrator_agent(self , todo : Path ) -> Agent:
         return Agent(
             name="orchestrator_agent",
-            model=OpenAIChat(self.model_name, temperature=0.0),
+            model=self._model("orchestrator", 0.0, files=[todo]),
             tools=[read_file_utf8 , save_file_utf8],
             response_model=OrchestratorDecision,
             instructions=[
@@ -253,8 +331,8 @@ class AgentManager:
     def get_cleaner_agent(self , task : str , query : str , context_json : Path , context_notes : Path , excel_path : Path , cleaned_path : Path ) : 
         return Agent(
             name="cleaner agent" , 
-            model=OpenAIChat(self.model_name , temperature=0.0) , 
-            tools=[self.toolset[0] , self.toolset[1]] , 
+            model=self._model("cleaner", 0.0, texts=[task, query], files=[context_json, context_notes]) , 
+            tools=[self.toolset[0] , self.toolset[1], *self.column_tools] , 
             structured_outputs=True , 
             response_model=CleanerResponse , 
             instructions=[
@@ -264,6 +342,8 @@ class AgentManager:
                 f"FIRST you must write and execute a Python script that cleans the file '{excel_path}' based on the user's instructions.",
                 "focus only on the sheets that contain relevant data for the task, don't clean all the excel file sheets",
                 f"The script MUST save the cleaned data to '{cleaned_path}'.",
+                self._writer_hint(),
+                script_library().hint("cleaner", task),
                 "You MUST use the save_to_file_and_run tool from PythonTools to execute this script BEFORE doing anything else.",
                 "Until you have successfully executed this script, DO NOT proceed to Step 2.",
                 
@@ -279,6 +359,7 @@ class AgentManager:
                 f"Business Context: Read file at '{context_notes}'",
                 f"Input File: '{excel_path}'",
                 f"Output File: '{cleaned_path}'",
+                self._columns_hint(task),
                 
                 "## Critical Rules:",
                 "1. NEVER claim you've cleaned the data without first executing a Python script",
@@ -296,7 +377,7 @@ class AgentManager:
     def get_summary_agent(self, repo_path: Path, excel_path: Path, profiler_notes_path: Path, workspace_path: Path):
         return Agent(
             name="Summary_Agent",
-            model=OpenAIChat(self.model_name, temperature=0.4),
+            model=self._model("summary", 0.4, files=[profiler_notes_path, workspace_path]),
             tools=self.toolset,
             response_model=SummaryResponse,
             #debug_mode=True,
@@ -317,8 +398,8 @@ class AgentManager:
     def get_filter_agent(self, task: str, cleaned_excel_path: Path, output_path: Path , context_notes : Path):
         return Agent(
             name="filter_agent", 
-            model=OpenAIChat(self.model_name, temperature=0.0), 
-            tools=[self.toolset[0], self.toolset[1]],
+            model=self._model("filter", 0.0, texts=[task], files=[context_notes]), 
+            tools=[self.toolset[0], self.toolset[1], search_workbook_text, *self.column_tools],
             structured_outputs=True,
             response_model=FilterResponse,  
             instructions=[
@@ -327,9 +408,13 @@ class AgentManager:
                 "## STEP 1 (MANDATORY): Write and Execute a Python Script",
                 f"First you cant just assume something in the excel file , so you always must build context using context notes : {context_notes} and using the excel file : {cleaned_excel_path} inspecting it using pandas" ,
                 "so you ALWAYS inspect first and build understanding on the excel then ", 
+                "When the task names a client, product, code or any other text value, call search_workbook_text FIRST instead of scanning the sheets with pandas string matching.",
+                "It tells you which sheet and column hold the value and its exact spelling (use mode='prefix' for partial names and mode='fuzzy' for misspellings); then filter on that column with an exact comparison.",
+                "Row numbers returned by search_workbook_text refer to the original file, the cleaned file may have fewer rows.",
                 f"Second you must write and execute a Python script that filters/queries the file '{cleaned_excel_path}' based on the task description.",
                 "You MUST use the save_to_file_and_run tool from PythonTools to execute this script BEFORE doing anything else.",
                 f"The script should save filtered data in this repo : {output_path}",
+                self._writer_hint(),
                 f"the scripts should be stocked here {self.scripts_path}",
 
                 "## STEP 2 (After script execution): Provide Structured Response",
@@ -342,6 +427,8 @@ class AgentManager:
                 f"## Input File: '{cleaned_excel_path}'",
                 f"## Output Path: '{output_path}'",
                 f"## context notes to understand more the excel : '{context_notes}' " , 
+                self._columns_hint(task),
+                script_library().hint("filter", task),
                 
                 "## Critical Rules:",
                 "1. If your script fails, fix it and try again until it succeeds",
@@ -352,8 +439,8 @@ class AgentManager:
     def get_plot_agent(self, task: str, context_notes : Path ,  excel_path: Path, output_path: Path) -> Agent:
         return Agent(
             name="plot_agent",
-            model=OpenAIChat(self.model_name, temperature=0.0),
-            tools=[self.toolset[0], self.toolset[1]],
+            model=self._model("plot", 0.0, texts=[task], files=[context_notes]),
+            tools=[self.toolset[0], self.toolset[1], *self.column_tools],
             structured_outputs=True,
             response_model=PlotResponse,
             instructions=[
@@ -364,6 +451,7 @@ class AgentManager:
                 f"Then you must write and execute a Python script that creates a Plotly visualization based on the task description.",
                 "You MUST use the save_to_file_and_run tool from PythonTools to execute this script BEFORE doing anything else.",
                 f"All scripts must be saved here: {self.scripts_path}",
+                script_library().hint("plot", task),
 
                 "For creating plots:",
                 "1. Always use Plotly (import plotly.express as px or import plotly.graph_objects as go)",
@@ -371,9 +459,12 @@ class AgentManager:
                 "3. Use appropriate color schemes and layouts",
                 "4. Save the plot as an HTML file to maintain interactivity",
                 f"5. ALSO export a static image of the same plot (PNG) to the {output_path} folder",
-                "6. Your script MUST end with BOTH:",
-                f"- fig.write_html('{output_path}/plot.html')",
-                f"- fig.write_image('{output_path}/plot.png')",
+                "6. NEVER call fig.write_html, fig.write_image or fig.write_json yourself, save through the plotting helper: `from core.plotting import save_plot`",
+                "   save_plot downsamples very long series, bins raw histograms and switches big scatter plots to WebGL so the files stay small, then writes plot.html, plot.json and plot.png",
+                "7. Your script MUST end with:",
+                f"- stats = save_plot(fig, '{output_path}', name='plot')",
+                "- print(stats['reduction_ratio'])",
+                "Only if the user explicitly asks for a standalone/offline HTML file, pass standalone=True to save_plot (it embeds the 3.5 MB plotly.js bundle).",
 
                 "## STEP 2 (After script execution): Provide Structured Response",
                 "ONLY after the Python script has successfully executed, return a PlotResponse with:",
@@ -382,11 +473,13 @@ class AgentManager:
                 "- plot_html: The full path to the saved HTML plot file",
                 "- plot_image: The full path to the saved PNG image file",
                 "- insight: Key business insights derived from the visualization",
+                "- reduction_ratio: the reduction_ratio printed by your script",
 
                 f"## Your Task: {task}",
                 f"## Input File: '{excel_path}'",
                 f"## Output Path: '{output_path}'",
                 f"## Context notes: '{context_notes}'",
+                self._columns_hint(task),
 
                 "## Important Notes:",
                 "- Always include appropriate titles, labels, and legends",
@@ -399,10 +492,10 @@ class AgentManager:
         )
 
     def get_report_agent(self, repo_path: Path, images_path: Path):
-        report_toolset = [read_file_utf8, save_file_utf8, excel_structure_parser, extract_and_analyze_charts_tool, extract_and_analyze_images_tool, analyze_extracted_image_content_tool, compile_latex, escape_latex, proper_write_latex, list_available_visualizations]
+        report_toolset = [read_file_utf8, save_file_utf8, excel_structure_parser, extract_and_analyze_charts_tool, extract_and_analyze_images_tool, analyze_extracted_image_content_tool, compile_latex, escape_latex, proper_write_latex, list_available_visualizations, prepare_report_figures, render_table]
         return Agent(
             name="Report_Agent",
-            model=OpenAIChat(self.model_name, temperature=0.0),
+            model=self._model("reporter", 0.0, files=[profiler_notes_path, workspace_path, summary_path]),
             tools=report_toolset,
             response_model=ReportResponse,
             #debug_mode=True,
@@ -423,13 +516,15 @@ class AgentManager:
                 "- If the user asks for SPECIFIC information: only include that information. Keep it concise and exclude unrelated data.",
                 "WORKFLOW:",
                 f"1. First, read the {repo_path}/workspace.json and {repo_path}/context_notes.txt files to understand the data context",
-                "2. Use list_available_visualizations tool to see all available plots, charts, and images",
+                "2. Call prepare_report_figures() to export report-sized PNGs of the plots, then use list_available_visualizations tool to see all available plots, charts, and images",
                 f"3. PRIORITY: Include existing plots from {repo_path}/plots folder in the report",
                 f"4. Include any extracted images from {images_path} folder",
                 "5. Create a comprehensive LaTeX report using proper_write_latex tool with filename 'report.tex'",
                 "6. ALWAYS include available plots using \\includegraphics commands in LaTeX",
                 f"7. ALWAYS start with a summary that contain the same text in the {repo_path}/summary.txt file",
                 "8. Use escape_latex tool to properly escape any text from JSON files before inserting into LaTeX",
+                "   For EVERY data table (query results in queries/, extracts of the cleaned excel), call render_table and paste only the returned \\input line, never type table rows yourself",
+                "   The preamble MUST contain \\usepackage{longtable} and \\usepackage{booktabs} for these tables",
                 f"9. Compile the report using compile_latex('report.tex') to generate PDF in {repo_path}",
                 "",
                 "IMPORTANT - PLOT INCLUSION:",
@@ -482,16 +577,21 @@ class AgentManager:
                 "ERROR HANDLING:",
                 "- If chart extraction tools fail, continue with existing plots from plots/ folder",
                 "- If any files are missing, continue with available data and note in summary",
-                "- If LaTeX compilation fails, return status='failure' with error details",
+                "- If LaTeX compilation fails, compile_latex returns the failing line numbers with their source lines: fix ONLY those lines and compile again (at most 3 attempts), then return status='failure' with the error details",
                 "- Always provide meaningful feedback about what succeeded or failed"
                 
             ]
         )
 
+    def _deliverables(self, repo_path: Path) -> list:
+        registry = workspace_registry()
+        entries = [e for e in registry.find() if e["type"] in ("cleaned", "summary", "report", "plot", "query") and registry.absolute(e).is_file()]
+        return [f"- {e['path']}: {e['type']}, {e['step'] or 'unknown'}" for e in sorted(entries, key=lambda e: e["path"])] or ["- none registered, check the repo folder"]
+
     def get_delivery_agent(self, query: str, repo_path: Path, excel_path: Path, profiler_notes_path: Path, workspace_path: Path):
         return Agent(
             name="delivery_Agent",
-            model=OpenAIChat(self.model_name, temperature=0.0),
+            model=self._model("delivery", 0.0, texts=[query], files=[workspace_path]),
             response_model=DeliveryResponse,
             #debug_mode=True,
             instructions = [
@@ -512,6 +612,8 @@ class AgentManager:
                 f"if the user ask for plots -> select {os.path.join(plot_output_path, 'plot.html')}",
                 f"filtering the excel file, aggregating, doing analytical operations on the excel -> select {queries_path}",
                 "3. put the path of the selected file or folder in chosen_path",
-                "IMPORTANT: your choice should always prioritize the report if found in the query"
+                "IMPORTANT: your choice should always prioritize the report if found in the query",
+                "Deliverables produced in this job (path relative to the repo: type, step):",
+                *self._deliverables(repo_path)
             ]
         )
\ No newline at end of file
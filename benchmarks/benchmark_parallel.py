@@ -0,0 +1,48 @@
+"""Time the per-sheet column profiling with a growing number of worker processes.
+
+    python benchmarks/benchmark_parallel.py --sheets 24 --rows 20000 --workers 1 2 4 8
+
+Wall time should drop roughly with the number of cores until there are fewer sheets than workers
+or the largest sheet dominates.
+"""
+import os, sys, time, argparse, tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.writers import write_excel
+from core.parallel import map_tables
+from core.column_index import _profile_table
+
+def sample_workbook(path: str, sheets: int, rows: int):
+    rng = np.random.default_rng(0)
+    write_excel(path, {f"Sheet {i}": pd.DataFrame({
+        "date": pd.date_range("2020-01-01", periods=rows, freq="h"),
+        "account": rng.choice([f"ACC-{i:04d}" for i in range(800)], rows),
+        "amount": rng.normal(1000, 250, rows),
+        "quantity": rng.integers(1, 100, rows),
+    }) for i in range(sheets)})
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parallel sheet profiling")
+    parser.add_argument("--sheets", type=int, default=24)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "sheets.xlsx")
+    sample_workbook(path, args.sheets, args.rows)
+    print(f"{args.sheets} sheets x {args.rows:,} rows, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'seconds':>9}")
+    baseline = None
+    for workers in args.workers:
+        started = time.perf_counter()
+        results = map_tables(path, _profile_table, workers=workers)
+        seconds = time.perf_counter() - started
+        if baseline is None:
+            baseline = results
+        assert results == baseline, "parallel results differ from the first run"
+        print(f"{workers:>8} {seconds:>9.2f}")
+
+if __name__ == "__main__":
+    main()
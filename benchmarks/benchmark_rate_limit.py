@@ -0,0 +1,68 @@
+"""Fire concurrent chat completions at the fake provider, with and without the rate-limited transport.
+
+    python benchmarks/benchmark_rate_limit.py --callers 8 --calls 3 --rpm 60 --throttle 0.1
+    python benchmarks/benchmark_rate_limit.py --callers 16 --calls 4 --rpm 2000 --tpm 2000000 --latency 0.2 --hedge-after 1
+
+Without the limiter every caller hits the provider at once: calls over its limits come back with a 429 (which the
+OpenAI client would retry blindly) and, above the concurrency the provider sustains, every call slows down. With it the
+calls are spaced to the per-minute limits, the concurrency settles near what the provider sustains and the few 429s
+are retried after their Retry-After.
+"""
+import os, sys, time, argparse, statistics
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from fake_provider import serve
+from core.rate_limit import RateLimiter, RateLimitedTransport
+
+def run(url: str, client: httpx.Client, callers: int, calls: int) -> dict:
+    payload = {"model": "fake", "messages": [{"role": "user", "content": "Describe the sales sheet. " * 20}], "max_tokens": 50}
+    def caller(_):
+        results = []
+        for _ in range(calls):
+            started = time.perf_counter()
+            status = client.post(url, json=payload).status_code
+            results.append((status, time.perf_counter() - started))
+        return results
+    started = time.perf_counter()
+    with ThreadPoolExecutor(callers) as pool:
+        results = [r for rs in pool.map(caller, range(callers)) for r in rs]
+    latencies = sorted(s for _, s in results)
+    return {"seconds": time.perf_counter() - started, "ok": sum(st == 200 for st, _ in results), "failed": sum(st != 200 for st, _ in results),
+            "p50": statistics.median(latencies), "p95": latencies[int(0.95 * (len(latencies) - 1))]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the outbound rate limiter against a throttling fake provider")
+    parser.add_argument("--callers", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--rpm", type=int, default=60)
+    parser.add_argument("--tpm", type=int, default=40000)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--throttle", type=float, default=0.05)
+    parser.add_argument("--hedge-after", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"{args.callers} callers x {args.calls} calls, provider limits {args.rpm} req/min and {args.tpm} tokens/min, {args.throttle:.0%} random 429s")
+    print(f"{'client':>10} {'seconds':>8} {'ok':>5} {'failed':>7} {'p50':>7} {'p95':>7} {'429s sent':>10} {'peak calls':>11}")
+    for name in ("plain", "limited"):
+        server = serve(0, rpm=args.rpm, tpm=args.tpm, latency=args.latency, throttle=args.throttle)
+        url = f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+        if name == "plain":
+            client, limiter = httpx.Client(timeout=120), None
+        else:
+            # A little under the provider's limits, the way a deployment would configure it
+            limiter = RateLimiter(rpm=int(args.rpm * 0.9), tpm=int(args.tpm * 0.9), concurrency=8, target_latency=10 * args.latency, shared=False)
+            client = httpx.Client(transport=RateLimitedTransport(limiter, hedge_after=args.hedge_after), timeout=120)
+        result = run(url, client, args.callers, args.calls)
+        stats = server.provider.stats
+        print(f"{name:>10} {result['seconds']:>8.1f} {result['ok']:>5} {result['failed']:>7} {result['p50']:>7.2f} {result['p95']:>7.2f} "
+              f"{stats['throttled']:>10} {stats['max_in_flight']:>11}")
+        if limiter:
+            print(f"{'':>10} limiter: {limiter.snapshot()}")
+        client.close()
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
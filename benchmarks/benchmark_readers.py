@@ -0,0 +1,66 @@
+"""Compare the Excel reader engines on sample workbooks.
+
+    python benchmarks/benchmark_readers.py data/sales.xlsx data/legacy.xls
+    python benchmarks/benchmark_readers.py --rows 200000          # synthetic workbook when no file is given
+
+For every file, each installed engine able to read its real format loads all sheets a few times;
+the table shows the best time, the rows read and the speed-up over openpyxl/xlrd.
+"""
+import os, sys, time, argparse, tempfile
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.readers import ENGINES, detect_format, engine_available
+
+def synthetic_workbook(rows: int) -> str:
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "date": pd.date_range("2020-01-01", periods=rows, freq="min"),
+        "client": rng.choice([f"Client {i}" for i in range(500)], rows),
+        "product": rng.choice(["Alpha", "Beta", "Gamma", "Delta"], rows),
+        "quantity": rng.integers(1, 100, rows),
+        "price": rng.random(rows) * 1000,
+        "comment": rng.choice(["", "urgent", "paid", "refund requested"], rows),
+    })
+    path = os.path.join(tempfile.mkdtemp(), f"synthetic_{rows}.xlsx")
+    df.to_excel(path, index=False)
+    return path
+
+def time_engine(path: str, engine: str, repeat: int):
+    best, rows = None, 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        sheets = pd.read_excel(path, sheet_name=None, engine=engine)
+        elapsed = time.perf_counter() - started
+        rows = sum(len(df) for df in sheets.values())
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Excel reader engines")
+    parser.add_argument("files", nargs="*", help="workbooks to read (xlsx, xlsm, xlsb, xls, ods)")
+    parser.add_argument("--rows", type=int, default=100000, help="rows of the synthetic workbook used when no file is given")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    files = args.files or [synthetic_workbook(args.rows)]
+    print(f"{'file':<32} {'format':<6} {'engine':<10} {'seconds':>9} {'rows':>10} {'speed-up':>9}")
+    for path in files:
+        fmt = detect_format(path)
+        results = {}
+        for engine in ENGINES[fmt]:
+            if not engine_available(engine):
+                print(f"{os.path.basename(path)[:32]:<32} {fmt:<6} {engine:<10} {'not installed':>9}")
+                continue
+            try:
+                results[engine] = time_engine(path, engine, args.repeat)
+            except Exception as e:
+                print(f"{os.path.basename(path)[:32]:<32} {fmt:<6} {engine:<10} failed: {e}")
+        baseline = results.get(ENGINES[fmt][-1], (None, 0))[0]
+        for engine, (seconds, rows) in results.items():
+            speedup = f"{baseline / seconds:.1f}x" if baseline else "-"
+            print(f"{os.path.basename(path)[:32]:<32} {fmt:<6} {engine:<10} {seconds:>9.2f} {rows:>10,} {speedup:>9}")
+
+if __name__ == "__main__":
+    main()
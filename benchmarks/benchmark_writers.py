@@ -0,0 +1,50 @@
+"""Compare the streaming Excel export with DataFrame.to_excel on growing row counts.
+
+    python benchmarks/benchmark_writers.py --rows 10000 50000 200000
+
+Peak memory is measured with tracemalloc (Python allocations, the DataFrame itself excluded);
+the streaming writer should stay flat while to_excel grows with the row count.
+"""
+import os, sys, time, argparse, tempfile, tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core.writers import write_excel, writer_engine
+
+def sample_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "date": pd.date_range("2020-01-01", periods=rows, freq="min"),
+        "client": rng.choice([f"Client {i}" for i in range(500)], rows),
+        "quantity": rng.integers(1, 100, rows),
+        "price": rng.random(rows) * 1000,
+        "paid": rng.random(rows) < 0.8,
+    })
+
+def measure(write) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    write()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 1024 ** 2
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming Excel writer")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 50000, 100000])
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    print(f"streaming engine: {writer_engine()}")
+    print(f"{'rows':>10} {'writer':<12} {'seconds':>9} {'peak MB':>9}")
+    for rows in args.rows:
+        df = sample_frame(rows)
+        for name, write in [("write_excel", lambda: write_excel(os.path.join(folder, "stream.xlsx"), df)),
+                            ("to_excel", lambda: df.to_excel(os.path.join(folder, "pandas.xlsx"), index=False))]:
+            seconds, peak = measure(write)
+            print(f"{rows:>10,} {name:<12} {seconds:>9.2f} {peak:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""OpenAI-compatible stand-in for the model provider that throttles like one, to exercise the rate limiter locally.
+
+    python benchmarks/fake_provider.py --port 8090 --rpm 60 --tpm 20000 --latency 0.5 --throttle 0.05
+    PEAQOCK_MODEL_BASE_URL=http://127.0.0.1:8090/v1 python main.py
+
+/v1/chat/completions answers after a random latency (doubling with every concurrent call above --capacity) with a short
+completion and its token usage. Calls over the per-minute request or token limits, and a --throttle fraction of the
+others, get a 429 with Retry-After like the real API. GET /stats returns the counts.
+"""
+import json, time, random, argparse, threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeProvider:
+    def __init__(self, rpm: int = 60, tpm: int = 20000, latency: float = 0.5, throttle: float = 0.0, capacity: int = 4, seed: int = 0):
+        self.rpm, self.tpm = rpm, tpm
+        self.latency, self.throttle, self.capacity = latency, throttle, capacity
+        self.random = random.Random(seed)
+        self.window = deque()
+        self.in_flight = 0
+        self.stats = {"requests": 0, "ok": 0, "throttled": 0, "max_in_flight": 0}
+        self._lock = threading.Lock()
+
+    def admit(self, tokens: int):
+        """None when the call is accepted, else the seconds the client should wait"""
+        with self._lock:
+            now = time.time()
+            while self.window and now - self.window[0][0] > 60:
+                self.window.popleft()
+            self.stats["requests"] += 1
+            used = sum(t for _, t in self.window)
+            if len(self.window) >= self.rpm or used + tokens > self.tpm:
+                self.stats["throttled"] += 1
+                return max(0.1, 60 - (now - self.window[0][0])) if self.window else 1.0
+            if self.random.random() < self.throttle:
+                self.stats["throttled"] += 1
+                return self.random.uniform(0.2, 1.0)
+            self.window.append((now, tokens))
+            self.in_flight += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+            return None
+
+    def complete(self, payload: dict) -> dict:
+        prompt = sum(len(json.dumps(m.get("content", ""))) for m in payload.get("messages", [])) // 4
+        completion = min(payload.get("max_tokens") or 50, 50)
+        with self._lock:
+            overload = max(0, self.in_flight - self.capacity)
+        time.sleep(self.random.uniform(0.5, 1.5) * self.latency * 2 ** min(overload, 5))
+        with self._lock:
+            self.in_flight -= 1
+            self.stats["ok"] += 1
+        return {
+            "id": f"chatcmpl-{self.stats['requests']}", "object": "chat.completion", "created": int(time.time()), "model": payload.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "ok"}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion},
+        }
+
+def make_handler(provider: FakeProvider):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status: int, body: dict, headers: dict = None):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._reply(200, provider.stats)
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not self.path.endswith("/chat/completions"):
+                return self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+            tokens = sum(len(json.dumps(m.get("content", ""))) for m in payload.get("messages", [])) // 4 + (payload.get("max_tokens") or 50)
+            wait = provider.admit(tokens)
+            if wait is not None:
+                return self._reply(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}}, {"Retry-After": f"{wait:.2f}"})
+            self._reply(200, provider.complete(payload))
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+def serve(port: int = 8090, **kwargs) -> ThreadingHTTPServer:
+    """Start the fake provider on a background thread; server.provider holds its counters"""
+    provider = FakeProvider(**kwargs)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(provider))
+    server.provider = provider
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible provider with throttling")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--rpm", type=int, default=60)
+    parser.add_argument("--tpm", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.5, help="mean seconds per call below --capacity concurrent calls")
+    parser.add_argument("--throttle", type=float, default=0.0, help="fraction of admissible calls answered with a 429 anyway")
+    parser.add_argument("--capacity", type=int, default=4)
+    args = parser.parse_args()
+    server = serve(args.port, rpm=args.rpm, tpm=args.tpm, latency=args.latency, throttle=args.throttle, capacity=args.capacity)
+    print(f"Fake provider on http://127.0.0.1:{args.port}/v1 ({args.rpm} req/min, {args.tpm} tokens/min)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
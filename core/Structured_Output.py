@@ -23,6 +23,7 @@ class PlotResponse(BaseModel):
     plot_html: str = Field(..., description="The absolute path where the interactive HTML plot file was saved.")
     plot_image: str = Field(..., description="The absolute path where the static image (PNG) plot file was saved.")
     insight: str = Field(..., description="Business insights derived from the visualization.")
+    reduction_ratio: float = Field(default=1.0, description="The 'reduction_ratio' returned by save_plot: original data points divided by plotted points (1.0 when nothing was downsampled).")
 
 class WebImageWords(BaseModel):
     chosen_words: str = Field(..., description="The two most important words about the excel file like that: (keyword1: detailed explanation in the context, keyword2: detailed explanation in the context)")
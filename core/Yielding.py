@@ -1,5 +1,6 @@
 import time, os
 from core.paths import agent_logs
+from core.events import publish_event
 
 def log_agent_message(message):
     """Write a message to both console and agent logs file"""
@@ -13,6 +14,7 @@ def log_agent_message(message):
             f.write(log_entry)
             f.flush()
             os.fsync(f.fileno())
+        publish_event("log", {"message": f"[{timestamp}] {message}"})
             
         time.sleep(0.1)
     except Exception as e:
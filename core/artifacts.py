@@ -0,0 +1,195 @@
+import os, json, time, hashlib, threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+from core.paths import repo_path, output_path, artifacts_path, output_manifest_path
+from core.events import publish_event
+
+TYPE_BY_DIR = {"plots": "plot", "charts": "chart", "images": "image", "web_images": "web_image", "queries": "query", "tables": "table", "scripts": "script"}
+TYPE_BY_NAME = {
+    "cleaned_excel.xlsx": "cleaned", "report.pdf": "report", "report.tex": "latex", "summary.txt": "summary",
+    "context.json": "context", "context_notes.txt": "context", "review_notes.txt": "context", "workspace.json": "workspace",
+    "media.json": "media", "todo.md": "todo", "text_index.pkl": "index", "column_index.json": "index"
+}
+IGNORED = {"artifacts.json", "manifest.json", "agent_logs.txt"}
+
+def artifact_type(relative: str) -> str:
+    parts = Path(relative).parts
+    if parts[-1] in TYPE_BY_NAME:
+        return TYPE_BY_NAME[parts[-1]]
+    if len(parts) > 1 and parts[0] in TYPE_BY_DIR:
+        return TYPE_BY_DIR[parts[0]]
+    if parts[-1].lower().startswith("data."):
+        return "source"
+    return Path(relative).suffix.lstrip(".").lower() or "file"
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ArtifactRegistry:
+    """Manifest of the files produced under a root folder (path, type, size, hash, producing step, timestamp).
+    Writers register what they produce, readers look artifacts up here instead of scanning directories."""
+    def __init__(self, root: Path, manifest: Path):
+        self.root = Path(root)
+        self.manifest = Path(manifest)
+        self.step = None
+        self._lock = threading.RLock()
+        self._entries = None
+        self._mtime = None
+        self._batching = 0
+        self._dirty = False
+
+    def _load(self) -> Dict[str, Dict]:
+        # Reload only when another writer (or a fresh job) replaced the manifest
+        mtime = self.manifest.stat().st_mtime if self.manifest.exists() else None
+        if self._entries is None or mtime != self._mtime:
+            if mtime is None:
+                self._entries = {}
+            else:
+                try:
+                    with open(self.manifest, "r", encoding="utf-8") as f:
+                        self._entries = {e["path"]: e for e in json.load(f).get("artifacts", [])}
+                except (OSError, ValueError):
+                    self._entries = {}
+            self._mtime = mtime
+        return self._entries
+
+    def _save(self):
+        if self._batching:
+            self._dirty = True
+            return
+        self._dirty = False
+        self.manifest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"root": str(self.root), "artifacts": list(self._entries.values())}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.manifest)
+        self._mtime = self.manifest.stat().st_mtime
+
+    @contextmanager
+    def batch(self):
+        """Group registrations: the manifest is written once, when the outermost batch ends"""
+        with self._lock:
+            self._batching += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batching -= 1
+                if not self._batching and self._dirty:
+                    self._save()
+
+    def _relative(self, path: Union[str, Path]) -> str:
+        path = Path(path)
+        if not path.is_absolute():
+            path = self.root / path
+        return path.resolve().relative_to(self.root.resolve()).as_posix()
+
+    def register(self, path: Union[str, Path], type: Optional[str] = None, step: Optional[str] = None, digest: Optional[str] = None) -> Optional[Dict]:
+        """Record a file that was just written; returns its manifest entry"""
+        absolute = Path(path) if Path(path).is_absolute() else self.root / path
+        if not absolute.is_file() or absolute.name in IGNORED:
+            return None
+        relative = self._relative(absolute)
+        stat = absolute.stat()
+        entry = {
+            "path": relative, "name": absolute.name, "type": type or artifact_type(relative), "size": stat.st_size,
+            "sha256": digest or file_hash(absolute), "step": step or self.step, "created": time.time(), "mtime": stat.st_mtime
+        }
+        with self._lock:
+            self._load()[relative] = entry
+            self._save()
+        self._notify("artifact", entry)
+        if entry["type"] == "todo":
+            self._notify("todo", {"content": absolute.read_text(encoding="utf-8", errors="replace")})
+        return entry
+
+    def _notify(self, type: str, data: Dict):
+        # Dashboards follow the job through the event stream instead of polling the folders
+        publish_event(type, {"root": self.root.name, **data})
+
+    def unregister(self, path: Union[str, Path]):
+        with self._lock:
+            entry = self._load().pop(self._relative(path), None)
+            if entry is not None:
+                self._save()
+        if entry is not None:
+            self._notify("artifact_removed", entry)
+
+    def sync(self, directory: Union[str, Path, None] = None, step: Optional[str] = None) -> List[Dict]:
+        """Register new or modified files under a folder once, e.g. after a generated script wrote its outputs.
+        Files whose size and modification time match their entry are not hashed again."""
+        directory = Path(directory) if directory else self.root
+        if not directory.exists():
+            return []
+        added = []
+        with self._lock, self.batch():
+            entries = self._load()
+            for file in ([directory] if directory.is_file() else directory.rglob("*")):
+                if not file.is_file() or file.name in IGNORED:
+                    continue
+                known = entries.get(self._relative(file))
+                if known is None or known["mtime"] != file.stat().st_mtime or known["size"] != file.stat().st_size:
+                    added.append(self.register(file, step=step))
+            removed = [r for r in entries if not (self.root / r).exists()]
+            for relative in removed:
+                entries.pop(relative)
+            if removed:
+                self._save()
+        return [a for a in added if a]
+
+    def get(self, path: Union[str, Path]) -> Optional[Dict]:
+        with self._lock:
+            return self._load().get(self._relative(path))
+
+    def find(self, type: Optional[str] = None, step: Optional[str] = None, suffixes: Optional[tuple] = None, name: Optional[str] = None) -> List[Dict]:
+        with self._lock:
+            entries = list(self._load().values())
+        return [
+            e for e in entries
+            if (type is None or e["type"] == type) and (step is None or e["step"] == step) and (name is None or e["name"] == name)
+            and (suffixes is None or e["name"].lower().endswith(suffixes))
+        ]
+
+    def latest(self, type: Optional[str] = None, suffixes: Optional[tuple] = None) -> Optional[Dict]:
+        found = self.find(type=type, suffixes=suffixes)
+        return max(found, key=lambda e: e["created"]) if found else None
+
+    def exists(self, type: Optional[str] = None, suffixes: Optional[tuple] = None) -> bool:
+        """True when a registered artifact of that type is still on disk"""
+        return any((self.root / e["path"]).is_file() for e in self.find(type=type, suffixes=suffixes))
+
+    def absolute(self, entry: Dict) -> Path:
+        return self.root / entry["path"]
+
+    def reset(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_registry(root: Path = repo_path, manifest: Path = artifacts_path) -> ArtifactRegistry:
+    with _registries_lock:
+        key = str(manifest)
+        if key not in _registries:
+            _registries[key] = ArtifactRegistry(root, manifest)
+        return _registries[key]
+
+def workspace_registry() -> ArtifactRegistry:
+    return get_registry(repo_path, artifacts_path)
+
+def output_registry() -> ArtifactRegistry:
+    return get_registry(output_path, output_manifest_path)
+
+def register_artifact(path: Union[str, Path], type: Optional[str] = None, step: Optional[str] = None, digest: Optional[str] = None) -> Optional[Dict]:
+    """Register a file written inside the job workspace; files outside it are ignored"""
+    try:
+        return workspace_registry().register(path, type=type, step=step, digest=digest)
+    except (ValueError, OSError):
+        return None
@@ -0,0 +1,156 @@
+import os, re, json, math
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional
+from core.paths import column_index_path, profiler_notes_path
+from core.text_index import normalize_text
+from core.config import COLUMN_TOP_K
+from core.parallel import map_tables
+
+# Task words that point at a kind of column rather than at a column name
+TYPE_HINTS = {
+    "date": ["date", "day", "month", "year", "time", "period", "trend", "monthly", "yearly", "daily", "weekly", "quarter", "evolution", "over"],
+    "number": ["total", "sum", "average", "mean", "amount", "revenue", "sales", "price", "cost", "quantity", "qty", "count", "top", "max", "min", "profit", "margin", "value"],
+    "text": ["name", "client", "customer", "product", "category", "region", "city", "country", "type", "code", "by", "per", "group"],
+}
+NAME_WEIGHT, DESCRIPTION_WEIGHT, SAMPLE_WEIGHT = 3, 2, 1
+_loaded = {}
+
+def _tokens(text: str) -> List[str]:
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text))
+    return re.findall(r"[^\W_]+", normalize_text(text))
+
+def _kind(series: pd.Series) -> str:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "date"
+    if pd.api.types.is_numeric_dtype(series):
+        return "number"
+    return "text"
+
+def profile_column(sheet: str, column, series: pd.Series) -> Dict:
+    non_null = series.dropna()
+    profile = {
+        "sheet": sheet, "column": str(column), "dtype": str(series.dtype), "kind": _kind(series),
+        "rows": int(len(series)), "null_pct": round(100 * (1 - len(non_null) / len(series)), 2) if len(series) else 0.0,
+        "unique": int(non_null.nunique()), "samples": [str(v)[:40] for v in non_null.drop_duplicates().head(3).tolist()]
+    }
+    if profile["kind"] in ("number", "date") and not non_null.empty:
+        profile["min"], profile["max"] = str(non_null.min()), str(non_null.max())
+    return profile
+
+def _profile_table(sheet_name: str, region: Optional[Dict], df: pd.DataFrame) -> List[Dict]:
+    table = [profile_column(sheet_name, col, df[col]) for col in df.columns]
+    if df.attrs.get("sampled"):
+        # Large tables are profiled on their sample: fill rate and samples carry over, the size does not
+        for p in table:
+            p.update(rows=df.attrs["total_rows"], sampled_rows=len(df), approximate=True)
+            if "min" in p:
+                p["sample_min"], p["sample_max"] = p.pop("min"), p.pop("max")
+    return table
+
+def build_column_index(file_path: str, output_path=column_index_path) -> Dict:
+    """Profile every column once (type, fill rate, cardinality, samples) and persist the profiles as the column index.
+    Sheets are profiled in parallel."""
+    profiles = [p for _, table in map_tables(file_path, _profile_table, sample=True, cache="columns") for p in table]
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"file_path": str(file_path), "columns": profiles}, f, indent=2, ensure_ascii=False)
+    _loaded.pop(str(output_path), None)
+    return {"success": True, "columns": len(profiles), "index_path": str(output_path)}
+
+def _descriptions(profiles: List[Dict], notes_path) -> Dict[int, str]:
+    """Attach the profiler-note lines that mention a column to that column"""
+    if not notes_path or not os.path.exists(notes_path):
+        return {}
+    lines = [normalize_text(l) for l in open(notes_path, encoding="utf-8").read().splitlines() if l.strip()]
+    found = {}
+    for i, p in enumerate(profiles):
+        name = normalize_text(p["column"])
+        if len(name) > 1:
+            matches = [l for l in lines if name in l]
+            if matches:
+                found[i] = " ".join(matches)
+    return found
+
+class ColumnIndex:
+    """BM25 ranking of columns against a task, over column names, profiler descriptions and sample values"""
+    def __init__(self, profiles: List[Dict], notes_path=None):
+        self.profiles = profiles
+        descriptions = _descriptions(profiles, notes_path)
+        self.documents = []
+        for i, p in enumerate(profiles):
+            doc = {}
+            for weight, text in ((NAME_WEIGHT, p["column"]), (DESCRIPTION_WEIGHT, descriptions.get(i, "")), (SAMPLE_WEIGHT, " ".join(p["samples"]))):
+                for token in _tokens(text):
+                    doc[token] = doc.get(token, 0) + weight
+            self.documents.append(doc)
+        self.avg_length = sum(sum(d.values()) for d in self.documents) / max(len(self.documents), 1)
+        self.kind_counts = {}
+        for p in profiles:
+            self.kind_counts[p["kind"]] = self.kind_counts.get(p["kind"], 0) + 1
+        self.document_frequency = {}
+        for doc in self.documents:
+            for token in doc:
+                self.document_frequency[token] = self.document_frequency.get(token, 0) + 1
+
+    @classmethod
+    def load(cls, path=column_index_path, notes_path=profiler_notes_path) -> "ColumnIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["columns"], notes_path)
+
+    def _informativeness(self, p: Dict) -> float:
+        """Task-free prior: well-filled columns that vary but are not row identifiers"""
+        if p["unique"] <= 1:
+            return 0.0
+        fill = 1 - p["null_pct"] / 100
+        identifier_penalty = 0.5 if p["kind"] == "text" and p["rows"] and p["unique"] >= 0.95 * p.get("sampled_rows", p["rows"]) else 1.0
+        return 0.1 * fill * identifier_penalty
+
+    def rank(self, task: Optional[str] = None, sheet: Optional[str] = None, k1: float = 1.2, b: float = 0.75) -> List[Dict]:
+        query = _tokens(task) if task else []
+        wanted_kinds = {kind for kind, words in TYPE_HINTS.items() if any(w in query for w in words)}
+        n = len(self.documents)
+        scored = []
+        for p, doc in zip(self.profiles, self.documents):
+            if sheet and p["sheet"] != sheet:
+                continue
+            length = sum(doc.values())
+            score = self._informativeness(p)
+            for token in set(query):
+                tf = doc.get(token, 0)
+                if tf:
+                    idf = math.log(1 + (n - self.document_frequency[token] + 0.5) / (self.document_frequency[token] + 0.5))
+                    score += idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / self.avg_length))
+            if p["kind"] in wanted_kinds:
+                # A hinted kind matters more when few columns have it (the only date column of a wide sheet)
+                score += 0.5 * math.log(1 + n / self.kind_counts[p["kind"]])
+            scored.append(dict(p, score=round(score, 4)))
+        scored.sort(key=lambda c: c["score"], reverse=True)
+        return scored
+
+    def select(self, task: Optional[str] = None, top_k: int = COLUMN_TOP_K, sheet: Optional[str] = None, offset: int = 0) -> List[Dict]:
+        return self.rank(task, sheet)[offset:offset + top_k]
+
+def get_column_index(path=column_index_path, notes_path=profiler_notes_path) -> ColumnIndex:
+    """Return the column index, rebuilt in memory only when the index or the profiler notes change"""
+    notes_mtime = os.path.getmtime(notes_path) if notes_path and os.path.exists(notes_path) else None
+    key = (os.path.getmtime(path), notes_mtime)
+    cached = _loaded.get(str(path))
+    if cached is None or cached[0] != key:
+        cached = (key, ColumnIndex.load(path, notes_path))
+        _loaded[str(path)] = cached
+    return cached[1]
+
+def relevant_columns_summary(task: str, top_k: int = COLUMN_TOP_K) -> str:
+    """Compact one-line-per-column description of the columns that matter for a task, for agent prompts"""
+    if not column_index_path.exists():
+        return ""
+    lines = []
+    for c in get_column_index().select(task, top_k):
+        line = f"- '{c['sheet']}'.'{c['column']}' ({c['dtype']}, {c['null_pct']}% null, {c['unique']} unique) e.g. {c['samples']}"
+        if "min" in c:
+            line += f" range [{c['min']} .. {c['max']}]"
+        elif "sample_min" in c:
+            line += f" sampled range [{c['sample_min']} .. {c['sample_max']}] (not the table's)"
+        lines.append(line)
+    return "\n".join(lines)
@@ -0,0 +1,97 @@
+import os
+
+# Column-relevance trimming: sheets wider than the threshold only expose their top-k columns to the agents
+COLUMN_TOP_K = int(os.getenv("PEAQOCK_COLUMN_TOP_K", "25"))
+COLUMN_TRIM_THRESHOLD = int(os.getenv("PEAQOCK_COLUMN_TRIM_THRESHOLD", "40"))
+
+# Static image export: number of renderer tabs kept alive and how requests are grouped into batches
+RENDER_WORKERS = int(os.getenv("PEAQOCK_RENDER_WORKERS", "2"))
+RENDER_BATCH_SIZE = int(os.getenv("PEAQOCK_RENDER_BATCH_SIZE", "8"))
+RENDER_BATCH_WINDOW = float(os.getenv("PEAQOCK_RENDER_BATCH_WINDOW", "0.05"))
+RENDER_TIMEOUT = float(os.getenv("PEAQOCK_RENDER_TIMEOUT", "120"))
+
+# Plot size bounds: traces above these point counts are downsampled, binned or switched to WebGL
+PLOT_MAX_POINTS = int(os.getenv("PEAQOCK_PLOT_MAX_POINTS", "5000"))
+PLOT_WEBGL_THRESHOLD = int(os.getenv("PEAQOCK_PLOT_WEBGL_THRESHOLD", "10000"))
+PLOT_MAX_MARKERS = int(os.getenv("PEAQOCK_PLOT_MAX_MARKERS", "100000"))
+PLOT_HISTOGRAM_BINS = int(os.getenv("PEAQOCK_PLOT_HISTOGRAM_BINS", "200"))
+PLOT_DOWNSAMPLE_METHOD = os.getenv("PEAQOCK_PLOT_DOWNSAMPLE_METHOD", "lttb")
+
+# Plot HTML files load plotly.js from the API (/assets/, root-relative) instead of embedding the ~3.5 MB bundle, unless a standalone
+# export is asked for (here, through save_plot(standalone=True) or /download/<file>?standalone=true)
+PLOT_STANDALONE = os.getenv("PEAQOCK_PLOT_STANDALONE", "0") == "1"
+
+# Excel reader engine to try first (calamine, openpyxl, xlrd, pyxlsb); by default the fastest installed one is used
+EXCEL_ENGINE = os.getenv("PEAQOCK_EXCEL_ENGINE", "")
+
+# Large-data mode: tables above LARGE_DATA_ROWS are profiled on a stratified sample of SAMPLE_ROWS rows (SAMPLE_BLOCKS
+# evenly spread blocks) with sketch estimates and error bounds. "auto" (default), "on" for every table larger than the sample, "off"
+LARGE_DATA_MODE = os.getenv("PEAQOCK_LARGE_DATA_MODE", "auto")
+LARGE_DATA_ROWS = int(os.getenv("PEAQOCK_LARGE_DATA_ROWS", "500000"))
+SAMPLE_ROWS = int(os.getenv("PEAQOCK_SAMPLE_ROWS", "100000"))
+SAMPLE_BLOCKS = int(os.getenv("PEAQOCK_SAMPLE_BLOCKS", "50"))
+SAMPLE_SEED = int(os.getenv("PEAQOCK_SAMPLE_SEED", "0"))
+
+# Processes used to profile the sheets of a workbook in parallel (0: one per CPU core, 1: no pool)
+PROFILE_WORKERS = int(os.getenv("PEAQOCK_PROFILE_WORKERS", "0"))
+
+# Incremental re-analysis: sheets are fingerprinted by blocks of FINGERPRINT_BLOCK_ROWS rows, results of unchanged sheets are
+# reused from cache/analysis and the outputs of the last ANALYSIS_SNAPSHOTS workbooks are kept to restart from
+INCREMENTAL_ANALYSIS = os.getenv("PEAQOCK_INCREMENTAL_ANALYSIS", "1") == "1"
+FINGERPRINT_BLOCK_ROWS = int(os.getenv("PEAQOCK_FINGERPRINT_BLOCK_ROWS", "1000"))
+ANALYSIS_SNAPSHOTS = int(os.getenv("PEAQOCK_ANALYSIS_SNAPSHOTS", "20"))
+
+# Workbooks whose layout (tables, column labels and types) was seen before reuse the stored profiler notes
+SCHEMA_CACHE = os.getenv("PEAQOCK_SCHEMA_CACHE", "1") == "1"
+
+# The scout, data extraction and delivery stages run as plain Python steps; "1" runs them as the former LLM agents instead
+LLM_TOOL_AGENTS = os.getenv("PEAQOCK_LLM_TOOL_AGENTS", "0") == "1"
+
+# Scripts that completed a cleaner/filter/plot task are kept and replayed for the same task on the same workbook layout
+SCRIPT_LIBRARY = os.getenv("PEAQOCK_SCRIPT_LIBRARY", "1") == "1"
+SCRIPT_REPLAY_TIMEOUT = float(os.getenv("PEAQOCK_SCRIPT_REPLAY_TIMEOUT", "120"))
+
+# Model tiers and routing: each agent gets the tier of its role (PEAQOCK_MODELS="reporter=large,planner=gpt-4.1" sets a tier or a model
+# per agent), moved up for long inputs and down when the run's cost budget (USD, 0: none) or the per-call latency budget (seconds,
+# 0: none) would be exceeded. PEAQOCK_MODEL_BASE_URL points every agent at another OpenAI-compatible server, e.g. a local one.
+MODEL_TIERS = {"small": os.getenv("PEAQOCK_MODEL_SMALL", "gpt-4o-mini"), "medium": os.getenv("PEAQOCK_MODEL_MEDIUM", "gpt-4.1-mini"),
+               "large": os.getenv("PEAQOCK_MODEL_LARGE", "gpt-4o")}
+MODEL_OVERRIDES = dict(item.strip().split("=", 1) for item in os.getenv("PEAQOCK_MODELS", "").split(",") if "=" in item)
+MODEL_BASE_URL = os.getenv("PEAQOCK_MODEL_BASE_URL", "").rstrip("/")
+MODEL_API_KEY = os.getenv("PEAQOCK_MODEL_API_KEY", "")
+MODEL_COST_BUDGET = float(os.getenv("PEAQOCK_MODEL_COST_BUDGET", "0"))
+MODEL_LATENCY_BUDGET = float(os.getenv("PEAQOCK_MODEL_LATENCY_BUDGET", "0"))
+
+# Outbound model calls: requests and tokens per minute (0: unlimited), calls in flight (adapted between 1 and the maximum: halved on a
+# 429 or a call slower than the target latency, raised back one step per round of fast calls), retries of throttled or failed calls,
+# and the delay after which a slow call is sent a second time (0: no hedging). Shared mode enforces the per-minute limits across the
+# processes of the machine through a file in cache/.
+RATE_LIMIT_RPM = int(os.getenv("PEAQOCK_RATE_LIMIT_RPM", "500"))
+RATE_LIMIT_TPM = int(os.getenv("PEAQOCK_RATE_LIMIT_TPM", "450000"))
+RATE_LIMIT_CONCURRENCY = int(os.getenv("PEAQOCK_RATE_LIMIT_CONCURRENCY", "8"))
+RATE_LIMIT_TARGET_LATENCY = float(os.getenv("PEAQOCK_RATE_LIMIT_TARGET_LATENCY", "60"))
+RATE_LIMIT_RETRIES = int(os.getenv("PEAQOCK_RATE_LIMIT_RETRIES", "5"))
+RATE_LIMIT_HEDGE_AFTER = float(os.getenv("PEAQOCK_RATE_LIMIT_HEDGE_AFTER", "0"))
+RATE_LIMIT_SHARED = os.getenv("PEAQOCK_RATE_LIMIT_SHARED", "0") == "1"
+
+# Excel export writer (xlsxwriter or openpyxl, both in streaming mode; by default xlsxwriter when installed) and rows converted per batch
+EXCEL_WRITER = os.getenv("PEAQOCK_EXCEL_WRITER", "")
+EXPORT_CHUNK_ROWS = int(os.getenv("PEAQOCK_EXPORT_CHUNK_ROWS", "10000"))
+
+# Static dashboard files are read and compressed once at startup; set to 1 while editing them to pick up changes
+DASHBOARD_RELOAD = os.getenv("PEAQOCK_DASHBOARD_RELOAD", "0") == "1"
+
+# Report compilation: engine override (tectonic, latexmk, xelatex, pdflatex, lualatex or a full path), timeout and parallel builds
+TEX_ENGINE = os.getenv("PEAQOCK_TEX_ENGINE", "")
+LATEX_TIMEOUT = float(os.getenv("PEAQOCK_LATEX_TIMEOUT", "180"))
+LATEX_WORKERS = int(os.getenv("PEAQOCK_LATEX_WORKERS", "2"))
+
+# Result store retention, enforced by a background sweeper: jobs older than the age limit go first, then the oldest until the store fits
+RESULTS_MAX_AGE_DAYS = float(os.getenv("PEAQOCK_RESULTS_MAX_AGE_DAYS", "7"))
+RESULTS_MAX_BYTES = int(float(os.getenv("PEAQOCK_RESULTS_MAX_GB", "2")) * 1024 ** 3)
+RESULTS_SWEEP_INTERVAL = float(os.getenv("PEAQOCK_RESULTS_SWEEP_INTERVAL", "600"))
+
+# Uploads: size cap (checked before and while streaming), chunk size suggested to resumable clients, and how long abandoned uploads are kept
+UPLOAD_MAX_BYTES = int(float(os.getenv("PEAQOCK_UPLOAD_MAX_MB", "1024")) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = int(float(os.getenv("PEAQOCK_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024)
+UPLOAD_EXPIRY_HOURS = float(os.getenv("PEAQOCK_UPLOAD_EXPIRY_HOURS", "24"))
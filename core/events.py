@@ -0,0 +1,83 @@
+import re, json, time, uuid, asyncio, threading
+from collections import deque
+from typing import Dict, List, Optional
+
+HISTORY_SIZE = 2000
+MAX_JOBS = 20
+
+def new_job_id() -> str:
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+class EventBus:
+    """In-process publish/subscribe for job events (log lines, todo updates, artifacts, job status).
+    Publishers are plain threads (the agents); subscribers are SSE connections, woken on their own event loop.
+    Each job keeps a bounded history so a reconnecting client resumes from its Last-Event-ID."""
+    def __init__(self, history_size: int = HISTORY_SIZE, max_jobs: int = MAX_JOBS):
+        self.history_size = history_size
+        self.max_jobs = max_jobs
+        self.current_job = None
+        self._history = {}
+        self._subscribers = []
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def start_job(self, job_id: Optional[str] = None) -> str:
+        # Client-chosen ids end up as folder names in the result store
+        if not job_id or not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", job_id):
+            job_id = new_job_id()
+        with self._lock:
+            self.current_job = job_id
+            self._history[job_id] = deque(maxlen=self.history_size)
+            while len(self._history) > self.max_jobs:
+                self._history.pop(next(iter(self._history)))
+        self.publish("job", {"status": "started"}, job_id=job_id)
+        return job_id
+
+    def publish(self, type: str, data: Dict, job_id: Optional[str] = None) -> Dict:
+        with self._lock:
+            job_id = job_id or self.current_job
+            event = {"id": self._next_id, "type": type, "job_id": job_id, "time": time.time(), "data": data}
+            self._next_id += 1
+            if job_id in self._history:
+                self._history[job_id].append(event)
+            subscribers = list(self._subscribers)
+        for loop, queue, wanted in subscribers:
+            if wanted is None or wanted == job_id:
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, event)
+                except RuntimeError:
+                    # The subscriber's loop is gone; it is removed when its stream closes
+                    pass
+        return event
+
+    def history(self, job_id: Optional[str] = None, after: int = 0) -> List[Dict]:
+        """Past events of a job (or of the current job) newer than `after`"""
+        with self._lock:
+            events = list(self._history.get(job_id or self.current_job, ()))
+        return [e for e in events if e["id"] > after]
+
+    def subscribe(self, job_id: Optional[str] = None) -> asyncio.Queue:
+        """Queue receiving the events of one job, or of every job when job_id is None; call from the subscriber's loop"""
+        queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.append((asyncio.get_running_loop(), queue, job_id))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s[1] is not queue]
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+def format_sse(event: Dict) -> str:
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+_bus = EventBus()
+
+def get_event_bus() -> EventBus:
+    return _bus
+
+def publish_event(type: str, data: Dict, job_id: Optional[str] = None) -> Dict:
+    return _bus.publish(type, data, job_id)
@@ -0,0 +1,254 @@
+import re, json, zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from core.paths import formula_graph_path
+from core.readers import open_workbook, region_columns
+from core.regions import NS, iterparse, _sheet_paths, column_letter, column_index, get_regions
+
+# A string literal (left alone), a reference (optional sheet, then a cell, a cell range or a whole-column range) or a bare name
+TOKEN = re.compile(
+    r'(?P<string>"(?:[^"]|"")*")'
+    r"|(?<![\w.$])(?:(?P<sheet>'(?:[^']|'')+'|[A-Za-z_][\w.]*)!)?"
+    r"(?P<first>\$?[A-Z]{1,3}\$?\d+|\$?[A-Z]{1,3}(?=:\$?[A-Z]{1,3}(?![\w$])))"
+    r"(?::(?P<last>\$?[A-Z]{1,3}\$?\d+|\$?[A-Z]{1,3}))?(?![\w(!])"
+    r"|(?<![\w.$'])(?P<name>[A-Za-z_\\][\w.]*)(?![\w(!])"
+)
+PART = re.compile(r"(\$?)([A-Z]{1,3})(?:(\$?)(\d+))?")
+# Dependencies spanning more columns are summarized by their range only
+MAX_MAPPED_COLUMNS = 50
+_loaded = {}
+
+def _part(text: str, row: int, col: int) -> Tuple:
+    """'$B7' seen from (row, col) -> (col absolute, col or offset, row absolute, row or offset). Relative parts become
+    offsets, so a formula filled down a column gives the same key on every row. Whole-column parts have row None."""
+    col_abs, letters, row_abs, digits = PART.fullmatch(text).groups()
+    c = column_index(letters) if col_abs else column_index(letters) - col
+    if digits is None:
+        return bool(col_abs), c, True, None
+    return bool(col_abs), c, bool(row_abs), int(digits) if row_abs else int(digits) - row
+
+def _render(part: Tuple, row: int, col: int) -> str:
+    col_abs, c, row_abs, r = part
+    text = ("$" if col_abs else "") + column_letter(c if col_abs else c + col)
+    if r is not None:
+        text += ("$" if row_abs else "") + str(r if row_abs else r + row)
+    return text
+
+def _sheet_name(prefix: Optional[str]) -> Optional[str]:
+    if prefix and prefix.startswith("'"):
+        return prefix[1:-1].replace("''", "'")
+    return prefix
+
+def _defined_names(archive: zipfile.ZipFile) -> Dict[str, Tuple]:
+    """Workbook-level names that point at ranges (TaxRate -> Params!$B$1), as absolute references"""
+    names = {}
+    with archive.open("xl/workbook.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{NS}definedName" and element.text and not element.get("name", "").startswith("_xlnm"):
+                refs = [(_sheet_name(m.group("sheet")), m.group("first"), m.group("last")) for m in TOKEN.finditer(element.text) if m.group("first")]
+                if refs:
+                    names[element.get("name").lower()] = tuple(
+                        (sheet, _absolute(first), _absolute(last) if last else None) for sheet, first, last in refs)
+    return names
+
+def _absolute(text: str) -> Tuple:
+    _, c, _, r = _part(text, 0, 0)
+    return True, c, True, r
+
+def parse_formula(text: str, row: int, col: int, names: Dict[str, Tuple]) -> Tuple[str, Tuple, Tuple]:
+    """Formula at (row, col) -> (template, references, named references). The template has {0}, {1}... in place of the
+    references, each kept as (sheet, first part, last part) in relative form: cells filled from one formula give equal results."""
+    refs, named = [], []
+    def replace(match):
+        if match.group("string"):
+            return match.group("string")
+        if match.group("name"):
+            named.extend(names.get(match.group("name").lower(), ()))
+            return match.group("name")
+        first = _part(match.group("first"), row, col)
+        last = _part(match.group("last"), row, col) if match.group("last") else None
+        refs.append((_sheet_name(match.group("sheet")), first, last))
+        return "{%d}" % (len(refs) - 1)
+    template = TOKEN.sub(replace, text.replace("{", "{{").replace("}", "}}"))
+    return template, tuple(refs), tuple(named)
+
+def render_formula(template: str, refs: Tuple, row: int, col: int) -> str:
+    """The A1 text of a parsed formula as it reads in cell (row, col)"""
+    texts = []
+    for sheet, first, last in refs:
+        text = _render(first, row, col) + (":" + _render(last, row, col) if last else "")
+        if sheet:
+            text = (f"'{sheet}'" if re.search(r"[^\w.]", sheet) else sheet) + "!" + text
+        texts.append(text)
+    return "=" + template.format(*texts)
+
+def scan_formulas(archive: zipfile.ZipFile, part: str, names: Dict[str, Tuple]) -> List[Dict]:
+    """Formula cells of one worksheet, compressed into vertical runs of the same (relative) formula.
+    Shared formulas (Excel's own fill-down encoding) reuse the parse of their anchor cell."""
+    runs, open_runs, shared = [], {}, {}
+    with archive.open(part) as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{NS}c":
+                formula = element.find(f"{NS}f")
+                ref = element.get("r")
+                if formula is not None and ref and formula.get("t") != "dataTable":
+                    letters, digits = re.match(r"([A-Z]+)(\d+)", ref).groups()
+                    row, col = int(digits), column_index(letters)
+                    if formula.text:
+                        parsed = parse_formula(formula.text, row, col, names)
+                        if formula.get("t") == "shared":
+                            shared[formula.get("si")] = parsed
+                    else:
+                        parsed = shared.get(formula.get("si"))
+                    if parsed is not None:
+                        run = open_runs.get(col)
+                        if run and run["key"] == parsed and run["last_row"] == row - 1:
+                            run["last_row"] = row
+                        else:
+                            if run:
+                                runs.append(run)
+                            open_runs[col] = {"col": col, "first_row": row, "last_row": row, "key": parsed}
+                element.clear()
+            elif element.tag == f"{NS}row":
+                element.clear()
+                if hasattr(element, "getprevious"):
+                    while element.getprevious() is not None:
+                        del element.getparent()[0]
+    runs.extend(open_runs.values())
+    return sorted(runs, key=lambda r: (r["col"], r["first_row"]))
+
+def _span(refs: Tuple, run: Dict, sheet: str) -> List[Dict]:
+    """Cells a run reads: each reference widened over the rows of the run"""
+    spans = []
+    for target, first, last in refs:
+        parts = [first, last or first]
+        cols = [c if col_abs else c + run["col"] for col_abs, c, _, _ in parts]
+        if any(r is None for _, _, _, r in parts):
+            rows = None
+        else:
+            starts = [r if row_abs else r + run["first_row"] for _, _, row_abs, r in parts]
+            ends = [r if row_abs else r + run["last_row"] for _, _, row_abs, r in parts]
+            rows = (min(starts), max(ends))
+        spans.append({"sheet": target or sheet, "cols": (min(cols), max(cols)), "rows": rows})
+    return spans
+
+class _ColumnMap:
+    """Cell -> (table label, column label), from the region index and the labels read_tables uses"""
+    def __init__(self, file_path: str):
+        self.index = get_regions(file_path) or {"sheets": {}}
+        self.excel_file = None
+        self.file_path = file_path
+        self._labels = {}
+
+    def tables(self, sheet: str) -> List[Dict]:
+        return self.index["sheets"].get(sheet, {}).get("regions", [])
+
+    def _columns(self, region: Dict) -> Dict[int, str]:
+        key = (region["sheet"], region["range"])
+        if key not in self._labels:
+            self.excel_file = self.excel_file or open_workbook(self.file_path)
+            self._labels[key] = region_columns(self.excel_file, region)
+        return self._labels[key]
+
+    def columns(self, sheet: str, cols: Tuple[int, int], rows: Optional[Tuple[int, int]]) -> List[Tuple[str, str]]:
+        regions = self.tables(sheet)
+        found = []
+        for region in regions:
+            data_start = region["first_row"] + region["header_rows"]
+            if rows and (rows[1] < data_start or rows[0] > region["last_row"]):
+                continue
+            label = sheet if len(regions) == 1 else f"{sheet}!{region['range']}"
+            names = self._columns(region)
+            for col in range(max(cols[0], region["first_col"]), min(cols[1], region["last_col"]) + 1):
+                found.append((label, names.get(col, column_letter(col))))
+        return found
+
+def _label(table: str, column: str) -> str:
+    return f"'{table}'.'{column}'"
+
+def build_formula_graph(file_path: str, output_path=formula_graph_path) -> Dict:
+    """Parse every formula once and save which columns are computed from which (repo/formula_graph.json)"""
+    graph = scan_workbook_formulas(str(file_path))
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(graph, f, indent=2, ensure_ascii=False)
+    _loaded.pop(str(output_path), None)
+    return {"success": True, "formulas": sum(r["cells"] for r in graph["runs"]), "runs": len(graph["runs"]),
+            "derived_columns": len(graph["derived_columns"]), "index_path": str(output_path)}
+
+def scan_workbook_formulas(file_path: str) -> Dict:
+    runs, derived, links = [], {}, {}
+    if not zipfile.is_zipfile(file_path):
+        # xls/xlsb sources reach the agents as a converted, values-only data.xlsx: no formulas to map
+        return {"file_path": file_path, "mtime": Path(file_path).stat().st_mtime, "runs": [], "derived_columns": [], "cross_sheet_links": []}
+    columns = _ColumnMap(file_path)
+    with zipfile.ZipFile(file_path) as archive:
+        names = _defined_names(archive)
+        for sheet, part in _sheet_paths(archive).items():
+            for run in scan_formulas(archive, part, names):
+                template, refs, named = run["key"]
+                spans = _span(refs, run, sheet) + _span(named, run, sheet)
+                depends_on = []
+                for span in spans:
+                    cells = f"{column_letter(span['cols'][0])}{span['rows'][0] if span['rows'] else ''}:{column_letter(span['cols'][1])}{span['rows'][1] if span['rows'] else ''}"
+                    mapped = columns.columns(span["sheet"], span["cols"], span["rows"]) if span["cols"][1] - span["cols"][0] < MAX_MAPPED_COLUMNS else []
+                    depends_on.append({"sheet": span["sheet"], "range": cells, "columns": [_label(*c) for c in mapped]})
+                    if span["sheet"] != sheet:
+                        links[(sheet, span["sheet"])] = links.get((sheet, span["sheet"]), 0) + run["last_row"] - run["first_row"] + 1
+                own = columns.columns(sheet, (run["col"], run["col"]), (run["first_row"], run["last_row"]))
+                entry = {
+                    "sheet": sheet, "range": f"{column_letter(run['col'])}{run['first_row']}:{column_letter(run['col'])}{run['last_row']}",
+                    "formula": render_formula(template, refs, run["first_row"], run["col"]),
+                    "cells": run["last_row"] - run["first_row"] + 1,
+                    "column": _label(*own[0]) if own else None, "depends_on": depends_on
+                }
+                runs.append(entry)
+                if own:
+                    column = derived.setdefault(entry["column"], {"column": entry["column"], "formula": entry["formula"], "cells": 0, "formulas": 0, "derived_from": [], "cross_sheet": False})
+                    column["cells"] += entry["cells"]
+                    column["formulas"] += 1
+                    for dep in depends_on:
+                        for source in dep["columns"] or [f"{dep['sheet']}!{dep['range']}"]:
+                            if source != entry["column"] and source not in column["derived_from"]:
+                                column["derived_from"].append(source)
+                        column["cross_sheet"] |= dep["sheet"] != sheet
+    for column in derived.values():
+        # Several formulas in one column (a mixed or hand-edited column): report the count, the first one stays as the example
+        column["consistent"] = column.pop("formulas") == 1
+    return {
+        "file_path": file_path, "mtime": Path(file_path).stat().st_mtime, "runs": runs,
+        "derived_columns": list(derived.values()),
+        "cross_sheet_links": [{"from": a, "to": b, "cells": n} for (a, b), n in sorted(links.items())]
+    }
+
+def get_formula_graph(path=formula_graph_path) -> Dict:
+    mtime = Path(path).stat().st_mtime
+    cached = _loaded.get(str(path))
+    if cached is None or cached[0] != mtime:
+        with open(path, "r", encoding="utf-8") as f:
+            cached = (mtime, json.load(f))
+        _loaded[str(path)] = cached
+    return cached[1]
+
+def column_dependencies(graph: Dict, column: str) -> Dict:
+    """What a column is computed from and which columns are computed from it; `column` may be 'Col' or 'Table'.'Col'"""
+    wanted = column.strip().lower()
+    matches = lambda label: label.lower() == wanted or label.lower().endswith(f".'{wanted}'")
+    derived = [c for c in graph["derived_columns"] if matches(c["column"])]
+    used_by = [c["column"] for c in graph["derived_columns"] if any(matches(source) for source in c["derived_from"])]
+    return {"column": column, "computed": bool(derived), "derived": derived, "used_by": used_by}
+
+def formula_summary(path=formula_graph_path, limit: int = 20) -> str:
+    """One line per computed column for agent prompts"""
+    if not Path(path).exists():
+        return ""
+    graph = get_formula_graph(path)
+    lines = []
+    for c in graph["derived_columns"][:limit]:
+        sources = ", ".join(c["derived_from"][:6]) + (" ..." if len(c["derived_from"]) > 6 else "")
+        lines.append(f"- {c['column']} {c['formula']} ({c['cells']} cells{'' if c['consistent'] else ', several formulas'}) <- {sources or 'constants only'}")
+    if len(graph["derived_columns"]) > limit:
+        lines.append(f"- ... {len(graph['derived_columns']) - limit} more, see get_formula_dependencies")
+    for link in graph["cross_sheet_links"]:
+        lines.append(f"- '{link['from']}' reads from '{link['to']}' ({link['cells']} formula cells)")
+    return "\n".join(lines)
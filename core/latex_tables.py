@@ -0,0 +1,122 @@
+import re
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional
+from core.paths import repo_path, latex_tables_path
+from core.readers import read_sheet
+
+ACCENTS = {
+    'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e',
+    'à': 'a', 'á': 'a', 'â': 'a', 'ä': 'a',
+    'ù': 'u', 'ú': 'u', 'û': 'u', 'ü': 'u',
+    'ì': 'i', 'í': 'i', 'î': 'i', 'ï': 'i',
+    'ò': 'o', 'ó': 'o', 'ô': 'o', 'ö': 'o',
+    'ç': 'c', 'ñ': 'n',
+    'É': 'E', 'È': 'E', 'Ê': 'E', 'Ë': 'E',
+    'À': 'A', 'Á': 'A', 'Â': 'A', 'Ä': 'A',
+    'Ù': 'U', 'Ú': 'U', 'Û': 'U', 'Ü': 'U',
+    'Ì': 'I', 'Í': 'I', 'Î': 'I', 'Ï': 'I',
+    'Ò': 'O', 'Ó': 'O', 'Ô': 'O', 'Ö': 'O',
+    'Ç': 'C', 'Ñ': 'N',
+}
+SPECIALS = {
+    '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#',
+    '_': r'\_', '{': r'\{', '}': r'\}', '~': r'\textasciitilde{}',
+    '^': r'\^{}', '\\': r'\textbackslash{}', '€': r'\euro{}'
+}
+# Accent folding and special-character escaping in a single str.translate pass
+ESCAPE_TABLE = str.maketrans({**ACCENTS, **SPECIALS})
+
+def escape_text(text: str) -> str:
+    return str(text).replace('N°', 'Num').translate(ESCAPE_TABLE)
+
+def escape_series(series: pd.Series) -> pd.Series:
+    """Escape a whole column at once"""
+    return series.astype(str).str.replace('N°', 'Num', regex=False).str.translate(ESCAPE_TABLE)
+
+def _format_column(series: pd.Series, decimals: int) -> pd.Series:
+    if pd.api.types.is_bool_dtype(series):
+        formatted = series.map({True: "Yes", False: "No"})
+    elif pd.api.types.is_integer_dtype(series):
+        formatted = series.map("{:,}".format)
+    elif pd.api.types.is_float_dtype(series):
+        formatted = series.map(f"{{:,.{decimals}f}}".format)
+    elif pd.api.types.is_datetime64_any_dtype(series):
+        formatted = series.dt.strftime("%Y-%m-%d")
+    else:
+        formatted = series
+    return escape_series(formatted).where(series.notna(), "")
+
+def _column_spec(series: pd.Series, width: Optional[float]) -> str:
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return "r"
+    if width:
+        return f"p{{{width:.2f}\\linewidth}}"
+    return "l"
+
+def _parse_range(cell_range: str) -> Dict:
+    """'B3:F200' -> read_excel arguments (header taken from the first row of the range)"""
+    match = re.fullmatch(r"([A-Za-z]+)(\d+):([A-Za-z]+)(\d+)", cell_range.strip())
+    if not match:
+        raise ValueError(f"Invalid cell range '{cell_range}', expected something like 'A1:F200'")
+    first_col, first_row, last_col, last_row = match.groups()
+    return {"usecols": f"{first_col.upper()}:{last_col.upper()}", "skiprows": int(first_row) - 1, "nrows": int(last_row) - int(first_row)}
+
+def load_table(source: str, sheet: Optional[str] = None, cell_range: Optional[str] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    path = Path(source) if Path(source).is_absolute() else repo_path / source
+    if path.suffix.lower() == ".csv":
+        df = pd.read_csv(path)
+    else:
+        df = read_sheet(path, sheet_name=sheet or 0, **(_parse_range(cell_range) if cell_range else {}))
+    if columns:
+        missing = [c for c in columns if c not in df.columns]
+        if missing:
+            raise ValueError(f"Columns not found: {missing}. Available: {list(df.columns)}")
+        df = df[columns]
+    return df
+
+def dataframe_to_longtable(df: pd.DataFrame, caption: str = "", label: str = "", max_rows: int = 200, max_columns: int = 8, decimals: int = 2) -> str:
+    """Escaped longtable LaTeX for a DataFrame.
+    longtable breaks rows across pages and repeats the header; sheets wider than max_columns are split into several tables."""
+    total_rows = len(df)
+    shown = df.head(max_rows)
+    body = pd.DataFrame({col: _format_column(shown[col], decimals) for col in shown.columns}, index=shown.index)
+    headers = escape_series(pd.Series([str(c) for c in df.columns], dtype=object)).tolist()
+
+    parts = []
+    for start in range(0, max(len(df.columns), 1), max_columns):
+        block = list(range(start, min(start + max_columns, len(df.columns))))
+        text_columns = [i for i in block if _column_spec(df.iloc[:, i], None) == "l"]
+        # Text columns share what the numeric ones leave, so long labels wrap instead of overflowing the page
+        width = max(0.12, (0.95 - 0.1 * (len(block) - len(text_columns))) / len(text_columns)) if len(block) > 4 and text_columns else None
+        spec = "".join(_column_spec(df.iloc[:, i], width) for i in block)
+        header = " & ".join(f"\\textbf{{{headers[i]}}}" for i in block) + r" \\"
+        rows = body.iloc[:, block].agg(" & ".join, axis=1) + r" \\" if len(body) else pd.Series([], dtype=object)
+        suffix = f" (columns {start + 1}--{block[-1] + 1})" if len(df.columns) > max_columns else ""
+        lines = [f"\\begin{{longtable}}{{{spec}}}"]
+        if caption:
+            lines.append(f"\\caption{{{escape_text(caption)}{suffix}}}" + (f"\\label{{{label}-{start // max_columns}}}" if label else "") + r" \\")
+        lines += [r"\toprule", header, r"\midrule", r"\endfirsthead",
+                  r"\toprule", header, r"\midrule", r"\endhead",
+                  r"\midrule", f"\\multicolumn{{{len(block)}}}{{r}}{{\\textit{{Continued on next page}}}} \\\\", r"\endfoot",
+                  r"\bottomrule", r"\endlastfoot"]
+        lines += rows.tolist()
+        if total_rows > max_rows:
+            lines.append(f"\\multicolumn{{{len(block)}}}{{l}}{{\\textit{{{total_rows - max_rows:,} more rows not shown ({total_rows:,} in total)}}}} \\\\")
+        lines.append(r"\end{longtable}")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts) + "\n"
+
+def render_table_fragment(source: str, name: str, sheet: Optional[str] = None, cell_range: Optional[str] = None, columns: Optional[List[str]] = None,
+                          caption: str = "", max_rows: int = 200, max_columns: int = 8, decimals: int = 2) -> Dict:
+    """Write tables/<name>.tex next to the report and return the \\input line that includes it"""
+    df = load_table(source, sheet, cell_range, columns)
+    safe_name = re.sub(r"[^A-Za-z0-9_-]+", "_", name).strip("_") or "table"
+    latex_tables_path.mkdir(parents=True, exist_ok=True)
+    fragment = latex_tables_path / f"{safe_name}.tex"
+    fragment.write_text(dataframe_to_longtable(df, caption, f"tab:{safe_name}", max_rows, max_columns, decimals), encoding="utf-8")
+    return {
+        "success": True, "name": safe_name, "fragment_path": str(fragment),
+        "latex": f"\\input{{{fragment.relative_to(repo_path).as_posix()}}}",
+        "rows": len(df), "rows_shown": min(len(df), max_rows), "columns": len(df.columns)
+    }
@@ -0,0 +1,201 @@
+import time, json, threading
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+import httpx
+from core.config import MODEL_TIERS, MODEL_OVERRIDES, MODEL_BASE_URL, MODEL_COST_BUDGET, MODEL_LATENCY_BUDGET
+from core.events import publish_event
+from core.rate_limit import RateLimitedTransport, rate_limiter
+
+TIERS = ["small", "medium", "large"]
+# Tier each agent starts from: the mechanical stages (routing, scouting, extraction, review, delivery) on the small model,
+# the code-writing agents on the medium one, the analysis and the report on the large one
+ROLE_TIERS = {
+    "data_extractor": "small", "scout": "small", "orchestrator": "small", "preprocessing_reviewer": "small", "delivery": "small",
+    "planner": "medium", "cleaner": "medium", "filter": "medium", "plot": "medium", "summary": "medium", "vision": "medium",
+    "profiler": "large", "analyst": "large", "workspace": "large", "reporter": "large",
+}
+# Prompt size (tokens) above which a tier is passed over for the next one: small models lose track of long contexts first
+ESCALATE_TOKENS = {"small": 24000, "medium": 96000}
+# USD per million input and output tokens; models not listed (local servers) are free
+PRICES = {
+    "gpt-4o": (2.5, 10.0), "gpt-4o-mini": (0.15, 0.6), "gpt-4.1": (2.0, 8.0), "gpt-4.1-mini": (0.4, 1.6), "gpt-4.1-nano": (0.1, 0.4),
+    "o4-mini": (1.1, 4.4), "o3": (2.0, 8.0),
+}
+# Completion size assumed when estimating the cost of a call before it is made
+EXPECTED_OUTPUT_TOKENS = 1000
+# Weight of the newest call in the moving average of a model's latency
+LATENCY_SMOOTHING = 0.3
+
+def estimate_tokens(texts: Sequence[str] = (), files: Sequence[Path] = ()) -> int:
+    """Rough prompt size: about four characters per token for the instructions and the text files the agent will read"""
+    chars = sum(len(t or "") for t in texts)
+    chars += sum(Path(f).stat().st_size for f in files if f and Path(f).is_file())
+    return chars // 4
+
+class ModelRouter:
+    """Picks the model of each agent call from its role, the size of its input and what is left of the run's cost and
+    latency budgets, and records every pick and every call (tokens, latency, cost) in the run trace.
+    Jobs may run at the same time: spend and trace are kept per job, the job of a call being the one started on the
+    calling thread (agents carry it in a header, so calls made from other threads are still attributed)."""
+    def __init__(self, tiers: Dict[str, str] = MODEL_TIERS, overrides: Dict[str, str] = MODEL_OVERRIDES, base_url: str = MODEL_BASE_URL,
+                 cost_budget: float = MODEL_COST_BUDGET, latency_budget: float = MODEL_LATENCY_BUDGET):
+        self.tiers = tiers
+        self.overrides = overrides
+        self.base_url = base_url
+        self.cost_budget = cost_budget
+        self.latency_budget = latency_budget
+        # Latency averages outlive a run, they are what the next run's picks are based on
+        self.latency = {}
+        self._runs = {}
+        self._local = threading.local()
+        self._client = None
+        self._lock = threading.Lock()
+
+    def start_run(self, job_id: str):
+        with self._lock:
+            self._runs[job_id] = {"spent": 0.0, "trace": []}
+        self._local.job_id = job_id
+
+    def finish_run(self, job_id: str):
+        with self._lock:
+            self._runs.pop(job_id, None)
+        if self.current_job() == job_id:
+            self._local.job_id = None
+
+    def current_job(self) -> Optional[str]:
+        return getattr(self._local, "job_id", None)
+
+    def price(self, model: str) -> tuple:
+        if self.base_url:
+            return (0.0, 0.0)
+        # Dated snapshots (gpt-4o-2024-08-06) cost what their model costs
+        return next((PRICES[name] for name in sorted(PRICES, key=len, reverse=True) if model.startswith(name)), (0.0, 0.0))
+
+    def estimated_cost(self, model: str, tokens: int) -> float:
+        price_in, price_out = self.price(model)
+        return (tokens * price_in + EXPECTED_OUTPUT_TOKENS * price_out) / 1e6
+
+    def pick(self, role: str, tokens: int = 0, job_id: Optional[str] = None) -> Dict:
+        """Model for one agent: a configured model is used as is; otherwise the role's tier, moved up when the input is
+        too long for it, then down while the call would overrun the remaining cost budget or the tier's observed
+        latency is above the latency budget"""
+        job_id = job_id or self.current_job()
+        override = self.overrides.get(role)
+        reasons = []
+        if override and override not in TIERS:
+            tier, model = None, override
+            reasons.append("configured")
+        else:
+            tier = override or ROLE_TIERS.get(role, "large")
+            reasons.append("configured tier" if override else "role")
+            while tier in ESCALATE_TOKENS and tokens > ESCALATE_TOKENS[tier]:
+                tier = TIERS[TIERS.index(tier) + 1]
+                reasons.append(f"input of ~{tokens} tokens")
+            with self._lock:
+                spent = self._runs.get(job_id, {}).get("spent", 0.0)
+                remaining = self.cost_budget - spent if self.cost_budget > 0 else None
+                while tier != TIERS[0]:
+                    lower = TIERS[TIERS.index(tier) - 1]
+                    if remaining is not None and self.estimated_cost(self.tiers[tier], tokens) > remaining:
+                        reason = f"cost budget (${max(remaining, 0):.4f} left)"
+                    elif self.latency_budget > 0 and self.latency.get(self.tiers[tier], 0) > self.latency_budget and \
+                            self.latency.get(self.tiers[lower], 0) < self.latency[self.tiers[tier]]:
+                        reason = f"latency ({self.latency[self.tiers[tier]]:.1f}s observed)"
+                    else:
+                        break
+                    if reason != reasons[-1]:
+                        reasons.append(reason)
+                    tier = lower
+            model = self.tiers[tier]
+        choice = {"type": "pick", "time": time.time(), "agent": role, "tier": tier, "model": model, "input_tokens": tokens,
+                  "estimated_cost": round(self.estimated_cost(model, tokens), 6), "reasons": reasons}
+        if self.base_url:
+            choice["base_url"] = self.base_url
+        self._record(choice, job_id)
+        return choice
+
+    def observe(self, model: str, seconds: float, usage: Optional[Dict] = None, agent: Optional[str] = None, status: int = 200,
+                job_id: Optional[str] = None):
+        """Record one model call: latency feeds the moving average of the model, usage the cost spent in the run"""
+        usage = usage or {}
+        prompt, completion = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        price_in, price_out = self.price(model)
+        cost = (prompt * price_in + completion * price_out) / 1e6
+        job_id = job_id or self.current_job()
+        with self._lock:
+            previous = self.latency.get(model)
+            self.latency[model] = seconds if previous is None else (1 - LATENCY_SMOOTHING) * previous + LATENCY_SMOOTHING * seconds
+            if job_id in self._runs:
+                self._runs[job_id]["spent"] += cost
+        self._record({"type": "call", "time": time.time(), "agent": agent, "model": model, "status": status, "seconds": round(seconds, 3),
+                      "prompt_tokens": prompt, "completion_tokens": completion, "cost": round(cost, 6)}, job_id)
+
+    def _record(self, entry: Dict, job_id: Optional[str]):
+        with self._lock:
+            if job_id in self._runs:
+                self._runs[job_id]["trace"].append(entry)
+        publish_event("model", entry, job_id=job_id)
+
+    def _on_request(self, request: httpx.Request):
+        request.extensions["peaqock_started"] = time.perf_counter()
+
+    def _on_response(self, response: httpx.Response):
+        started = response.request.extensions.get("peaqock_started")
+        if started is None or not response.request.url.path.endswith("/chat/completions"):
+            return
+        seconds = time.perf_counter() - started
+        try:
+            body = json.loads(response.request.content or b"{}")
+            response.read()
+            usage = response.json().get("usage") if response.status_code == 200 else None
+        except (ValueError, httpx.HTTPError):
+            body, usage = {}, None
+        headers = response.request.headers
+        self.observe(body.get("model", "?"), seconds, usage, agent=headers.get("x-peaqock-agent"), status=response.status_code,
+                     job_id=headers.get("x-peaqock-job") or None)
+
+    def http_client(self) -> httpx.Client:
+        """Client shared by the agents' models and the image analysis: its transport goes through the rate limiter
+        (which also owns the retries), its hooks time every completion and read its token usage"""
+        if self._client is None:
+            self._client = httpx.Client(transport=RateLimitedTransport(rate_limiter()), timeout=httpx.Timeout(600, connect=10),
+                                        event_hooks={"request": [self._on_request], "response": [self._on_response]})
+        return self._client
+
+    def headers(self, role: str) -> Dict[str, str]:
+        """Headers tying a call to its agent and job in the trace"""
+        return {"x-peaqock-agent": role, "x-peaqock-job": self.current_job() or ""}
+
+    def summary(self, job_id: Optional[str] = None) -> Dict:
+        job_id = job_id or self.current_job()
+        with self._lock:
+            trace = list(self._runs.get(job_id, {}).get("trace", []))
+        calls = [e for e in trace if e["type"] == "call"]
+        picks = [e for e in trace if e["type"] == "pick"]
+        by_model = {}
+        for c in calls:
+            m = by_model.setdefault(c["model"], {"calls": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0})
+            m["calls"] += 1
+            for key in ("seconds", "prompt_tokens", "completion_tokens", "cost"):
+                m[key] += c[key]
+        return {"job_id": job_id, "agents": [{k: p[k] for k in ("agent", "tier", "model", "reasons")} for p in picks],
+                "models": by_model, "cost": round(sum(m["cost"] for m in by_model.values()), 6), "cost_budget": self.cost_budget or None,
+                "rate_limit": rate_limiter().snapshot()}
+
+    def save_trace(self, path: Path, job_id: Optional[str] = None) -> Path:
+        job_id = job_id or self.current_job()
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            trace = list(self._runs.get(job_id, {}).get("trace", []))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(job_id), "trace": trace}, f, indent=2, ensure_ascii=False)
+        return path
+
+_router = None
+
+def model_router() -> ModelRouter:
+    global _router
+    if _router is None:
+        _router = ModelRouter()
+    return _router
@@ -0,0 +1,96 @@
+import os, atexit, hashlib, threading, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from core.config import PROFILE_WORKERS, INCREMENTAL_ANALYSIS, LARGE_DATA_MODE, LARGE_DATA_ROWS, SAMPLE_ROWS, SAMPLE_BLOCKS, SAMPLE_SEED
+from core.readers import open_workbook, read_tables
+from core.regions import get_regions
+from core.revisions import get_fingerprint, analysis_cache
+
+_workbooks = {}
+_pool, _pool_workers = None, 0
+_pool_lock = threading.Lock()
+
+def _sheet_job(file_path: str, sheet_name: str, func: Callable, sample: bool) -> List[Tuple[str, object]]:
+    # Workers outlive a call: one open workbook per worker, reused for every sheet it gets until the file changes
+    stat = os.stat(file_path)
+    key = (file_path, stat.st_mtime_ns, stat.st_size)
+    if key not in _workbooks:
+        _workbooks.clear()
+        # The worker loads the region index itself (the saved one, else scanned once and kept for the next calls)
+        get_regions(file_path)
+        _workbooks[key] = open_workbook(file_path)
+    return [(label, func(label, region, df)) for label, region, df in read_tables(_workbooks[key], sample=sample, sheets=[sheet_name])]
+
+def _sheet_weights(file_path: str, sheet_names: List[str]) -> Dict[str, int]:
+    """Filled cells per sheet from the region index, to start the largest sheets first"""
+    index = get_regions(file_path)
+    if index is None:
+        return {name: 0 for name in sheet_names}
+    return {name: index["sheets"].get(name, {}).get("filled_cells", 0) for name in sheet_names}
+
+def _shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """Process pool shared by every call, created on first use. Workers are started from a forkserver (spawned on
+    Windows), never forked: the API process runs other threads, and a fork can copy a lock one of them holds."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is not None and _pool_workers != workers:
+            _shutdown_pool()
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+            _pool_workers = workers
+        return _pool
+
+atexit.register(_shutdown_pool)
+
+def pool_size(tasks: int, workers: Optional[int] = None) -> int:
+    workers = workers if workers is not None else PROFILE_WORKERS
+    return max(1, min(workers or os.cpu_count() or 1, tasks))
+
+def _cache_key(name: str, sample: bool) -> str:
+    # Sampled results also depend on the sampling settings
+    settings = (LARGE_DATA_MODE, LARGE_DATA_ROWS, SAMPLE_ROWS, SAMPLE_BLOCKS, SAMPLE_SEED) if sample else ()
+    return f"{name}-{hashlib.sha256(repr((sample, settings)).encode()).hexdigest()[:16]}"
+
+def map_tables(file_path: str, func: Callable, sample: bool = False, workers: Optional[int] = None, cache: Optional[str] = None) -> List[Tuple[str, object]]:
+    """(label, func(label, region, df)) for every table of the workbook, one sheet per task on a process pool.
+    func must be a module-level function (it is pickled to the workers) and return something picklable.
+    Results come back in workbook order whatever order the sheets finish in, so reports built from them are stable.
+    With a cache name, the results of a sheet are stored under its content digest and sheets seen before (in this
+    workbook or an earlier revision of it) are not read again."""
+    file_path = str(file_path)
+    excel_file = open_workbook(file_path)
+    sheet_names = excel_file.sheet_names
+    results, digests = {}, {}
+    if cache and INCREMENTAL_ANALYSIS:
+        key = _cache_key(cache, sample)
+        # The sheet name is part of the key: it is in the table labels and in the results
+        digests = {name: hashlib.sha256(f"{name}\x00{sheet['digest']}".encode("utf-8")).hexdigest()
+                   for name, sheet in get_fingerprint(file_path)["sheets"].items()}
+        for name in sheet_names:
+            cached = analysis_cache().table_result(key, digests[name]) if name in digests else None
+            if cached is not None:
+                results[name] = cached
+    pending = [name for name in sheet_names if name not in results]
+    size = pool_size(len(pending), workers)
+    if size == 1:
+        for name in pending:
+            results[name] = [(label, func(label, region, df)) for label, region, df in read_tables(excel_file, sample=sample, sheets=[name])]
+    elif pending:
+        weights = _sheet_weights(file_path, pending)
+        # Sized for the configured workers rather than this call's sheets, so calls keep sharing one pool
+        pool = get_pool(max(1, (workers if workers is not None else PROFILE_WORKERS) or os.cpu_count() or 1))
+        futures = {name: pool.submit(_sheet_job, file_path, name, func, sample)
+                   for name in sorted(pending, key=lambda n: -weights[n])}
+        for name, future in futures.items():
+            results[name] = future.result()
+    for name in pending:
+        if name in digests:
+            analysis_cache().store_table_result(key, digests[name], results[name])
+    return [item for name in sheet_names for item in results[name]]
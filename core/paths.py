@@ -4,6 +4,17 @@ BASE_DIR = Path(__file__).parent.parent
 repo_path = BASE_DIR / "repo"
 todo = repo_path / "todo.md"
 output_path = BASE_DIR / "output"
+static_path = BASE_DIR / "static"
+cache_path = BASE_DIR / "cache"
+render_cache_path = cache_path / "renders"
+latex_cache_path = cache_path / "latex"
+upload_cache_path = cache_path / "uploads"
+analysis_cache_path = cache_path / "analysis"
+schema_cache_path = cache_path / "schemas"
+script_library_path = cache_path / "scripts"
+rate_limit_path = cache_path / "rate_limit.json"
+output_manifest_path = output_path / "manifest.json"
+results_path = BASE_DIR / "results"
 images_path = repo_path / "images"
 charts_path = repo_path / "charts"
 excel_path = repo_path / "data.xlsx"
@@ -18,8 +29,14 @@ context_path = repo_path / "context.json"
 media_json_path = repo_path / "media.json"
 filter_output_path = repo_path / "queries"
 workspace_path = repo_path / "workspace.json"
+artifacts_path = repo_path / "artifacts.json"
 latex_output_path = repo_path / "latex_outputs"
+latex_tables_path = repo_path / "tables"
 cleaned_excel = repo_path / "cleaned_excel.xlsx"
 review_notes_path = repo_path / "review_notes.txt"
 profiler_notes_path = repo_path / "context_notes.txt"
+text_index_path = repo_path / "text_index.pkl"
+column_index_path = repo_path / "column_index.json"
+region_index_path = repo_path / "region_index.json"
+formula_graph_path = repo_path / "formula_graph.json"
 tectonic_path = Path(r"C:\tectonic\tectonic.exe")
\ No newline at end of file
@@ -0,0 +1,54 @@
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+from core.tools import ExcelParserTool, scout_workbook
+from core.artifacts import workspace_registry
+from core.Structured_Output import DeliveryResponse
+from core.paths import cleaned_excel, summary_path, report_path, plot_output_path, queries_path
+
+# What each agent delivers, and the query words that ask for it, in the priority the delivery agent was given
+DELIVERABLES = {"reporter": report_path, "plot": plot_output_path / "plot.html", "cleaner": cleaned_excel, "summary": summary_path, "filter": queries_path}
+KEYWORDS = {
+    "reporter": ("report", "pdf", "rapport"),
+    "plot": ("plot", "chart", "graph", "visuali", "courbe", "graphique"),
+    "cleaner": ("clean", "nettoy"),
+    "summary": ("summar", "résum", "resum"),
+    "filter": ("filter", "top ", "aggregat", "group", "query", "filtr"),
+}
+PLOTS_URL = "http://localhost:8001"
+
+def extract_media(file_path: str) -> Dict:
+    """The data extractor's work without the model round-trips: charts then images are extracted, analysed and saved
+    to media.json, in the order the agent was told to follow"""
+    parser = ExcelParserTool()
+    charts = parser.extract_and_analyze_charts(file_path)
+    images = parser.extract_and_analyze_images(file_path)
+    return {
+        "charts": charts.get("charts_found", charts.get("total_charts", 0)), "images": images.get("images_found", images.get("total_images", 0)),
+        "errors": [r["error"] for r in (charts, images) if r.get("error")]
+    }
+
+def run_scout(file_path: str, output_path: str) -> str:
+    return scout_workbook(str(file_path), str(output_path))
+
+def _available(agent: str) -> Optional[Path]:
+    path = DELIVERABLES[agent]
+    if agent == "plot" and not path.is_file():
+        # Plot scripts may name their file; take the last registered plot page
+        latest = workspace_registry().latest(type="plot", suffixes=(".html",))
+        path = workspace_registry().absolute(latest) if latest else path
+    if agent == "filter":
+        return path if path.is_dir() and any(p.is_file() for p in path.rglob("*")) else None
+    return path if path.is_file() else None
+
+def choose_deliverable(query: str, completed: List[str]) -> DeliveryResponse:
+    """The file or folder to publish for a query: the report whenever one was asked for and produced, otherwise the
+    output of the last agent that succeeded, otherwise what the query words point to"""
+    text = (query or "").lower()
+    asked = [agent for agent, words in KEYWORDS.items() if any(w in text for w in words)]
+    candidates = (["reporter"] if "reporter" in asked else []) + [a for a in reversed(completed) if a in DELIVERABLES] + asked + list(DELIVERABLES)
+    for agent in candidates:
+        path = _available(agent)
+        if path is not None:
+            return DeliveryResponse(status="success", chosen_path=str(path), clickable_link=PLOTS_URL if agent == "plot" else "")
+    return DeliveryResponse(status="failure", chosen_path=str(summary_path))
@@ -0,0 +1,173 @@
+import re, json
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from pathlib import Path
+from typing import Dict, Union
+from core.renderer import export_image
+from core.artifacts import register_artifact
+from core.config import (
+    PLOT_MAX_POINTS, PLOT_WEBGL_THRESHOLD, PLOT_MAX_MARKERS, PLOT_HISTOGRAM_BINS, PLOT_DOWNSAMPLE_METHOD,
+    PLOT_STANDALONE)
+
+# Script tag of a plot HTML that loads the shared plotly.js asset instead of embedding it
+PLOTLYJS_REFERENCE = re.compile(r'<script charset="utf-8" src="[^"]*/assets/plotly-[\w.]+\.min\.js"></script>')
+# Per-point trace properties that have to follow the points kept by a downsampler
+POINT_KEYS = ("x", "y", "text", "hovertext", "customdata", "ids")
+MARKER_POINT_KEYS = ("color", "size", "symbol", "opacity")
+
+def _as_numeric(values, n: int) -> np.ndarray:
+    """Numeric view of an axis for the downsampling geometry (dates as ns, categories as positions)"""
+    if values is None:
+        return np.arange(n, dtype=float)
+    arr = np.asarray(values)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype("datetime64[ns]").astype(np.int64).astype(float)
+    if np.issubdtype(arr.dtype, np.number):
+        return arr.astype(float)
+    try:
+        return pd.to_datetime(arr).asi8.astype(float)
+    except (ValueError, TypeError):
+        return np.arange(n, dtype=float)
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: keeps the visual shape of a line with n_out points"""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - avg_x) * (by - y[a]) - (x[a] - bx) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Keep the minimum and maximum of each bucket, so spikes survive the reduction"""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    buckets = n_out // 2
+    size = n // buckets
+    body = y[:buckets * size].reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    idx = np.concatenate([offsets + np.argmin(body, axis=1), offsets + np.argmax(body, axis=1), [0, n - 1]])
+    return np.unique(idx)
+
+def _sample_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Uniform sample of a point cloud that always keeps the extreme points"""
+    rng = np.random.default_rng(0)
+    extremes = [np.argmin(x), np.argmax(x), np.argmin(y), np.argmax(y)]
+    sample = rng.choice(len(x), size=n_out - len(extremes), replace=False)
+    return np.unique(np.concatenate([sample, extremes]))
+
+def _take(trace: Dict, idx: np.ndarray, n: int) -> Dict:
+    def pick(value):
+        if isinstance(value, (list, tuple, np.ndarray, pd.Series, pd.Index)) and len(value) == n:
+            return np.asarray(value)[idx]
+        return value
+    trace = dict(trace)
+    for key in POINT_KEYS:
+        if key in trace:
+            trace[key] = pick(trace[key])
+    if isinstance(trace.get("marker"), dict):
+        trace["marker"] = {k: (pick(v) if k in MARKER_POINT_KEYS else v) for k, v in trace["marker"].items()}
+    return trace
+
+def _bin_histogram(trace: Dict, bins: int) -> Dict:
+    """Replace a raw-value histogram by the bar chart of its precomputed bins"""
+    values = np.asarray(trace["x"], dtype=float)
+    values = values[np.isfinite(values)]
+    counts, edges = np.histogram(values, bins=trace.get("nbinsx") or bins)
+    bar = {k: v for k, v in trace.items() if k in ("name", "marker", "opacity", "legendgroup", "showlegend", "xaxis", "yaxis", "offsetgroup")}
+    bar.update(type="bar", x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), hovertemplate="[%{customdata[0]:.4g}, %{customdata[1]:.4g}): %{y}<extra></extra>",
+               customdata=np.column_stack([edges[:-1], edges[1:]]))
+    return bar
+
+def optimize_figure(fig: go.Figure, max_points: int = PLOT_MAX_POINTS, webgl_threshold: int = PLOT_WEBGL_THRESHOLD, max_markers: int = PLOT_MAX_MARKERS,
+                    method: str = PLOT_DOWNSAMPLE_METHOD, histogram_bins: int = PLOT_HISTOGRAM_BINS):
+    """Bound the size of a figure: downsample long lines, bin raw histograms and move big point clouds to WebGL.
+    Returns the optimized figure and the reduction statistics."""
+    traces, report = [], []
+    for trace in fig.data:
+        data = trace.to_plotly_json()
+        kind = data.get("type", "scatter")
+        n = max((len(data[k]) for k in ("x", "y") if data.get(k) is not None and hasattr(data[k], "__len__")), default=0)
+        action = None
+        if kind == "histogram" and data.get("x") is not None and data.get("y") is None and n > max_points and not data.get("histfunc") and not data.get("histnorm"):
+            try:
+                data, action = _bin_histogram(data, histogram_bins), "binned"
+            except (ValueError, TypeError):
+                pass
+        elif kind in ("scatter", "scattergl") and data.get("y") is not None and n > 0:
+            x, y = _as_numeric(data.get("x"), n), _as_numeric(data["y"], n)
+            mode = data.get("mode") or "lines"
+            if "lines" in mode and n > max_points:
+                idx = minmax_indices(y, max_points) if method == "minmax" else lttb_indices(x, y, max_points)
+                data, action = _take(data, idx, n), method
+            elif "lines" not in mode and n > max_markers:
+                data, action = _take(data, _sample_indices(x, y, max_markers), n), "sampled"
+            kept = len(data["y"])
+            if kind == "scatter" and kept > webgl_threshold:
+                data["type"] = "scattergl"
+                action = f"{action}+webgl" if action else "webgl"
+        kept = max((len(data[k]) for k in ("x", "y") if data.get(k) is not None and hasattr(data[k], "__len__")), default=0)
+        report.append({"name": data.get("name"), "type": kind, "original_points": n, "rendered_points": kept, "action": action})
+        traces.append(data if action else trace)
+
+    # skip_invalid drops the few scatter-only properties WebGL traces do not support
+    optimized = go.Figure(data=traces, layout=fig.layout, skip_invalid=True)
+    original = sum(t["original_points"] for t in report)
+    rendered = sum(t["rendered_points"] for t in report)
+    stats = {"original_points": original, "rendered_points": rendered, "reduction_ratio": round(original / rendered, 2) if rendered else 1.0, "traces": report}
+    return optimized, stats
+
+def plotlyjs_bundle() -> str:
+    from plotly.offline import get_plotlyjs
+    return get_plotlyjs()
+
+def plotlyjs_filename() -> str:
+    """Versioned file name, so the asset can be cached forever and a plotly upgrade changes the URL"""
+    from plotly.offline import get_plotlyjs_version
+    return f"plotly-{get_plotlyjs_version()}.min.js"
+
+def plotlyjs_url() -> str:
+    """Root-relative, so plots load the asset from whichever host and port (or proxy path) served them"""
+    return f"/assets/{plotlyjs_filename()}"
+
+def inline_plotlyjs(html: str) -> str:
+    """Turn a plot HTML that references the shared plotly.js asset into a standalone file"""
+    # Also matches the absolute URLs older plot files were written with
+    reference = PLOTLYJS_REFERENCE.search(html)
+    if reference is None:
+        return html
+    return html[:reference.start()] + f'<script type="text/javascript">{plotlyjs_bundle()}</script>' + html[reference.end():]
+
+def save_plot(fig: go.Figure, output_dir: Union[str, Path], name: str = "plot", image: bool = True, optimize: bool = True, standalone: bool = PLOT_STANDALONE) -> Dict:
+    """Write <name>.html, <name>.json and <name>.png for a figure after bounding its size.
+    The HTML references the shared plotly.js asset served by the API unless standalone is set.
+    The reduction statistics are saved to <name>.stats.json and returned."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if optimize:
+        fig, stats = optimize_figure(fig)
+    else:
+        stats = {"original_points": None, "rendered_points": None, "reduction_ratio": 1.0, "traces": []}
+    paths = {"html": output_dir / f"{name}.html", "json": output_dir / f"{name}.json", "png": output_dir / f"{name}.png"}
+    fig.write_html(paths["html"], include_plotlyjs=True if standalone else plotlyjs_url())
+    fig.write_json(paths["json"])
+    if image:
+        export_image(fig, paths["png"])
+    stats["files"] = {k: str(v) for k, v in paths.items() if k != "png" or image}
+    with open(output_dir / f"{name}.stats.json", "w", encoding="utf-8") as f:
+        json.dump(stats, f, indent=2)
+    for path in stats["files"].values():
+        register_artifact(path, type="plot")
+    return stats
@@ -0,0 +1,275 @@
+import json, time, random, threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager, nullcontext
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional
+import httpx
+from core.config import (RATE_LIMIT_RPM, RATE_LIMIT_TPM, RATE_LIMIT_CONCURRENCY, RATE_LIMIT_TARGET_LATENCY,
+                         RATE_LIMIT_RETRIES, RATE_LIMIT_HEDGE_AFTER, RATE_LIMIT_SHARED)
+from core.paths import rate_limit_path
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Statuses worth another attempt: throttling and transient provider errors
+RETRY_STATUS = {429, 500, 502, 503, 504}
+THROTTLE_STATUS = {429, 503}
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Burst allowed above the steady rate, in seconds of rate: providers count over a sliding minute, so a full minute's
+# burst on top of the refill would let twice the limit through
+BURST_SECONDS = 6
+# Prompt tokens counted for an image part (a base64 payload is not its token count) and for a completion without max_tokens
+IMAGE_TOKENS = 1000
+DEFAULT_COMPLETION_TOKENS = 1000
+
+@contextmanager
+def _file_lock(path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(".lock"), "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class TokenBucket:
+    """per_minute units a minute, with bursts of BURST_SECONDS worth. take() reserves units and returns how long to
+    wait before using them; the level goes negative under load, which queues later callers behind earlier ones.
+    With a shared path the level lives in a file, so every process of the machine draws from the same bucket."""
+    def __init__(self, name: str, per_minute: float, shared_path: Optional[Path] = None):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.capacity = self.rate * BURST_SECONDS
+        self.path = Path(shared_path) if shared_path else None
+        self.level, self.updated = self.capacity, time.time()
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def take(self, amount: float) -> float:
+        with self._lock, (_file_lock(self.path) if self.path else nullcontext()):
+            state = self._load() if self.path else {}
+            level, updated = state.get(self.name, (self.level, self.updated))
+            now = time.time()
+            self.level = min(self.capacity, level + (now - updated) * self.rate) - amount
+            self.updated = now
+            if self.path:
+                state[self.name] = (self.level, now)
+                with open(self.path, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+            return max(0.0, -self.level / self.rate)
+
+class AdaptiveConcurrency:
+    """AIMD limit on the calls in flight: raised by one per limit's worth of fast calls (about one per round), halved on
+    a throttled, failed or slower-than-target call. Calls that were in flight together see the same congestion, so
+    the limit is halved at most once per call duration."""
+    def __init__(self, maximum: int, target_latency: float, minimum: int = 1):
+        self.maximum, self.minimum = max(maximum, minimum), minimum
+        self.target_latency = target_latency
+        self.limit = float(max(minimum, self.maximum // 2))
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, congested: bool, seconds: float):
+        with self._condition:
+            self.in_flight -= 1
+            now = time.time()
+            if congested or seconds > self.target_latency:
+                if now - self._last_decrease >= seconds:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+def request_tokens(body: bytes) -> int:
+    """Tokens a chat completion will count against the per-minute limit: prompt (about four characters a token, a flat
+    count per image) plus the completion it may produce"""
+    try:
+        payload = json.loads(body or b"{}")
+    except ValueError:
+        return len(body or b"") // 4
+    chars, images = len(json.dumps(payload.get("tools", ""))), 0
+    for message in payload.get("messages", []):
+        content = message.get("content") or ""
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                chars += len(part.get("text", ""))
+            else:
+                images += 1
+    completion = payload.get("max_completion_tokens") or payload.get("max_tokens") or DEFAULT_COMPLETION_TOKENS
+    return chars // 4 + images * IMAGE_TOKENS + completion
+
+def retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after-ms")
+    if value:
+        return float(value) / 1000
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter, so throttled callers do not come back in step"""
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+class RateLimiter:
+    """Process-wide gate for outbound model calls: a request bucket, a token bucket and the adaptive concurrency limit"""
+    def __init__(self, rpm: int = RATE_LIMIT_RPM, tpm: int = RATE_LIMIT_TPM, concurrency: int = RATE_LIMIT_CONCURRENCY,
+                 target_latency: float = RATE_LIMIT_TARGET_LATENCY, shared: bool = RATE_LIMIT_SHARED, shared_path: Path = rate_limit_path):
+        path = shared_path if shared else None
+        self.requests = TokenBucket("requests", rpm, path) if rpm > 0 else None
+        self.tokens = TokenBucket("tokens", tpm, path) if tpm > 0 else None
+        self.concurrency = AdaptiveConcurrency(concurrency, target_latency)
+        self.stats = {"calls": 0, "throttled": 0, "retries": 0, "hedged": 0, "waited": 0.0}
+        self._lock = threading.Lock()
+
+    def _count(self, key: str, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    @contextmanager
+    def slot(self, tokens: int):
+        """Wait for a concurrency slot and for the buckets to cover the call. Set outcome["status"] and, once known,
+        outcome["tokens"] (tokens actually used, which settles the estimate) before leaving the block."""
+        self.concurrency.acquire()
+        outcome = {"status": None, "tokens": None}
+        try:
+            delay = max(self.requests.take(1) if self.requests else 0.0, self.tokens.take(tokens) if self.tokens else 0.0)
+            if delay > 0:
+                self._count("waited", delay)
+                time.sleep(delay)
+        except BaseException:
+            self.concurrency.release(False, 0.0)
+            raise
+        started = time.time()
+        try:
+            yield outcome
+        finally:
+            seconds = time.time() - started
+            self._count("calls")
+            if outcome["status"] in THROTTLE_STATUS:
+                self._count("throttled")
+            if self.tokens and outcome["tokens"] is not None:
+                self.tokens.take(outcome["tokens"] - tokens)
+            self.concurrency.release(outcome["status"] is None or outcome["status"] in THROTTLE_STATUS, seconds)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats, waited=round(self.stats["waited"], 2))
+        return {**stats, "limit": int(self.concurrency.limit), "in_flight": self.concurrency.in_flight}
+
+def _discard(future):
+    if future.exception() is None:
+        future.result().close()
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """httpx transport putting every request through the rate limiter. Throttled or failed attempts are retried after
+    the provider's Retry-After or a jittered backoff; with hedge_after set, a call still running after that delay
+    (jittered) is sent once more and the first good answer wins."""
+    def __init__(self, limiter: "RateLimiter" = None, transport: Optional[httpx.BaseTransport] = None,
+                 retries: int = RATE_LIMIT_RETRIES, hedge_after: float = RATE_LIMIT_HEDGE_AFTER):
+        self.limiter = limiter or rate_limiter()
+        self.transport = transport or httpx.HTTPTransport()
+        self.retries = retries
+        self.hedge_after = hedge_after
+        self._pool = ThreadPoolExecutor(max_workers=2 * self.limiter.concurrency.maximum, thread_name_prefix="hedge") if hedge_after > 0 else None
+
+    def _attempt(self, request: httpx.Request, tokens: int) -> httpx.Response:
+        with self.limiter.slot(tokens) as outcome:
+            response = self.transport.handle_request(request)
+            outcome["status"] = response.status_code
+            if response.status_code == 200 and response.headers.get("content-type", "").startswith("application/json"):
+                response.read()
+                usage = response.json().get("usage") or {}
+                outcome["tokens"] = usage.get("total_tokens")
+            return response
+
+    def _send(self, request: httpx.Request, tokens: int) -> httpx.Response:
+        if self._pool is None:
+            return self._attempt(request, tokens)
+        primary = self._pool.submit(self._attempt, request, tokens)
+        done, _ = wait([primary], timeout=self.hedge_after * random.uniform(1.0, 1.5))
+        if done:
+            return primary.result()
+        self.limiter._count("hedged")
+        pending, last = {primary, self._pool.submit(self._attempt, request, tokens)}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().status_code not in RETRY_STATUS:
+                    for other in pending:
+                        other.add_done_callback(_discard)
+                    return future.result()
+                if last is not None:
+                    _discard(last)
+                last = future
+        # Neither copy got a good answer: hand the error or the retryable response to the retry loop
+        return last.result()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        tokens = request_tokens(request.content) if request.method == "POST" else 0
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._send(request, tokens)
+            except httpx.TransportError:
+                if attempt == self.retries:
+                    raise
+                delay = backoff(attempt)
+            else:
+                if response.status_code not in RETRY_STATUS or attempt == self.retries:
+                    return response
+                delay = retry_after(response)
+                delay = backoff(attempt) if delay is None else delay + random.uniform(0, BACKOFF_BASE)
+                response.close()
+            self.limiter._count("retries")
+            time.sleep(delay)
+
+    def close(self):
+        if self._pool:
+            self._pool.shutdown(wait=False)
+        self.transport.close()
+
+_limiter = None
+
+def rate_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
@@ -0,0 +1,144 @@
+import zipfile, importlib.util
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from core.config import EXCEL_ENGINE
+from core.regions import get_regions, region_read_args, column_letter
+from core.writers import write_excel
+from core.sampling import is_large, read_sample
+
+# Fastest first: calamine is Rust-backed and reads every Excel format; the others are the pure-Python fallbacks
+ENGINES = {
+    "xlsx": ["calamine", "openpyxl"],
+    "xlsm": ["calamine", "openpyxl"],
+    "xlsb": ["calamine", "pyxlsb"],
+    "xls": ["calamine", "xlrd"],
+    "ods": ["calamine", "odf"],
+}
+ENGINE_MODULES = {"calamine": "python_calamine", "openpyxl": "openpyxl", "pyxlsb": "pyxlsb", "xlrd": "xlrd", "odf": "odf"}
+OLE_SIGNATURE = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+_available = {}
+
+class UnsupportedWorkbook(ValueError):
+    pass
+
+def engine_available(engine: str) -> bool:
+    if engine not in _available:
+        _available[engine] = importlib.util.find_spec(ENGINE_MODULES[engine]) is not None
+    return _available[engine]
+
+def detect_format(file_path: Union[str, Path]) -> str:
+    """Real format of a workbook from its content (xlsx, xlsm, xlsb, xls or ods), whatever its extension says"""
+    with open(file_path, "rb") as f:
+        head = f.read(8)
+    if head.startswith(OLE_SIGNATURE):
+        return "xls"
+    if head.startswith(b"PK"):
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                names = set(archive.namelist())
+                if "xl/workbook.bin" in names:
+                    return "xlsb"
+                if "xl/workbook.xml" in names:
+                    return "xlsm" if "xl/vbaProject.bin" in names else "xlsx"
+                if "content.xml" in names and archive.read("mimetype").startswith(b"application/vnd.oasis.opendocument.spreadsheet"):
+                    return "ods"
+        except (zipfile.BadZipFile, KeyError):
+            pass
+    raise UnsupportedWorkbook(f"{Path(file_path).name} is not an Excel workbook (xlsx, xlsm, xlsb, xls or ods)")
+
+def engines_for(file_path: Union[str, Path]) -> List[str]:
+    """Installed engines able to read the file, fastest first (PEAQOCK_EXCEL_ENGINE moves one to the front)"""
+    candidates = list(ENGINES[detect_format(file_path)])
+    if EXCEL_ENGINE in candidates:
+        candidates.remove(EXCEL_ENGINE)
+        candidates.insert(0, EXCEL_ENGINE)
+    available = [e for e in candidates if engine_available(e)]
+    if not available:
+        raise UnsupportedWorkbook(f"No reader installed for {Path(file_path).name}: install python-calamine or one of {candidates}")
+    return available
+
+def open_workbook(file_path: Union[str, Path], engine: Optional[str] = None) -> pd.ExcelFile:
+    """pd.ExcelFile on the fastest engine that can open the file; read_excel calls on it reuse that engine"""
+    errors = []
+    for candidate in [engine] if engine else engines_for(file_path):
+        try:
+            return pd.ExcelFile(file_path, engine=candidate)
+        except Exception as e:
+            errors.append(f"{candidate}: {e}")
+    raise UnsupportedWorkbook(f"Could not open {Path(file_path).name} ({'; '.join(errors)})")
+
+def read_sheet(source: Union[str, Path, pd.ExcelFile], sheet_name: Union[str, int] = 0, **kwargs) -> pd.DataFrame:
+    """Drop-in for pd.read_excel that goes through the fastest engine"""
+    excel_file = source if isinstance(source, pd.ExcelFile) else open_workbook(source)
+    return pd.read_excel(excel_file, sheet_name=sheet_name, **kwargs)
+
+def read_workbook(source: Union[str, Path, pd.ExcelFile], **kwargs) -> Dict[str, pd.DataFrame]:
+    excel_file = source if isinstance(source, pd.ExcelFile) else open_workbook(source)
+    return {name: pd.read_excel(excel_file, sheet_name=name, **kwargs) for name in excel_file.sheet_names}
+
+def _header_labels(rows: pd.DataFrame) -> List[str]:
+    """Header rows under merged group cells -> 'Group - sub' labels (a merged cell only holds its value in its first column)"""
+    labels = []
+    groups = rows.iloc[:-1].T.ffill().fillna("") if len(rows) > 1 else pd.DataFrame(index=rows.columns)
+    for col in rows.columns:
+        parts = [str(v).strip() for v in groups.loc[col]] + ["" if pd.isna(rows.iloc[-1][col]) else str(rows.iloc[-1][col]).strip()]
+        labels.append(" - ".join(p for p in parts if p) or f"column_{len(labels)}")
+    return labels
+
+def read_region(source: Union[str, Path, pd.ExcelFile], region: Dict, **kwargs) -> pd.DataFrame:
+    """Load one table region (see core.regions) and nothing around it"""
+    excel_file = source if isinstance(source, pd.ExcelFile) else open_workbook(source)
+    df = pd.read_excel(excel_file, **region_read_args(region), **kwargs)
+    if region["header_rows"] == 0:
+        df.columns = [column_letter(region["first_col"] + i) for i in range(len(df.columns))]
+    elif region["header_rows"] > 1:
+        header_rows = region["header_rows"]
+        labels = _header_labels(df.iloc[:header_rows])
+        df = df.iloc[header_rows:].reset_index(drop=True).infer_objects()
+        df.columns = labels
+    df.attrs.update(sheet=region["sheet"], range=region["range"], title=region.get("title"), first_data_row=region["first_row"] + region["header_rows"])
+    return df
+
+def region_columns(source: Union[str, Path, pd.ExcelFile], region: Dict) -> Dict[int, str]:
+    """Column number -> the label read_tables gives that column, reading the header rows only"""
+    if region["header_rows"] == 0:
+        return {region["first_col"] + i: column_letter(region["first_col"] + i) for i in range(region["last_col"] - region["first_col"] + 1)}
+    header_only = {**region, "last_row": region["first_row"] + region["header_rows"] - 1}
+    df = read_region(source, header_only)
+    return {region["first_col"] + i: str(label) for i, label in enumerate(df.columns)}
+
+def read_tables(source: Union[str, Path, pd.ExcelFile], sample: bool = False, sheets: Optional[List[str]] = None, **kwargs) -> Iterator[Tuple[str, Optional[Dict], pd.DataFrame]]:
+    """(label, region, frame) for every table of the workbook, reading only the detected regions instead of the
+    formatted range. The label is the sheet name, or 'Sheet!B4:H20' when a sheet holds several tables.
+    Formats without a region index (xls, xlsb, ods) fall back to one frame per sheet with region None.
+    sample=True reads the tables above the large-data threshold as a stratified sample (attrs["sampled"] is set).
+    sheets restricts the read to some sheets."""
+    excel_file = source if isinstance(source, pd.ExcelFile) else open_workbook(source)
+    index = get_regions(excel_file.io) if isinstance(excel_file.io, (str, Path)) else None
+    for sheet_name in excel_file.sheet_names:
+        if sheets is not None and sheet_name not in sheets:
+            continue
+        regions = index["sheets"].get(sheet_name, {}).get("regions") if index else None
+        if not regions:
+            yield sheet_name, None, pd.read_excel(excel_file, sheet_name=sheet_name, **kwargs)
+            continue
+        for region in regions:
+            label = sheet_name if len(regions) == 1 else f"{sheet_name}!{region['range']}"
+            if sample and is_large(region):
+                yield label, region, read_sample(excel_file.io, region, region_columns(excel_file, region))
+            else:
+                yield label, region, read_region(excel_file, region, **kwargs)
+
+def normalize_workbook(file_path: Union[str, Path]) -> Dict:
+    """Keep an uploaded workbook under its real extension and make sure an .xlsx copy exists at file_path.
+    The agents, their generated scripts and the openpyxl/Spire tools all expect data.xlsx, so other formats
+    are kept as data.<format> and converted once (cell values only)."""
+    file_path = Path(file_path)
+    fmt = detect_format(file_path)
+    if fmt in ("xlsx", "xlsm"):
+        return {"format": fmt, "path": str(file_path), "source": str(file_path), "converted": False}
+    source = file_path.with_suffix(f".{fmt}")
+    file_path.replace(source)
+    write_excel(file_path, read_workbook(source))
+    return {"format": fmt, "path": str(file_path), "source": str(source), "converted": True}
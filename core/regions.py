@@ -0,0 +1,364 @@
+import re, json, math, zipfile, posixpath
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from xml.sax.saxutils import unescape
+from core.paths import region_index_path
+
+try:
+    from lxml.etree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+CELL_REF = re.compile(r"([A-Z]+)(\d+)")
+# Cell types that hold text (shared string, inline string, formula string)
+TEXT_KINDS = {"s", "inlineStr", "str"}
+# Worksheets are scanned as bytes: an XML parser costs several microseconds per cell, a regex a fraction of that
+READ_SIZE = 1 << 22
+ROW_TAG = re.compile(rb'<row\b[^>]*?\br="(\d+)"')
+CELL = re.compile(rb'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+CELL_ATTR_REF = re.compile(rb'\br="([A-Z]+)\d+"')
+CELL_TYPE = re.compile(rb'\bt="(\w+)"')
+VALUE = re.compile(rb'<v>(.*?)</v>', re.S)
+INLINE_TEXT = re.compile(rb'<t[^>]*>(.*?)</t>', re.S)
+MERGE_CELL = re.compile(rb'<mergeCell\b[^>]*?\bref="([A-Z0-9:]+)"')
+DIMENSION = re.compile(rb'<dimension\b[^>]*?\bref="([^"]+)"')
+
+def column_letter(index: int) -> str:
+    letters = ""
+    while index:
+        index, rest = divmod(index - 1, 26)
+        letters = chr(65 + rest) + letters
+    return letters
+
+def column_index(letters: str) -> int:
+    index = 0
+    for char in letters:
+        index = index * 26 + ord(char) - 64
+    return index
+
+def _ref(ref: str) -> Tuple[int, int]:
+    letters, digits = CELL_REF.match(ref).groups()
+    return int(digits), column_index(letters)
+
+def _sheet_paths(archive: zipfile.ZipFile) -> Dict[str, str]:
+    """Sheet name -> worksheet XML part, from workbook.xml and its relationships"""
+    targets = {}
+    with archive.open("xl/_rels/workbook.xml.rels") as f:
+        for _, rel in iterparse(f):
+            if rel.tag.endswith("Relationship"):
+                target = rel.get("Target")
+                targets[rel.get("Id")] = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+    sheets = {}
+    with archive.open("xl/workbook.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{NS}sheet":
+                sheets[element.get("name")] = targets.get(element.get(f"{REL_NS}id"))
+    return {name: path for name, path in sheets.items() if path in archive.namelist()}
+
+class RowReader:
+    """Rows of a decompressed worksheet stream read as raw bytes: a row is only located by its <row r="N"> marker and cut
+    out, never parsed, so skipping rows costs a byte search. Also keeps what comes before and after sheetData
+    (dimension, merged ranges)."""
+    def __init__(self, stream):
+        self.stream, self.buf, self.pos, self.eof = stream, b"", 0, False
+        self.head = None
+
+    def _more(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.stream.read(READ_SIZE)
+        self.eof = not chunk
+        self.buf, self.pos = self.buf[self.pos:] + chunk, 0
+        return bool(chunk)
+
+    def rows(self, plan: Optional[List[Tuple[int, int]]] = None) -> Iterator[Tuple[int, bytes]]:
+        """(row number, row XML) of the non-empty rows, or only of those inside the (sorted) row ranges of a plan.
+        Rows before a planned block are skipped by searching for the block's first row marker."""
+        plan = plan or [(1, math.inf)]
+        b, last_row = 0, 0
+        while b < len(plan):
+            start, end = plan[b]
+            buf = self.buf
+            i = buf.find(b"<row", self.pos)
+            tag_end = buf.find(b">", i) if i >= 0 else -1
+            if tag_end < 0:
+                if not self._more():
+                    break
+                continue
+            if self.head is None:
+                self.head = buf[:i]
+            if buf[i + 4:i + 5] not in (b" ", b">", b"/"):
+                self.pos = i + 4
+                continue
+            match = ROW_TAG.match(buf, i)
+            # Rows may omit their number; they then follow the previous one
+            row = int(match.group(1)) if match else last_row + 1
+            if row > end:
+                b += 1
+                continue
+            if row < start and match:
+                jump = buf.find(b'<row r="%d"' % start, i)
+                if jump >= 0:
+                    self.pos = jump
+                    continue
+                last = buf.rfind(b"<row ", i)
+                last_match = ROW_TAG.match(buf, last)
+                if last_match and int(last_match.group(1)) < start:
+                    # The whole buffer is before the block: keep only its last (possibly partial) row
+                    self.pos = last
+                    if not self._more():
+                        break
+                    continue
+            if buf[tag_end - 1:tag_end] == b"/":
+                self.pos, last_row = tag_end + 1, row
+                continue
+            close = buf.find(b"</row>", tag_end)
+            if close < 0:
+                if not self._more():
+                    break
+                continue
+            self.pos, last_row = close + 6, row
+            if row >= start:
+                yield row, buf[i:close + 6]
+
+    def rest(self) -> bytes:
+        """Everything after the rows read so far (the sheet's tail, with the merged ranges)"""
+        tail = [self.buf[self.pos:]]
+        while not self.eof:
+            self._more()
+            tail.append(self.buf)
+            self.buf, self.pos = b"", 0
+        return b"".join(tail)
+
+def row_cells(row_xml: bytes) -> Iterator[Tuple[int, bytes, bytes]]:
+    """(column number, cell attributes, cell content) of the cells of a row that hold something"""
+    col = 0
+    for match in CELL.finditer(row_xml, row_xml.find(b">") + 1):
+        attributes, inner = match.group(1), match.group(2)
+        ref = CELL_ATTR_REF.search(attributes)
+        # Cells may omit their reference; they then follow the previous cell
+        col = column_index(ref.group(1).decode()) if ref else col + 1
+        if inner:
+            yield col, attributes, inner
+
+def unescape_xml(raw: bytes) -> str:
+    return unescape(raw.decode("utf-8"), {"&quot;": '"', "&apos;": "'"})
+
+def scan_sheet(archive: zipfile.ZipFile, part: str) -> Dict:
+    """One streaming pass over a worksheet: the cells that hold a value (style-only cells are skipped), the merged ranges
+    and the declared dimension. Memory follows the number of filled cells, not the formatted range."""
+    rows, merges = {}, []
+    with archive.open(part) as f:
+        reader = RowReader(f)
+        for row, row_xml in reader.rows():
+            cells = []
+            for col, attributes, inner in row_cells(row_xml):
+                kind = CELL_TYPE.search(attributes)
+                kind = kind.group(1).decode() if kind else "n"
+                if kind == "inlineStr":
+                    text = "".join(unescape_xml(t) for t in INLINE_TEXT.findall(inner))
+                else:
+                    value = VALUE.search(inner)
+                    # A formula saved without its cached result still belongs to the table
+                    if value is None and b"<f" not in inner:
+                        continue
+                    text = unescape_xml(value.group(1)) if value is not None else None
+                cells.append((col, kind, text))
+            if cells:
+                rows[row] = cells
+        tail = reader.rest()
+        for ref in MERGE_CELL.findall(tail):
+            first, _, last = ref.decode().partition(":")
+            merges.append((*_ref(first), *_ref(last or first)))
+    dimension = DIMENSION.search(reader.head if reader.head is not None else tail)
+    return {"rows": rows, "merges": merges, "dimension": dimension.group(1).decode() if dimension else None}
+
+def _shared_strings(archive: zipfile.ZipFile, wanted: set) -> Dict[int, str]:
+    """Only the shared strings that are needed (titles and headers), stopping once the last one is read"""
+    found = {}
+    if not wanted or "xl/sharedStrings.xml" not in archive.namelist():
+        return found
+    last, index = max(wanted), 0
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{NS}si":
+                if index in wanted:
+                    found[index] = "".join(t.text or "" for t in element.iter(f"{NS}t"))
+                index += 1
+                element.clear()
+                if index > last:
+                    break
+    return found
+
+def _split(values: List[int]) -> List[Tuple[int, int]]:
+    """Consecutive runs in a sorted list of row or column numbers"""
+    runs = []
+    for value in values:
+        if runs and value == runs[-1][1] + 1:
+            runs[-1][1] = value
+        else:
+            runs.append([value, value])
+    return [tuple(r) for r in runs]
+
+def _is_text_row(cells: List[Tuple], width: int) -> bool:
+    return bool(cells) and all(kind in TEXT_KINDS for _, kind, _ in cells) and len(cells) >= max(1, width // 2)
+
+def detect_regions(sheet: str, scan: Dict) -> List[Dict]:
+    """Table regions of a sheet: blocks of filled cells separated by blank rows or columns, with their title lines and header rows"""
+    rows, merges = scan["rows"], scan["merges"]
+    regions = []
+    for top, bottom in _split(sorted(rows)):
+        block_cols = sorted({col for r in range(top, bottom + 1) for col, _, _ in rows.get(r, ())})
+        for left, right in _split(block_cols):
+            region_rows = [(r, [c for c in rows.get(r, ()) if left <= c[0] <= right]) for r in range(top, bottom + 1)]
+            region_rows = [(r, cells) for r, cells in region_rows if cells]
+            if not region_rows:
+                continue
+            width = right - left + 1
+            title = []
+            # Title lines: a lone cell (often merged across the table) above the header
+            while len(region_rows) > 2 and width > 2 and len(region_rows[0][1]) == 1:
+                title.append(region_rows.pop(0))
+            first_row = region_rows[0][0]
+            header_rows = 0
+            if len(region_rows) > 1 and _is_text_row(region_rows[0][1], width):
+                header_rows = 1
+                merged_header = any(m[0] == first_row and m[3] > m[1] for m in merges if left <= m[1] <= right)
+                if merged_header and len(region_rows) > 2 and _is_text_row(region_rows[1][1], width):
+                    header_rows = 2
+            regions.append({
+                "sheet": sheet, "range": f"{column_letter(left)}{first_row}:{column_letter(right)}{region_rows[-1][0]}",
+                "first_row": first_row, "last_row": region_rows[-1][0], "first_col": left, "last_col": right,
+                "header_rows": header_rows, "data_rows": region_rows[-1][0] - first_row + 1 - header_rows,
+                "cells": sum(len(cells) for _, cells in region_rows),
+                "_title": [cells[0] for _, cells in title], "_header": [c for _, cells in region_rows[:header_rows] for c in cells],
+                "_cells": [c for _, cells in region_rows for c in cells] if len(region_rows) < 3 else []
+            })
+    return _merge_continuations(regions)
+
+def _merge_continuations(regions: List[Dict]) -> List[Dict]:
+    """A headerless block right under a table with the same columns is the same table cut by a blank row;
+    one or two short rows just under it and inside its columns are its totals, kept apart from the data"""
+    merged = []
+    for region in regions:
+        tables = [r for r in merged if r["header_rows"] and r["first_col"] <= region["first_col"] and region["last_col"] <= r["last_col"]
+                  and 0 < region["first_row"] - r["last_row"] <= 3]
+        if region["header_rows"] == 0 and region["last_row"] - region["first_row"] < 2 and tables:
+            tables[-1].setdefault("footer", []).append(region["range"])
+            continue
+        previous = merged[-1] if merged else None
+        if (previous and region["header_rows"] == 0 and not region["_title"] and previous["sheet"] == region["sheet"]
+                and (previous["first_col"], previous["last_col"]) == (region["first_col"], region["last_col"])):
+            previous.update(last_row=region["last_row"], cells=previous["cells"] + region["cells"],
+                            data_rows=region["last_row"] - previous["first_row"] + 1 - previous["header_rows"],
+                            range=f"{previous['range'].split(':')[0]}:{column_letter(previous['last_col'])}{region['last_row']}")
+        else:
+            merged.append(region)
+    return merged
+
+def _attach_notes(regions: List[Dict], min_cells: int) -> List[Dict]:
+    """Stray cells are not tables: a lone text cell just above a table (a title block cut off by a blank row) becomes
+    that table's title, other notes are dropped. A sheet with nothing but notes keeps its first one."""
+    tables, notes = [], []
+    for region in regions:
+        if region["cells"] >= min_cells and region["data_rows"] > 0:
+            tables.append(region)
+        else:
+            notes.append(region)
+    for table in tables:
+        above = [n for n in notes if table["first_row"] - 3 <= n["last_row"] < table["first_row"]
+                 and table["first_col"] <= n["first_col"] <= table["last_col"]]
+        if above and not table["_title"]:
+            table["_title"] = [c for n in above for c in n["_title"] + n["_header"] + n.pop("_cells", [])]
+    return tables or regions[:1]
+
+def _resolve_text(regions: List[Dict], archive: zipfile.ZipFile):
+    """Replace the raw title/header cells by their text, reading only the shared strings they use"""
+    wanted = {int(v) for r in regions for _, kind, v in r["_title"] + r["_header"] if kind == "s" and v is not None}
+    strings = _shared_strings(archive, wanted)
+    text = lambda kind, v: strings.get(int(v), "") if kind == "s" else (v or "")
+    for r in regions:
+        r.pop("_cells", None)
+        r["title"] = " / ".join(text(kind, v) for _, kind, v in r.pop("_title")) or None
+        r["header"] = [text(kind, v) for _, kind, v in r.pop("_header")]
+
+def scan_workbook(file_path: str, min_cells: int = 2) -> Dict:
+    """Region index of an xlsx/xlsm workbook: declared vs real used range and the table regions of every sheet"""
+    sheets = {}
+    with zipfile.ZipFile(file_path) as archive:
+        all_regions = []
+        for sheet, part in _sheet_paths(archive).items():
+            scan = scan_sheet(archive, part)
+            regions = detect_regions(sheet, scan)
+            tables = _attach_notes(regions, min_cells)
+            filled = sorted(scan["rows"])
+            sheets[sheet] = {
+                "declared_range": scan["dimension"],
+                "used_rows": (filled[0], filled[-1]) if filled else None,
+                "filled_cells": sum(len(cells) for cells in scan["rows"].values()),
+                "regions": tables
+            }
+            all_regions.extend(tables)
+        _resolve_text(all_regions, archive)
+    return {"file_path": str(file_path), "mtime": Path(file_path).stat().st_mtime, "sheets": sheets}
+
+def region_read_args(region: Dict) -> Dict:
+    """pd.read_excel arguments that load exactly one region. pandas refuses usecols with a multi-row header,
+    so a two-row header is read as data and turned into labels by the caller."""
+    single = region["header_rows"] == 1
+    return {
+        "sheet_name": region["sheet"], "skiprows": region["first_row"] - 1, "header": 0 if single else None,
+        "nrows": region["last_row"] - region["first_row"] + 1 - int(single),
+        "usecols": f"{column_letter(region['first_col'])}:{column_letter(region['last_col'])}"
+    }
+
+def build_region_index(file_path: str, output_path=region_index_path) -> Dict:
+    index = scan_workbook(file_path)
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    _loaded[str(Path(file_path).resolve())] = index
+    regions = [r for s in index["sheets"].values() for r in s["regions"]]
+    return {"success": True, "sheets": len(index["sheets"]), "regions": len(regions), "index_path": str(output_path)}
+
+_loaded = {}
+
+def get_regions(file_path: str, index_path=region_index_path) -> Optional[Dict]:
+    """Region index of a workbook: the saved one when it matches the file, otherwise scanned once and kept in memory.
+    None for formats without sheet XML (xls, xlsb, ods)."""
+    key = str(Path(file_path).resolve())
+    mtime = Path(file_path).stat().st_mtime
+    index = _loaded.get(key)
+    if index is None and Path(index_path).exists():
+        with open(index_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if str(Path(saved["file_path"]).resolve()) == key:
+            index = saved
+    if index is None or index["mtime"] != mtime:
+        if not zipfile.is_zipfile(file_path):
+            return None
+        try:
+            index = scan_workbook(file_path)
+        except (KeyError, zipfile.BadZipFile):
+            return None
+    _loaded[key] = index
+    return index
+
+def regions_summary(file_path: str) -> str:
+    """One line per table for agent prompts, so they do not have to look for headers and titles themselves"""
+    index = get_regions(file_path) if Path(file_path).exists() else None
+    if not index:
+        return ""
+    lines = []
+    for sheet, info in index["sheets"].items():
+        for r in info["regions"]:
+            line = f"- '{sheet}' {r['range']}: {r['data_rows']} rows, {r['header_rows']} header row(s)"
+            if r["title"]:
+                line += f", title '{r['title']}'"
+            lines.append(line)
+        declared = info["declared_range"]
+        if declared and info["used_rows"] and CELL_REF.match(declared.split(":")[-1]) and _ref(declared.split(":")[-1])[0] > info["used_rows"][1]:
+            lines.append(f"  ('{sheet}' is formatted down to {info['declared_range']} but data stops at row {info['used_rows'][1]})")
+    return "\n".join(lines)
@@ -0,0 +1,177 @@
+import os, json, queue, shutil, hashlib, threading, logging
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Dict, List, Union
+from core.paths import render_cache_path
+from core.config import RENDER_WORKERS, RENDER_BATCH_SIZE, RENDER_BATCH_WINDOW, RENDER_TIMEOUT
+
+logger = logging.getLogger("peaqock_api")
+DEFAULT_OPTS = {"width": 1100, "height": 650, "scale": 2}
+
+def _figure_dict(fig) -> Dict:
+    """Accept a plotly Figure, a figure dict or the path of a figure saved with fig.write_json"""
+    if isinstance(fig, (str, Path)):
+        with open(fig, "r", encoding="utf-8") as f:
+            return json.load(f)
+    if hasattr(fig, "to_plotly_json"):
+        import plotly.io as pio
+        return json.loads(pio.to_json(fig, validate=False))
+    return fig
+
+def figure_hash(fig_dict: Dict, opts: Dict) -> str:
+    from plotly.utils import PlotlyJSONEncoder
+    payload = json.dumps({"fig": fig_dict, "opts": opts}, sort_keys=True, cls=PlotlyJSONEncoder)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _place(source: Path, target: Path):
+    """Hardlink a cached render to its destination, copying when linking is not possible"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    if target.exists() and os.path.samefile(source, target):
+        return
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+class _Job:
+    def __init__(self, fig_dict: Dict, target: Path, opts: Dict, key: str, cache_file: Path):
+        self.fig_dict, self.target, self.opts, self.key, self.cache_file = fig_dict, target, opts, key, cache_file
+        self.future = Future()
+
+class RendererPool:
+    """Long-lived static image exporter shared by the plot scripts and the report stage.
+    One browser server stays open for the whole process, queued requests are rendered in batches,
+    and every render is cached on disk under the hash of its figure spec and export options."""
+    def __init__(self, workers: int = RENDER_WORKERS, batch_size: int = RENDER_BATCH_SIZE, batch_window: float = RENDER_BATCH_WINDOW, cache_dir: Path = render_cache_path):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.cache_dir = Path(cache_dir)
+        self.stats = {"requests": 0, "cache_hits": 0, "rendered": 0, "batches": 0}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._server = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="renderer-pool", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        try:
+            import asyncio
+            from kaleido import Kaleido
+            asyncio.run(self._serve(Kaleido))
+        except Exception as e:
+            # No kaleido v1 or no browser available: keep serving the queue through plotly's own exporter
+            logger.warning(f"Renderer pool could not keep a persistent renderer open, exporting through plotly: {e}")
+            self._server = None
+            while True:
+                self._render_batch(self._next_batch())
+
+    async def _serve(self, Kaleido):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        async with Kaleido(n=self.workers) as renderer:
+            self._server = renderer
+            logger.info(f"Renderer pool started with {self.workers} renderer tabs")
+            while True:
+                batch = await loop.run_in_executor(None, self._next_batch)
+                await self._render_batch_async(batch)
+
+    def _next_batch(self) -> List["_Job"]:
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout=self.batch_window))
+            except queue.Empty:
+                break
+        return batch
+
+    def submit(self, fig, path: Union[str, Path], format: str = None, width: int = None, height: int = None, scale: float = None) -> Future:
+        target = Path(path)
+        fmt = (format or target.suffix.lstrip(".") or "png").lower()
+        opts = {"format": fmt, "width": width or DEFAULT_OPTS["width"], "height": height or DEFAULT_OPTS["height"], "scale": scale or DEFAULT_OPTS["scale"]}
+        fig_dict = _figure_dict(fig)
+        key = figure_hash(fig_dict, opts)
+        job = _Job(fig_dict, target, opts, key, self.cache_dir / f"{key}.{fmt}")
+        self.stats["requests"] += 1
+        if job.cache_file.exists():
+            self.stats["cache_hits"] += 1
+            _place(job.cache_file, target)
+            job.future.set_result(str(target))
+            return job.future
+        self.start()
+        self._queue.put(job)
+        return job.future
+
+    def render(self, fig, path: Union[str, Path], timeout: float = RENDER_TIMEOUT, **opts) -> str:
+        return self.submit(fig, path, **opts).result(timeout=timeout)
+
+    def render_many(self, items: List[Dict], timeout: float = RENDER_TIMEOUT) -> List[str]:
+        """Render several {fig, path, format, width, height, scale} specs; they are queued together so they share batches"""
+        futures = [self.submit(**item) for item in items]
+        return [f.result(timeout=timeout) for f in futures]
+
+    def _pending(self, batch: List[_Job]) -> Dict[str, _Job]:
+        pending = {}
+        for job in batch:
+            if not job.cache_file.exists():
+                pending.setdefault(job.key, job)
+        return pending
+
+    async def _render_batch_async(self, batch: List[_Job]):
+        pending = self._pending(batch)
+        try:
+            if pending:
+                await self._server.write_fig_from_object([
+                    {"fig": job.fig_dict, "path": job.cache_file, "opts": dict(job.opts)} for job in pending.values()
+                ])
+            self._record(pending)
+        except Exception as e:
+            logger.error(f"Renderer pool batch failed: {e}")
+        self._deliver(batch)
+
+    def _render_batch(self, batch: List[_Job]):
+        pending = self._pending(batch)
+        try:
+            import plotly.io as pio
+            for job in pending.values():
+                pio.write_image(job.fig_dict, job.cache_file, validate=False, **job.opts)
+            self._record(pending)
+        except Exception as e:
+            logger.error(f"Renderer pool batch failed: {e}")
+        self._deliver(batch)
+
+    def _record(self, pending: Dict[str, _Job]):
+        self.stats["batches"] += 1
+        self.stats["rendered"] += len(pending)
+
+    def _deliver(self, batch: List[_Job]):
+        for job in batch:
+            try:
+                if not job.cache_file.exists():
+                    raise RuntimeError(f"Image export failed for {job.target}")
+                _place(job.cache_file, job.target)
+                job.future.set_result(str(job.target))
+            except Exception as e:
+                job.future.set_exception(e)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_renderer() -> RendererPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = RendererPool()
+        return _pool
+
+def export_image(fig, path: Union[str, Path], format: str = None, width: int = None, height: int = None, scale: float = None) -> str:
+    """Drop-in replacement for fig.write_image(path) that goes through the shared renderer pool"""
+    return get_renderer().render(fig, path, format=format, width=width, height=height, scale=scale)
@@ -0,0 +1,239 @@
+import os, re, time, shutil, hashlib, logging, threading, subprocess
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional
+from core.paths import tectonic_path, latex_cache_path
+from core.config import TEX_ENGINE, LATEX_TIMEOUT, LATEX_WORKERS
+
+logger = logging.getLogger("peaqock_api")
+ENGINE_ORDER = ["tectonic", "latexmk", "xelatex", "pdflatex", "lualatex"]
+# graphicx handles these directly; anything else referenced by \includegraphics is converted to PNG first
+NATIVE_FIGURES = {".png", ".jpg", ".jpeg", ".pdf", ".eps"}
+INCLUDE_PATTERN = re.compile(r"\\(includegraphics|input|include)(\[[^\]]*\])?\{([^}]+)\}")
+
+def _sha(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+def find_engine() -> Optional[Dict]:
+    """First available TeX engine: PEAQOCK_TEX_ENGINE, the configured tectonic, then whatever is on PATH"""
+    candidates = [TEX_ENGINE] if TEX_ENGINE else []
+    candidates += [str(tectonic_path)] + ENGINE_ORDER
+    for candidate in candidates:
+        executable = candidate if os.path.isfile(candidate) else shutil.which(candidate)
+        if executable:
+            name = next((e for e in ENGINE_ORDER if e in Path(executable).stem.lower()), "pdflatex")
+            return {"name": name, "path": executable}
+    return None
+
+def parse_latex_errors(output: str, tex_lines: List[str]) -> List[Dict]:
+    """Error locations from engine output: 'file:line: message' (file-line-error / tectonic) or '! message' + 'l.<n>'"""
+    errors, seen = [], set()
+    def add(line: Optional[int], message: str):
+        key = (line, message)
+        if key in seen:
+            return
+        seen.add(key)
+        context = tex_lines[line - 1].strip() if line and 0 < line <= len(tex_lines) else ""
+        errors.append({"line": line, "message": message.strip(), "context": context})
+
+    for match in re.finditer(r"^(?:error: )?[^\s:]*\.tex:(\d+): (.+)$", output, re.MULTILINE):
+        add(int(match.group(1)), match.group(2))
+    for match in re.finditer(r"^! (.+?)$(?:.*?^l\.(\d+))?", output, re.MULTILINE | re.DOTALL):
+        line = int(match.group(2)) if match.group(2) else None
+        if not any(e["message"] == match.group(1).strip() for e in errors):
+            add(line, match.group(1))
+    for match in re.finditer(r"(?:File|file) [`']?([^'`\s]+)'? not found", output):
+        add(None, f"File not found: {match.group(1)}")
+    if not errors and re.search(r"^error:", output, re.MULTILINE):
+        add(None, next(l for l in output.splitlines() if l.startswith("error:"))[6:])
+    return errors[:20]
+
+class ReportBuilder:
+    """Compiles LaTeX reports off the agent thread, with a build cache, a preamble format cache and figure conversion cache"""
+    def __init__(self, cache_dir: Path = latex_cache_path, workers: int = LATEX_WORKERS, timeout: float = LATEX_TIMEOUT):
+        self.cache_dir = Path(cache_dir)
+        self.timeout = timeout
+        self.engine = find_engine()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="latex")
+        self._preparing = {}
+        self._lock = threading.Lock()
+        for sub in ("builds", "formats", "figures"):
+            (self.cache_dir / sub).mkdir(parents=True, exist_ok=True)
+
+    # Dependencies and figures
+    def _dependencies(self, tex_file: Path, text: str) -> List[Path]:
+        found = []
+        for _, _, target in INCLUDE_PATTERN.findall(text):
+            path = tex_file.parent / target.strip()
+            for candidate in (path, path.with_suffix(".tex")) if not path.suffix else (path,):
+                if candidate.is_file():
+                    found.append(candidate)
+                    break
+        return found
+
+    def _convert_figure(self, source: Path) -> Optional[Path]:
+        """PNG version of a figure graphicx cannot include, cached by the hash of the source file"""
+        if source.suffix.lower() == ".html" and source.with_suffix(".json").is_file():
+            from core.renderer import get_renderer
+            return Path(get_renderer().render(source.with_suffix(".json"), source.with_suffix(".png")))
+        key = _sha(source.read_bytes())
+        cached = self.cache_dir / "figures" / f"{key}.png"
+        if not cached.exists():
+            if source.suffix.lower() == ".svg":
+                import cairosvg
+                cairosvg.svg2png(url=str(source), write_to=str(cached))
+            else:
+                from PIL import Image
+                with Image.open(source) as image:
+                    image.convert("RGBA").save(cached, "PNG")
+        target = source.with_suffix(".png")
+        shutil.copyfile(cached, target)
+        return target
+
+    def prepare_figures(self, tex_file: Path) -> Dict:
+        """Convert unsupported figures referenced by \\includegraphics and point the document at the PNGs.
+        The rewrite only lands if the file still holds the text that was read: the agent may have written a new
+        version in the meantime, whose own preparation converts its figures."""
+        text = tex_file.read_text(encoding="utf-8")
+        converted = []
+        def replace(match):
+            command, options, target = match.groups()
+            path = tex_file.parent / target.strip()
+            if command != "includegraphics" or path.suffix.lower() in NATIVE_FIGURES or not path.is_file():
+                return match.group(0)
+            try:
+                png = self._convert_figure(path)
+                converted.append({"from": target, "to": png.relative_to(tex_file.parent).as_posix()})
+                return f"\\{command}{options or ''}{{{converted[-1]['to']}}}"
+            except Exception as e:
+                logger.warning(f"Could not convert figure {path}: {e}")
+                return match.group(0)
+        updated = INCLUDE_PATTERN.sub(replace, text)
+        if updated != text and not self._swap(tex_file, text, updated):
+            return {"figures": [], "text": None}
+        return {"figures": converted, "text": updated}
+
+    def _swap(self, tex_file: Path, expected: str, updated: str) -> bool:
+        with self._lock:
+            if tex_file.read_text(encoding="utf-8") != expected:
+                return False
+            tmp = tex_file.with_name(f".{tex_file.name}.tmp")
+            tmp.write_text(updated, encoding="utf-8")
+            os.replace(tmp, tex_file)
+            return True
+
+    # Preamble format (pdflatex/xelatex/lualatex only: tectonic caches its own formats)
+    def _format_for(self, tex_file: Path, text: str) -> Optional[Path]:
+        if not self.engine or self.engine["name"] not in ("pdflatex", "xelatex", "lualatex") or "\\begin{document}" not in text:
+            return None
+        if not shutil.which("kpsewhich") or not subprocess.run(["kpsewhich", "mylatexformat.ltx"], capture_output=True, text=True).stdout.strip():
+            return None
+        preamble = text.split("\\begin{document}", 1)[0]
+        name = f"preamble-{_sha(self.engine['name'], preamble)[:16]}"
+        fmt = self.cache_dir / "formats" / f"{name}.fmt"
+        if fmt.exists():
+            return fmt
+        stub = self.cache_dir / "formats" / f"{name}.tex"
+        stub.write_text(preamble + "\\begin{document}\n\\end{document}\n", encoding="utf-8")
+        command = [self.engine["path"], "-ini", f"-jobname={name}", "-interaction=nonstopmode", f"&{self.engine['name']}", "mylatexformat.ltx", stub.name]
+        env = dict(os.environ, TEXINPUTS=f"{tex_file.parent}{os.pathsep}")
+        result = subprocess.run(command, cwd=stub.parent, capture_output=True, text=True, timeout=self.timeout, env=env)
+        return fmt if result.returncode == 0 and fmt.exists() else None
+
+    def prepare(self, tex_path: str) -> Future:
+        """Start building the preamble format and converting figures in the background, as soon as the .tex is written.
+        An earlier preparation of the same file is cancelled, or waited for if it already runs, so two never overlap."""
+        tex_file = Path(tex_path)
+        with self._lock:
+            previous, after = self._preparing.get(str(tex_file), (None, None))
+            if previous is not None and not previous.cancel():
+                after = previous
+            future = self._executor.submit(self._prepare, tex_file, after)
+            self._preparing[str(tex_file)] = (future, after)
+        return future
+
+    def _prepare(self, tex_file: Path, after: Optional[Future] = None) -> Dict:
+        if after is not None:
+            wait([after])
+        prepared = self.prepare_figures(tex_file)
+        fmt = self._format_for(tex_file, prepared["text"]) if prepared["text"] is not None else None
+        return {**prepared, "format": str(fmt) if fmt else None}
+
+    # Compilation
+    def _command(self, tex_file: Path, fmt: Optional[Path]) -> List[List[str]]:
+        engine, out = self.engine, str(tex_file.parent)
+        if engine["name"] == "tectonic":
+            return [[engine["path"], "--outdir", out, "--keep-logs", str(tex_file)]]
+        if engine["name"] == "latexmk":
+            return [[engine["path"], "-pdf", "-interaction=nonstopmode", "-halt-on-error", "-file-line-error", f"-outdir={out}", str(tex_file)]]
+        base = [engine["path"], "-interaction=nonstopmode", "-halt-on-error", "-file-line-error", "-output-directory", out]
+        if fmt:
+            base.append(f"-fmt={fmt.with_suffix('')}")
+        # Two passes so longtable widths, references and the table of contents settle
+        return [base + [str(tex_file)]] * 2
+
+    def compile(self, tex_path: str, timeout: Optional[float] = None) -> Dict:
+        tex_file = Path(tex_path)
+        started = time.time()
+        if not tex_file.is_file():
+            return {"success": False, "errors": [{"line": None, "message": f"TeX file not found: {tex_file}", "context": ""}]}
+        if not self.engine:
+            return {"success": False, "errors": [{"line": None, "message": "No TeX engine found: install tectonic or a TeX distribution, or set PEAQOCK_TEX_ENGINE", "context": ""}]}
+
+        with self._lock:
+            preparing, after = self._preparing.pop(str(tex_file), (None, None))
+            # A preparation that has not started yet is done inline, so a single worker can never wait on itself
+            if preparing is not None and preparing.cancel():
+                preparing = None
+        prepared = preparing.result() if preparing else self._prepare(tex_file, after)
+        text = tex_file.read_text(encoding="utf-8")
+        if prepared["text"] != text:
+            # Rewritten since it was prepared, by the agent or outside a tool: prepare what will actually be compiled
+            prepared = self._prepare(tex_file)
+            text = tex_file.read_text(encoding="utf-8")
+        pdf = tex_file.with_suffix(".pdf")
+        key = _sha(self.engine["name"], text, *(_sha(p.read_bytes()) for p in self._dependencies(tex_file, text)))
+        cached = self.cache_dir / "builds" / f"{key}.pdf"
+        if cached.exists():
+            shutil.copyfile(cached, pdf)
+            return {"success": True, "pdf_path": str(pdf), "engine": self.engine["name"], "cached": True, "seconds": round(time.time() - started, 2), "errors": []}
+
+        fmt = Path(prepared["format"]) if prepared.get("format") else None
+        output = ""
+        try:
+            for command in self._command(tex_file, fmt):
+                env = dict(os.environ, TEXFORMATS=f"{self.cache_dir / 'formats'}{os.pathsep}") if fmt else None
+                result = subprocess.run(command, cwd=tex_file.parent, capture_output=True, text=True, errors="replace", timeout=timeout or self.timeout, env=env)
+                output = result.stdout + "\n" + result.stderr
+                if result.returncode != 0:
+                    break
+        except subprocess.TimeoutExpired:
+            return {"success": False, "engine": self.engine["name"], "seconds": round(time.time() - started, 2),
+                    "errors": [{"line": None, "message": f"Compilation timed out after {timeout or self.timeout:.0f}s (an infinite loop or a missing package download?)", "context": ""}]}
+
+        log_file = tex_file.with_suffix(".log")
+        if log_file.exists():
+            output += "\n" + log_file.read_text(encoding="utf-8", errors="replace")
+        success = result.returncode == 0 and pdf.exists()
+        if success:
+            shutil.copyfile(pdf, cached)
+        return {
+            "success": success, "pdf_path": str(pdf) if success else None, "engine": self.engine["name"], "cached": False,
+            "preamble_format": bool(fmt), "figures_converted": prepared.get("figures", []), "seconds": round(time.time() - started, 2),
+            "errors": [] if success else parse_latex_errors(output, text.splitlines()),
+            "log_tail": "" if success else "\n".join(output.strip().splitlines()[-15:])
+        }
+
+    def compile_async(self, tex_path: str, timeout: Optional[float] = None) -> Future:
+        return self._executor.submit(self.compile, tex_path, timeout)
+
+_builder = None
+
+def get_report_builder() -> ReportBuilder:
+    global _builder
+    if _builder is None:
+        _builder = ReportBuilder()
+    return _builder
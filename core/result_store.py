@@ -0,0 +1,172 @@
+import os, json, time, uuid, shutil, logging, threading
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+from core.paths import repo_path, output_path, results_path
+from core.artifacts import file_hash, artifact_type, workspace_registry, output_registry
+from core.events import new_job_id
+from core.config import RESULTS_MAX_AGE_DAYS, RESULTS_MAX_BYTES, RESULTS_SWEEP_INTERVAL
+
+logger = logging.getLogger("peaqock_api")
+
+def _link(source: Path, target: Path):
+    """Atomically put a hardlink of source at target (copy when the filesystem cannot link)"""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # rename() is a no-op between two links of the same file, which would leave the temporary link behind
+    if target.exists() and os.path.samefile(source, target):
+        return
+    tmp = target.with_name(f".{target.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+class ResultStore:
+    """Content-addressed store of published results.
+    Each file is kept once under objects/<sha256>; jobs/<job_id>/ and the output/ folder only hold hardlinks to it,
+    so publishing a deliverable is a rename out of the workspace plus a few links, and earlier jobs stay available."""
+    def __init__(self, root: Path = results_path, output_dir: Path = output_path):
+        self.root = Path(root)
+        self.output_dir = Path(output_dir)
+        self.objects = self.root / "objects"
+        self.jobs = self.root / "jobs"
+        self._lock = threading.RLock()
+        self._sweeper = None
+
+    def _digest(self, path: Path) -> str:
+        # The workspace registry already hashed most deliverables when they were written
+        known = workspace_registry().get(path) if path.resolve().is_relative_to(repo_path.resolve()) else None
+        stat = path.stat()
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+            return known["sha256"]
+        return file_hash(path)
+
+    def _store(self, path: Path, move: bool) -> str:
+        digest = self._digest(path)
+        blob = self.objects / digest[:2] / digest
+        if blob.exists():
+            if move:
+                path.unlink()
+            return digest
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = blob.with_name(f"{digest}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            os.replace(path, tmp) if move else os.link(path, tmp)
+        except OSError:
+            # Different filesystem: fall back to a single copy
+            shutil.copyfile(path, tmp)
+            if move:
+                path.unlink()
+        os.replace(tmp, blob)
+        return digest
+
+    def publish(self, source: Union[str, Path], step: Optional[str] = "delivery", job_id: Optional[str] = None) -> Dict:
+        """Publish a deliverable file or folder as a new job and make it the content of output/.
+        Files inside the workspace are moved (the workspace is deleted afterwards anyway), others are linked or copied."""
+        source = Path(source)
+        if not source.exists():
+            raise FileNotFoundError(source)
+        job_id = job_id or new_job_id()
+        move = source.resolve().is_relative_to(repo_path.resolve())
+        files = [source] if source.is_file() else sorted(p for p in source.rglob("*") if p.is_file())
+        base = source.parent
+
+        with self._lock:
+            entries = []
+            for file in files:
+                # A published folder keeps its name, as output/<folder>/...
+                relative = file.relative_to(base).as_posix()
+                size = file.stat().st_size
+                digest = self._store(file, move)
+                entries.append({"path": relative, "sha256": digest, "size": size, "type": artifact_type(relative)})
+
+            job_dir = self.jobs / job_id
+            for entry in entries:
+                _link(self.objects / entry["sha256"][:2] / entry["sha256"], job_dir / entry["path"])
+            manifest = {"job_id": job_id, "created": time.time(), "step": step, "source": source.name, "files": entries}
+            with open(job_dir / "job.json", "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+            self._show(job_dir, entries, step)
+        return manifest
+
+    def _show(self, job_dir: Path, entries: List[Dict], step: Optional[str]):
+        """Point output/ at a job: link its files in place, then drop what the previous job left there"""
+        registry = output_registry()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        for entry in entries:
+            _link(job_dir / entry["path"], self.output_dir / entry["path"])
+            registry.register(self.output_dir / entry["path"], type=entry["type"], step=step, digest=entry["sha256"])
+        keep = {entry["path"] for entry in entries}
+        for stale in [e["path"] for e in registry.find() if e["path"] not in keep]:
+            (self.output_dir / stale).unlink(missing_ok=True)
+            registry.unregister(self.output_dir / stale)
+        for folder in sorted((p for p in self.output_dir.rglob("*") if p.is_dir()), reverse=True):
+            if not any(folder.iterdir()):
+                folder.rmdir()
+
+    def list_jobs(self) -> List[Dict]:
+        jobs = []
+        for manifest in self.jobs.glob("*/job.json"):
+            try:
+                with open(manifest, "r", encoding="utf-8") as f:
+                    jobs.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(jobs, key=lambda j: j["created"], reverse=True)
+
+    def restore(self, job_id: str) -> Dict:
+        """Make an earlier job the content of output/ again"""
+        job = next((j for j in self.list_jobs() if j["job_id"] == job_id), None)
+        if job is None:
+            raise FileNotFoundError(f"Unknown job '{job_id}'")
+        with self._lock:
+            self._show(self.jobs / job_id, job["files"], job.get("step"))
+        return job
+
+    # Retention
+    def sweep(self, max_age_days: float = RESULTS_MAX_AGE_DAYS, max_bytes: int = RESULTS_MAX_BYTES) -> Dict:
+        """Drop jobs older than max_age_days, then the oldest ones until the stored objects fit in max_bytes.
+        The most recent job is always kept; objects no job refers to any more are deleted."""
+        with self._lock:
+            jobs = self.list_jobs()
+            removed = []
+            cutoff = time.time() - max_age_days * 86400
+            kept = jobs[:1] + [j for j in jobs[1:] if j["created"] >= cutoff]
+            removed += [j for j in jobs[1:] if j["created"] < cutoff]
+            sizes = {e["sha256"]: e["size"] for j in kept for e in j["files"]}
+            while len(kept) > 1 and sum(sizes.values()) > max_bytes:
+                removed.append(kept.pop())
+                sizes = {e["sha256"]: e["size"] for j in kept for e in j["files"]}
+            for job in removed:
+                shutil.rmtree(self.jobs / job["job_id"], ignore_errors=True)
+
+            freed = 0
+            for blob in self.objects.glob("*/*"):
+                if blob.name not in sizes and not blob.name.endswith(".tmp"):
+                    freed += blob.stat().st_size
+                    blob.unlink(missing_ok=True)
+        if removed:
+            logger.info(f"Result store sweep removed {len(removed)} jobs and freed {freed / 1e6:.1f} MB")
+        return {"removed_jobs": [j["job_id"] for j in removed], "freed_bytes": freed, "kept_jobs": len(kept), "stored_bytes": sum(sizes.values())}
+
+    def start_sweeper(self, interval: float = RESULTS_SWEEP_INTERVAL):
+        """Enforce retention from a background thread, off the request path"""
+        def run():
+            while True:
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.warning(f"Result store sweep failed: {e}")
+                time.sleep(interval)
+        with self._lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=run, name="result-sweeper", daemon=True)
+                self._sweeper.start()
+
+_store = None
+
+def get_result_store() -> ResultStore:
+    global _store
+    if _store is None:
+        _store = ResultStore()
+    return _store
@@ -0,0 +1,314 @@
+import os, json, time, shutil, pickle, hashlib, zipfile, re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from core.paths import analysis_cache_path, repo_path
+from core.config import INCREMENTAL_ANALYSIS, FINGERPRINT_BLOCK_ROWS, ANALYSIS_SNAPSHOTS
+from core.regions import NS, iterparse, RowReader, _sheet_paths, get_regions
+from core.artifacts import file_hash, register_artifact
+
+SHARED_INDEX = re.compile(rb'<c\b[^>]*?\bt="s"[^>]*>\s*<v>(\d+)</v>')
+MEDIA_PREFIXES = ("xl/media/", "xl/charts/", "xl/drawings/")
+# Preprocessing outputs a later revision of the same workbook starts from
+SNAPSHOT_FILES = ("context.json", "context_notes.txt", "review_notes.txt", "workspace.json", "media.json", "summary.txt")
+# Share of an upload's row blocks that must be unchanged in a saved workbook for the upload to be a revision of it
+REVISION_OVERLAP = 0.5
+_fingerprints = {}
+
+def _digest(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+def _part_hash(archive: zipfile.ZipFile, name: str) -> str:
+    digest = hashlib.sha256()
+    with archive.open(name) as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _all_shared_strings(archive: zipfile.ZipFile) -> List[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as f:
+        for _, element in iterparse(f):
+            if element.tag == f"{NS}si":
+                strings.append("".join(t.text or "" for t in element.iter(f"{NS}t")))
+                element.clear()
+    return strings
+
+def _sheet_fingerprint(archive: zipfile.ZipFile, part: str, strings: List[str], styles: str, block_rows: int) -> Dict:
+    """Hashes of the sheet by blocks of block_rows rows. A block hashes its row XML together with the text of the shared
+    strings it uses, so a reordered string table cannot make different content look unchanged"""
+    blocks, current, block, rows = {}, None, None, 0
+    with archive.open(part) as f:
+        reader = RowReader(f)
+        for row, row_xml in reader.rows():
+            number = (row - 1) // block_rows
+            if number != block:
+                if current is not None:
+                    blocks[block] = current.hexdigest()
+                block, current = number, hashlib.sha256()
+            current.update(row_xml)
+            for index in SHARED_INDEX.findall(row_xml):
+                index = int(index)
+                current.update(b"\x00" + (strings[index] if index < len(strings) else "").encode("utf-8"))
+            rows += 1
+        if current is not None:
+            blocks[block] = current.hexdigest()
+        # Merged ranges, filters and conditional formats live after the rows and change the tables' headers and layout
+        tail = _digest(reader.rest())
+    return {"rows": rows, "blocks": {str(k): v for k, v in blocks.items()},
+            "digest": _digest(styles, tail, *(f"{k}:{v}" for k, v in sorted(blocks.items())))}
+
+def fingerprint_workbook(file_path: str, block_rows: int = FINGERPRINT_BLOCK_ROWS) -> Dict:
+    """Per-sheet content digests and row-block hashes of a workbook, plus the hashes of its charts and images.
+    Formats without sheet XML get a single whole-file digest for every sheet."""
+    file_path = str(file_path)
+    fingerprint = {"file_path": file_path, "mtime": Path(file_path).stat().st_mtime, "block_rows": block_rows, "sheets": {}, "media": {}}
+    if not zipfile.is_zipfile(file_path):
+        from core.readers import open_workbook
+        digest = file_hash(Path(file_path))
+        fingerprint["sheets"] = {name: {"rows": None, "blocks": {}, "digest": digest} for name in open_workbook(file_path).sheet_names}
+    else:
+        with zipfile.ZipFile(file_path) as archive:
+            names = archive.namelist()
+            styles = _part_hash(archive, "xl/styles.xml") if "xl/styles.xml" in names else ""
+            strings = _all_shared_strings(archive)
+            for sheet, part in _sheet_paths(archive).items():
+                fingerprint["sheets"][sheet] = _sheet_fingerprint(archive, part, strings, styles, block_rows)
+            fingerprint["media"] = {name: _part_hash(archive, name) for name in names if name.startswith(MEDIA_PREFIXES)}
+    fingerprint["digest"] = _digest(*(f"{name}:{s['digest']}" for name, s in fingerprint["sheets"].items()),
+                                    *(f"{name}:{h}" for name, h in sorted(fingerprint["media"].items())))
+    return fingerprint
+
+def get_fingerprint(file_path: str) -> Dict:
+    """Fingerprint of a workbook, computed once per file version"""
+    key = str(Path(file_path).resolve())
+    fingerprint = _fingerprints.get(key)
+    if fingerprint is None or fingerprint["mtime"] != Path(file_path).stat().st_mtime:
+        fingerprint = _fingerprints[key] = fingerprint_workbook(file_path)
+    return fingerprint
+
+def _row_ranges(blocks: List[int], block_rows: int) -> List[Tuple[int, int]]:
+    ranges = []
+    for block in sorted(blocks):
+        first, last = block * block_rows + 1, (block + 1) * block_rows
+        if ranges and ranges[-1][1] + 1 == first:
+            ranges[-1][1] = last
+        else:
+            ranges.append([first, last])
+    return [tuple(r) for r in ranges]
+
+def diff_fingerprints(old: Dict, new: Dict) -> Dict:
+    """Which sheets changed between two versions of a workbook and, inside a changed sheet, which row ranges"""
+    changed = {}
+    unchanged = [name for name, sheet in new["sheets"].items() if name in old["sheets"] and old["sheets"][name]["digest"] == sheet["digest"]]
+    for name, sheet in new["sheets"].items():
+        if name not in old["sheets"] or name in unchanged:
+            continue
+        before, after = old["sheets"][name]["blocks"], sheet["blocks"]
+        if old.get("block_rows") != new.get("block_rows") or not after:
+            changed[name] = {"rows": "all"}
+            continue
+        edited = [int(k) for k, v in after.items() if k in before and before[k] != v]
+        added = [int(k) for k in after if k not in before]
+        removed = [int(k) for k in before if k not in after]
+        changed[name] = {"rows": [list(r) for r in _row_ranges(edited + added + removed, new["block_rows"])],
+                         "row_count": [old["sheets"][name]["rows"], sheet["rows"]]}
+        if not edited and not removed and added:
+            changed[name]["appended"] = True
+    return {
+        "unchanged": unchanged, "changed": changed,
+        "added": [name for name in new["sheets"] if name not in old["sheets"]],
+        "removed": [name for name in old["sheets"] if name not in new["sheets"]],
+        "media_changed": old.get("media") != new.get("media")
+    }
+
+def _similarity(old: Dict, new: Dict) -> float:
+    """Share of the new workbook's row blocks found unchanged in the same-named sheets of the old one. A sheet without
+    row blocks (formats without sheet XML) counts as one block, matched by its digest."""
+    matched, total = 0, 0
+    for name, sheet in new["sheets"].items():
+        size = max(1, len(sheet["blocks"]))
+        total += size
+        previous = old["sheets"].get(name)
+        if previous is None:
+            continue
+        if previous["digest"] == sheet["digest"]:
+            matched += size
+        elif old.get("block_rows") == new.get("block_rows"):
+            matched += sum(previous["blocks"].get(k) == v for k, v in sheet["blocks"].items())
+    return matched / total if total else 0.0
+
+def is_revision(old: Dict, new: Dict) -> bool:
+    """Whether new is a revision of old: the same workbook, or most of its content unchanged and at least one of the
+    old sheets edited. An upload that only shares a parameters sheet with old, or only adds sheets next to it, is not."""
+    digests = lambda fingerprint: {name: sheet["digest"] for name, sheet in fingerprint["sheets"].items()}
+    if digests(old) == digests(new):
+        # The same workbook, or the same sheets with other charts or images
+        return True
+    edited = any(name in old["sheets"] and old["sheets"][name]["digest"] != sheet["digest"] for name, sheet in new["sheets"].items())
+    return edited and _similarity(old, new) > REVISION_OVERLAP
+
+class AnalysisCache:
+    """Persistent cache for re-uploaded workbooks, kept outside the per-job workspace:
+    - tables/: per-sheet results of the profiling functions, keyed by the sheet's content digest
+    - media/: vision analyses, keyed by the hash of the image
+    - workbooks/: the preprocessing outputs of recent workbooks with their fingerprints, to restart from on a revision"""
+    def __init__(self, root: Path = analysis_cache_path, snapshots: int = ANALYSIS_SNAPSHOTS):
+        self.root = Path(root)
+        self.snapshots = snapshots
+
+    def _file(self, *parts: str) -> Path:
+        path = self.root.joinpath(*parts)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def _write(self, path: Path, write):
+        tmp = path.with_name(f".{path.name}.tmp{os.getpid()}")
+        write(tmp)
+        os.replace(tmp, path)
+
+    def table_result(self, key: str, digest: str):
+        path = self.root / "tables" / key / f"{digest}.pkl"
+        if not path.exists():
+            return None
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def store_table_result(self, key: str, digest: str, result):
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(self._file("tables", key, f"{digest}.pkl"), write)
+
+    def media_analysis(self, digest: str) -> Optional[Dict]:
+        path = self.root / "media" / f"{digest}.json"
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def store_media_analysis(self, digest: str, analysis: Dict):
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(analysis, f, indent=2, ensure_ascii=False)
+        self._write(self._file("media", f"{digest}.json"), write)
+
+    def _snapshots(self) -> List[Path]:
+        folder = self.root / "workbooks"
+        return sorted((p for p in folder.iterdir() if (p / "fingerprint.json").exists()), key=lambda p: p.stat().st_mtime, reverse=True) if folder.exists() else []
+
+    def previous(self, fingerprint: Dict) -> Optional[Tuple[Path, Dict]]:
+        """The saved workbook this one is a revision of (the one sharing the most content, if several are), if any"""
+        best, best_score = None, 0.0
+        for snapshot in self._snapshots():
+            with open(snapshot / "fingerprint.json", "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if not is_revision(saved, fingerprint):
+                continue
+            score = 2.0 if saved["digest"] == fingerprint["digest"] else _similarity(saved, fingerprint)
+            if score > best_score:
+                best, best_score = (snapshot, saved), score
+        return best
+
+    def save_snapshot(self, fingerprint: Dict, source: Path = repo_path) -> Path:
+        snapshot = self.root / "workbooks" / fingerprint["digest"][:32]
+        snapshot.mkdir(parents=True, exist_ok=True)
+        for name in SNAPSHOT_FILES:
+            if (Path(source) / name).is_file():
+                shutil.copyfile(Path(source) / name, snapshot / name)
+            else:
+                (snapshot / name).unlink(missing_ok=True)
+        self._write(snapshot / "fingerprint.json", lambda tmp: tmp.write_text(json.dumps(fingerprint), encoding="utf-8"))
+        os.utime(snapshot)
+        for old in self._snapshots()[self.snapshots:]:
+            shutil.rmtree(old, ignore_errors=True)
+        return snapshot
+
+_cache = None
+
+def analysis_cache() -> AnalysisCache:
+    global _cache
+    if _cache is None:
+        _cache = AnalysisCache()
+    return _cache
+
+def start_revision(file_path: str, target: Path = repo_path) -> Dict:
+    """Compare an uploaded workbook with the closest one analysed before and restore that analysis into the workspace.
+    status is "new" (nothing to start from), "unchanged" (every output restored, preprocessing can be skipped) or
+    "revised" (outputs restored as a starting point, only the sheets and rows in `diff` need another look).
+    The previous context.json is restored as previous_context.json, since the scout rewrites context.json."""
+    if not INCREMENTAL_ANALYSIS:
+        return {"status": "new"}
+    started = time.perf_counter()
+    fingerprint = get_fingerprint(file_path)
+    found = analysis_cache().previous(fingerprint)
+    if found is None:
+        return {"status": "new", "seconds": round(time.perf_counter() - started, 2)}
+    snapshot, saved = found
+    diff = diff_fingerprints(saved, fingerprint)
+    unchanged = saved["digest"] == fingerprint["digest"] and (snapshot / "summary.txt").exists()
+    restored = []
+    for name in SNAPSHOT_FILES:
+        if not (snapshot / name).exists():
+            continue
+        if not unchanged and name in ("review_notes.txt", "summary.txt", "media.json"):
+            # Re-done from scratch on a revision: they describe the workbook as a whole
+            continue
+        destination = Path(target) / ("previous_context.json" if name == "context.json" and not unchanged else name)
+        shutil.copyfile(snapshot / name, destination)
+        register_artifact(destination, step="revision")
+        restored.append(destination.name)
+    return {"status": "unchanged" if unchanged else "revised", "diff": diff, "restored": restored, "layout": saved.get("layout"),
+            "seconds": round(time.perf_counter() - started, 2)}
+
+def finish_revision(file_path: str, source: Path = repo_path) -> Optional[str]:
+    """Save the preprocessing outputs of the workbook so that its next revision can start from them"""
+    if not INCREMENTAL_ANALYSIS:
+        return None
+    # The table layout goes with the snapshot, for the next revision to tell edited rows from relabelled columns
+    return str(analysis_cache().save_snapshot(dict(get_fingerprint(file_path), layout=table_layout(file_path)), source))
+
+def table_layout(file_path: str) -> Optional[Dict]:
+    """Title and header labels of the tables of each sheet, from the region index; None for formats without sheet XML"""
+    index = get_regions(file_path)
+    if index is None:
+        return None
+    return {sheet: [[region["title"], region["header"]] for region in info["regions"]] for sheet, info in index["sheets"].items()}
+
+def layout_changes(revision: Dict, file_path: str) -> Optional[List[str]]:
+    """Changed sheets of a revision whose tables no longer have the same titles and headers (a header edit changes what
+    the columns mean, unlike an edit of their rows); None when the previous layout is not known"""
+    before, after = revision.get("layout"), table_layout(file_path)
+    if before is None or after is None:
+        return None
+    return [name for name in revision["diff"]["changed"] if before.get(name) != after.get(name)]
+
+def revision_summary(revision: Optional[Dict]) -> str:
+    """What changed since the previous upload, for agent prompts; empty for a new workbook"""
+    if not revision or revision.get("status") != "revised":
+        return ""
+    diff = revision["diff"]
+    lines = []
+    for name, change in diff["changed"].items():
+        if change["rows"] == "all":
+            lines.append(f"- {name}: changed")
+        elif change.get("appended"):
+            lines.append(f"- {name}: rows appended ({change['row_count'][0]} -> {change['row_count'][1]} rows)")
+        else:
+            ranges = ", ".join(f"{a}-{b}" for a, b in change["rows"][:10]) + (" ..." if len(change["rows"]) > 10 else "")
+            lines.append(f"- {name}: rows {ranges} changed ({change['row_count'][0]} -> {change['row_count'][1]} rows)")
+    lines += [f"- {name}: new sheet" for name in diff["added"]]
+    lines += [f"- {name}: removed" for name in diff["removed"]]
+    if diff["unchanged"]:
+        lines.append(f"- unchanged: {', '.join(diff['unchanged'])}")
+    if diff["media_changed"]:
+        lines.append("- charts or images changed")
+    return "\n".join(lines)
@@ -0,0 +1,305 @@
+import re, math, zipfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from core.config import LARGE_DATA_MODE, LARGE_DATA_ROWS, SAMPLE_ROWS, SAMPLE_BLOCKS, SAMPLE_SEED
+from core.regions import NS, iterparse, get_regions, RowReader, row_cells, unescape_xml, _sheet_paths, _shared_strings, CELL_TYPE, VALUE, INLINE_TEXT
+from core.sketches import HyperLogLog, TDigest, Reservoir, proportion_interval, rank_error, distinct_bounds
+
+CELL_STYLE = re.compile(rb'\bs="(\d+)"')
+# Built-in number formats that display dates or times
+DATE_FORMAT_IDS = set(range(14, 23)) | {45, 46, 47}
+DATE_CODE = re.compile(r"(?<![\\_])[dmyhs]", re.I)
+QUANTILES = (0.01, 0.25, 0.5, 0.75, 0.99)
+CONFIDENCE = 0.95
+
+def is_large(region: Optional[Dict]) -> bool:
+    """Whether a table is profiled on a sample under the configured large-data mode"""
+    if not region or LARGE_DATA_MODE == "off":
+        return False
+    threshold = SAMPLE_ROWS if LARGE_DATA_MODE == "on" else max(LARGE_DATA_ROWS, SAMPLE_ROWS)
+    return region["data_rows"] > threshold
+
+def sample_plan(first_row: int, last_row: int, rows: int = SAMPLE_ROWS, blocks: int = SAMPLE_BLOCKS, seed: int = SAMPLE_SEED) -> List[Tuple[int, int]]:
+    """Stratified plan: the rows are cut into `blocks` equal strata and a block of contiguous rows is drawn at a random
+    offset in each, so the beginning, the middle and the end of a sorted sheet are all represented.
+    Contiguous blocks keep the read sequential."""
+    total = last_row - first_row + 1
+    if total <= rows:
+        return [(first_row, last_row)]
+    rng = np.random.default_rng(seed)
+    blocks = max(1, min(blocks, rows))
+    size = math.ceil(rows / blocks)
+    stratum = total / blocks
+    plan = []
+    for i in range(blocks):
+        low = first_row + int(i * stratum)
+        slack = max(0, int(stratum) - size)
+        start = low + int(rng.integers(0, slack + 1))
+        plan.append((start, min(start + size - 1, last_row)))
+    return plan
+
+def _date_styles(archive: zipfile.ZipFile) -> set:
+    """Cell style indexes whose number format shows a date, so serial numbers can be turned back into dates"""
+    if "xl/styles.xml" not in archive.namelist():
+        return set()
+    custom, formats, in_xfs = {}, [], False
+    with archive.open("xl/styles.xml") as f:
+        for event, element in iterparse(f, events=("start", "end")):
+            if element.tag == f"{NS}numFmt" and event == "end":
+                code = re.sub(r'"[^"]*"|\[[^\]]*\]', "", element.get("formatCode", ""))
+                custom[int(element.get("numFmtId"))] = bool(DATE_CODE.search(code))
+            elif element.tag == f"{NS}cellXfs":
+                in_xfs = event == "start"
+            elif element.tag == f"{NS}xf" and event == "end" and in_xfs:
+                formats.append(int(element.get("numFmtId", 0)))
+    return {i for i, fmt in enumerate(formats) if fmt in DATE_FORMAT_IDS or custom.get(fmt)}
+
+def _cells(row_xml: bytes, date_styles: set) -> Iterator[Tuple[int, str, object]]:
+    """(column number, kind, value) of the filled cells of a row; shared strings are left as their index"""
+    for col, attributes, inner in row_cells(row_xml):
+        kind = CELL_TYPE.search(attributes)
+        kind = kind.group(1).decode() if kind else "n"
+        if kind == "inlineStr":
+            yield col, "text", "".join(unescape_xml(t) for t in INLINE_TEXT.findall(inner))
+            continue
+        value = VALUE.search(inner)
+        if value is None:
+            continue
+        raw = value.group(1)
+        if kind == "s":
+            yield col, "shared", int(raw)
+        elif kind in ("str", "d"):
+            yield col, "text", unescape_xml(raw)
+        elif kind == "b":
+            yield col, "bool", raw == b"1"
+        elif kind == "n":
+            style = CELL_STYLE.search(attributes)
+            yield col, "date" if style and int(style.group(1)) in date_styles else "number", float(raw)
+
+def read_sample(file_path: str, region: Dict, columns: Dict[int, str], rows: int = SAMPLE_ROWS, plan: Optional[List[Tuple[int, int]]] = None) -> pd.DataFrame:
+    """The rows of a stratified sample of one table, read straight from the sheet XML. The index holds the Excel row numbers.
+    attrs records the table size and the plan, which profile_table turns into error bounds."""
+    data_start = region["first_row"] + region["header_rows"]
+    plan = plan or sample_plan(data_start, region["last_row"], rows)
+    records, index, wanted, kinds = [], [], set(), {}
+    with zipfile.ZipFile(file_path) as archive:
+        date_styles = _date_styles(archive)
+        with archive.open(_sheet_paths(archive)[region["sheet"]]) as stream:
+            for row, row_xml in RowReader(stream).rows(plan):
+                record = {}
+                for col, kind, value in _cells(row_xml, date_styles):
+                    if region["first_col"] <= col <= region["last_col"]:
+                        record[col] = value
+                        if kind == "shared":
+                            wanted.add(value)
+                            record[col] = ("s", value)
+                        kinds.setdefault(col, set()).add(kind)
+                records.append(record)
+                index.append(row)
+        strings = _shared_strings(archive, wanted)
+    cols = list(range(region["first_col"], region["last_col"] + 1))
+    df = pd.DataFrame.from_records(records, index=index, columns=cols)
+    for col in cols:
+        series = df[col]
+        if series.map(lambda v: isinstance(v, tuple)).any():
+            df[col] = series.map(lambda v: strings.get(v[1], "") if isinstance(v, tuple) else v)
+        elif kinds.get(col) == {"date"}:
+            # Serials are fractions of a day: round away the float noise, as Excel's display does
+            df[col] = pd.to_datetime(series.astype(float), unit="D", origin="1899-12-30").dt.round("ms")
+        elif kinds.get(col) == {"number"}:
+            values = series.dropna()
+            if len(values) and (values == values.round()).all() and values.abs().max() < 2 ** 53:
+                df[col] = series.astype("int64") if len(values) == len(series) else series.astype("Int64")
+    df = df.infer_objects()
+    df.columns = [columns.get(col, str(col)) for col in cols]
+    df.index.name = "excel_row"
+    sampled = sum(end - start + 1 for start, end in plan)
+    df.attrs.update(sampled=sampled < region["data_rows"], total_rows=region["data_rows"], plan=plan,
+                    sheet=region["sheet"], range=region["range"], title=region.get("title"))
+    return df
+
+def _kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return "bool"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "date"
+    if pd.api.types.is_numeric_dtype(series):
+        return "number"
+    return "text"
+
+class ColumnSketch:
+    """Running sketches of one column: fed chunk by chunk and mergeable, so the same code serves a sample,
+    a full scan or several workers"""
+    def __init__(self, name: str, kind: str, seed: int = SAMPLE_SEED):
+        self.name, self.kind = name, kind
+        self.rows, self.nulls, self.negatives = 0, 0, 0
+        self.distinct = HyperLogLog()
+        self.digest = TDigest() if kind in ("number", "date") else None
+        self.seed = seed
+
+    def add(self, series: pd.Series):
+        self.rows += len(series)
+        self.nulls += int(series.isna().sum())
+        self.distinct.add(series)
+        if self.digest is not None:
+            values = series.dropna()
+            numbers = values.astype("int64").to_numpy() / 86400e9 if self.kind == "date" else values.to_numpy(dtype=float)
+            self.digest.add(numbers)
+            if self.kind == "number":
+                self.negatives += int((numbers < 0).sum())
+
+    def merge(self, other: "ColumnSketch"):
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.negatives += other.negatives
+        self.distinct.merge(other.distinct)
+        if self.digest is not None and other.digest is not None:
+            self.digest.merge(other.digest)
+
+def _block_ids(df: pd.DataFrame) -> np.ndarray:
+    """Block of the sample plan each row was read from. The rows of a block are contiguous, so they are one cluster
+    rather than independent draws; without a plan every row is its own block."""
+    plan = df.attrs.get("plan")
+    if not plan or df.index.name != "excel_row":
+        return np.arange(len(df))
+    return np.searchsorted([start for start, _ in plan], df.index.to_numpy(), side="right") - 1
+
+def _cluster_variance(sums: np.ndarray, sizes: np.ndarray) -> Tuple[float, int]:
+    """Variance of the ratio estimate sum(sums) / sum(sizes) over a sample of blocks, and the number of blocks it rests on"""
+    keep = sizes > 0
+    sums, sizes = sums[keep], sizes[keep]
+    k = len(sizes)
+    if k < 2:
+        return math.nan, k
+    ratio = sums.sum() / sizes.sum()
+    residuals = (sums - ratio * sizes) / sizes.mean()
+    return float((residuals ** 2).sum() / (k * (k - 1))), k
+
+def _cluster_interval(hits: np.ndarray, sizes: np.ndarray) -> List[float]:
+    """Wilson interval on the effective sample size: the rows divided by the design effect of the blocks, which puts it
+    between the number of blocks (rows of a block all alike) and the number of rows (no block effect). With no spread to
+    measure (no hit, or only hits) the blocks alone count."""
+    n = sizes.sum()
+    if n == 0:
+        return [0.0, 1.0]
+    rate = hits.sum() / n
+    variance, k = _cluster_variance(hits, sizes)
+    srs = rate * (1 - rate) / n
+    if math.isnan(variance) or srs == 0:
+        effective = max(k, 1)
+    else:
+        effective = n if variance == 0 else min(n, max(k, srs / variance * n))
+    return proportion_interval(rate * effective, effective)
+
+def _scaled(rate: float, interval: List[float], total: int) -> Dict:
+    return {"estimate": round(rate * total), "bounds": [math.floor(interval[0] * total), math.ceil(interval[1] * total)]}
+
+def _value(x: float, kind: str):
+    if x is None:
+        return None
+    return str(pd.Timestamp(x * 86400e9)) if kind == "date" else round(x, 6)
+
+def profile_table(df: pd.DataFrame, total_rows: Optional[int] = None, exact: bool = False, chunk_rows: int = 20000) -> Dict:
+    """Column profiles of a table. On a sample, every figure comes with its 95% bounds for the whole table: counts and
+    rates from Wilson intervals and means from the spread between blocks (a block of contiguous rows is one cluster, so the
+    effective sample size lies between the blocks and the rows), quantiles with the DKW rank error over the blocks,
+    distinct counts from HyperLogLog plus the unseen rows.
+    exact=True profiles the frame as the whole table (no extrapolation) with pandas' exact statistics."""
+    total = total_rows or df.attrs.get("total_rows") or len(df)
+    n = len(df)
+    sampled = not exact and n < total
+    sketches = [ColumnSketch(str(c), _kind(df[c])) for c in df.columns]
+    for start in range(0, n, chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        for i, sketch in enumerate(sketches):
+            sketch.add(chunk.iloc[:, i])
+    # Sampled frames are indexed by Excel row; read_tables frames count from their first data row
+    offset = 0 if df.index.name == "excel_row" else df.attrs.get("first_data_row", 2)
+    blocks = _block_ids(df) if sampled else None
+    columns = [_column_profile(df.iloc[:, i], sketch, n, total, sampled, exact, offset, blocks) for i, sketch in enumerate(sketches)]
+    return {
+        "rows": total, "profiled_rows": n, "mode": "sampled" if sampled else "exact",
+        "method": "stratified blocks" if sampled else "full table", "confidence": CONFIDENCE if sampled else 1.0,
+        "blocks": len(df.attrs.get("plan", [])) if sampled else None, "columns": columns
+    }
+
+def _column_profile(series: pd.Series, sketch: ColumnSketch, n: int, total: int, sampled: bool, exact: bool, offset: int,
+                    blocks: Optional[np.ndarray] = None) -> Dict:
+    kind = sketch.kind
+    null_rate = sketch.nulls / n if n else 0.0
+    profile = {"column": sketch.name, "kind": kind, "dtype": str(series.dtype)}
+    filled = series.notna().to_numpy()
+    if sampled:
+        # Per-block counts: the intervals are those of a cluster sample
+        def count(weights: Optional[np.ndarray], rows: Optional[np.ndarray] = None) -> np.ndarray:
+            return np.bincount(blocks if rows is None else blocks[rows], weights=weights, minlength=blocks.max() + 1)
+        sizes = count(None)
+        interval = _cluster_interval(count(~filled), sizes)
+        profile["nulls"] = _scaled(null_rate, interval, total)
+        profile["null_pct"] = {"estimate": round(100 * null_rate, 2), "bounds": [round(100 * interval[0], 2), round(100 * interval[1], 2)]}
+        profile["distinct"] = distinct_bounds(sketch.distinct.estimate(), n - sketch.nulls, total - round(null_rate * total), sketch.distinct.relative_error)
+    else:
+        profile["nulls"] = {"estimate": sketch.nulls, "bounds": [sketch.nulls, sketch.nulls]}
+        profile["null_pct"] = {"estimate": round(100 * null_rate, 2), "bounds": [round(100 * null_rate, 2)] * 2}
+        distinct = int(series.nunique()) if exact else round(sketch.distinct.estimate())
+        profile["distinct"] = {"estimate": distinct, "bounds": [distinct, distinct] if exact else
+                               [round(distinct * (1 - 2 * sketch.distinct.relative_error)), round(distinct * (1 + 2 * sketch.distinct.relative_error))]}
+    digest = sketch.digest
+    if digest is None or digest.count == 0:
+        return profile
+
+    values = series.dropna()
+    numbers = values.astype("int64") / 86400e9 if kind == "date" else values.astype(float)
+    if exact:
+        quantiles = {q: float(numbers.quantile(q)) for q in QUANTILES}
+    else:
+        quantiles = {q: digest.quantile(q) for q in QUANTILES}
+    if sampled:
+        # Extremes of the sample only: nothing bounds how far the table's own minimum and maximum lie beyond them
+        profile["sample_min"], profile["sample_max"] = _value(digest.min, kind), _value(digest.max, kind)
+        profile["range_note"] = "min and max of the sampled rows, the table's are unbounded (exact=True reads them)"
+    else:
+        profile["min"], profile["max"] = _value(digest.min, kind), _value(digest.max, kind)
+    profile["quantiles"] = {f"p{int(q * 100)}": _value(v, kind) for q, v in quantiles.items()}
+    if sampled:
+        variance, clusters = _cluster_variance(count(numbers.to_numpy(), filled), count(None, filled))
+        # Each quantile is the true quantile of some rank within q ± rank_error; the blocks, not the rows, are the draws
+        profile["quantile_rank_error"] = round(rank_error(clusters, CONFIDENCE), 5)
+    if kind == "number":
+        std = digest.std or 0.0
+        margin = 1.96 * (std if math.isnan(variance) else math.sqrt(variance)) if sampled else 0.0
+        profile["mean"] = {"estimate": round(digest.mean, 6), "bounds": [round(digest.mean - margin, 6), round(digest.mean + margin, 6)]}
+        rate = sketch.negatives / n
+        if sampled:
+            profile["negatives"] = _scaled(rate, _cluster_interval(count(numbers.to_numpy() < 0, filled), sizes), total)
+        else:
+            profile["negatives"] = {"estimate": sketch.negatives, "bounds": [sketch.negatives] * 2}
+
+    # IQR outliers: fences from the quantiles, a few example rows kept by a reservoir
+    q1, q3 = quantiles[0.25], quantiles[0.75]
+    low, high = q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)
+    out_of_fences = ((numbers < low) | (numbers > high)).to_numpy()
+    outside = numbers[out_of_fences]
+    examples = Reservoir(k=20, seed=sketch.seed)
+    examples.add(zip((i + offset for i in outside.index.tolist()), outside.tolist()))
+    rate = len(outside) / n
+    profile["outliers"] = {
+        "fences": [_value(low, kind), _value(high, kind)],
+        "count": _scaled(rate, _cluster_interval(count(out_of_fences, filled), sizes), total) if sampled else
+                 {"estimate": len(outside), "bounds": [len(outside)] * 2},
+        "examples": [{"row": row, "value": _value(v, kind)} for row, v in sorted(examples.items)]
+    }
+    return profile
+
+def sampling_summary(file_path: str) -> str:
+    """One line per table that is profiled on a sample, for agent prompts; empty when every table is read in full"""
+    index = get_regions(file_path) if Path(file_path).exists() else None
+    lines = []
+    for sheet, info in (index or {"sheets": {}})["sheets"].items():
+        for region in info["regions"]:
+            if is_large(region):
+                label = sheet if len(info["regions"]) == 1 else f"{sheet}!{region['range']}"
+                lines.append(f"- {label}: {region['data_rows']} rows, profiled on {min(SAMPLE_ROWS, region['data_rows'])} sampled rows")
+    return "\n".join(lines)
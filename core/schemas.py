@@ -0,0 +1,105 @@
+import os, re, json, time, shutil, hashlib
+from pathlib import Path
+from typing import Dict, Optional
+from core.paths import schema_cache_path, column_index_path, profiler_notes_path
+from core.config import SCHEMA_CACHE
+from core.artifacts import register_artifact
+
+RANGE_LABEL = re.compile(r"^(.*)!\$?[A-Z]+\$?\d+:\$?[A-Z]+\$?\d+$")
+
+def workbook_schema(index_path=column_index_path) -> Dict:
+    """Layout of a workbook from its column index (the profiles excel_structure_parser draws its columns from, before
+    it trims wide sheets): each table's sheet, position in the sheet, column labels and column kinds. Titles, ranges and
+    row counts are left out, they change from one month to the next while the layout does not."""
+    with open(index_path, "r", encoding="utf-8") as f:
+        profiles = json.load(f)["columns"]
+    tables, order = {}, []
+    for p in profiles:
+        if p["sheet"] not in tables:
+            tables[p["sheet"]] = []
+            order.append(p["sheet"])
+        # A column that is empty this month says nothing about its type: "empty" matches any kind (see same_layout)
+        tables[p["sheet"]].append([p["column"].strip(), "empty" if p["null_pct"] >= 100 else p["kind"]])
+    schema, seen = [], {}
+    for label in order:
+        match = RANGE_LABEL.match(label)
+        sheet = match.group(1) if match else label
+        seen[sheet] = seen.get(sheet, 0) + 1
+        schema.append({"sheet": sheet, "table": seen[sheet], "columns": tables[label]})
+    return {"tables": schema}
+
+def schema_fingerprint(schema: Dict) -> str:
+    """Hash of the tables and their column labels. Kinds are left out, so that a column empty this month still finds the
+    layout: same_layout compares them on lookup."""
+    labels = [{"sheet": t["sheet"], "table": t["table"], "columns": [label for label, _ in t["columns"]]} for t in schema["tables"]]
+    return hashlib.sha256(json.dumps(labels, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def same_layout(saved: Dict, schema: Dict) -> bool:
+    """Whether two schemas with the same fingerprint also agree on the column kinds, an empty column matching any kind"""
+    kinds = lambda s: [kind for t in s["tables"] for _, kind in t["columns"]]
+    before, after = kinds(saved), kinds(schema)
+    return len(before) == len(after) and all(a == b or "empty" in (a, b) for a, b in zip(before, after))
+
+class SchemaStore:
+    """Profiler notes of past workbooks keyed by their layout fingerprint, so a workbook with a known layout (same report
+    every month, new numbers) reuses the column semantics instead of having them rediscovered by the profiler"""
+    def __init__(self, root: Path = schema_cache_path):
+        self.root = Path(root)
+
+    def lookup(self, fingerprint: str) -> Optional[Dict]:
+        meta = self.root / fingerprint / "schema.json"
+        if not meta.exists() or not (self.root / fingerprint / "context_notes.txt").exists():
+            return None
+        with open(meta, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def restore(self, fingerprint: str, target: Path = profiler_notes_path) -> Dict:
+        meta = self.lookup(fingerprint)
+        shutil.copyfile(self.root / fingerprint / "context_notes.txt", target)
+        meta.update(uses=meta.get("uses", 0) + 1, last_used=time.time())
+        self._save_meta(fingerprint, meta)
+        return meta
+
+    def remember(self, fingerprint: str, schema: Dict, notes: Path = profiler_notes_path, source: Optional[str] = None) -> bool:
+        """Store the notes of a completed preprocessing. Notes that were themselves reused are not stored again."""
+        if not Path(notes).is_file() or Path(notes).stat().st_size == 0:
+            return False
+        folder = self.root / fingerprint
+        folder.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(notes, folder / "context_notes.txt")
+        self._save_meta(fingerprint, {"fingerprint": fingerprint, "schema": schema, "source": source, "saved_at": time.time(), "uses": 0})
+        return True
+
+    def _save_meta(self, fingerprint: str, meta: Dict):
+        path = self.root / fingerprint / "schema.json"
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+
+_store = None
+
+def schema_store() -> SchemaStore:
+    global _store
+    if _store is None:
+        _store = SchemaStore()
+    return _store
+
+def match_schema(index_path=column_index_path, notes_path=profiler_notes_path) -> Dict:
+    """Look the workbook layout up and restore the profiler notes of a workbook with the same layout.
+    status is "matched" (notes restored, semantic profiling can be skipped), "new" or "disabled"."""
+    if not SCHEMA_CACHE or not Path(index_path).exists():
+        return {"status": "disabled"}
+    schema = workbook_schema(index_path)
+    fingerprint = schema_fingerprint(schema)
+    saved = schema_store().lookup(fingerprint)
+    if saved is None or not same_layout(saved["schema"], schema):
+        return {"status": "new", "fingerprint": fingerprint, "schema": schema}
+    meta = schema_store().restore(fingerprint, notes_path)
+    register_artifact(notes_path, step="schema")
+    return {"status": "matched", "fingerprint": fingerprint, "schema": schema, "source": meta.get("source"), "uses": meta["uses"]}
+
+def remember_schema(match: Dict, notes_path=profiler_notes_path, source: Optional[str] = None) -> bool:
+    if match.get("status") != "new":
+        return False
+    return schema_store().remember(match["fingerprint"], match["schema"], notes_path, source)
@@ -0,0 +1,164 @@
+import os, sys, json, time, shutil, hashlib, zipfile, threading, subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+from core.paths import BASE_DIR, script_library_path, scripts_path, column_index_path, cleaned_excel, queries_path, plot_output_path, repo_path
+from core.config import SCRIPT_LIBRARY, SCRIPT_REPLAY_TIMEOUT
+from core.text_index import tokenize
+from core.schemas import workbook_schema, schema_fingerprint
+
+# Where each script-writing agent leaves its outputs; a replay is only accepted when it writes there again
+OUTPUTS = {"cleaner": cleaned_excel, "filter": queries_path, "plot": plot_output_path}
+STOPWORDS = {"the", "a", "an", "of", "to", "in", "on", "for", "and", "with", "by", "from", "please", "me", "my", "file", "excel", "data",
+             "le", "la", "les", "de", "des", "du", "et", "un", "une", "en", "par", "pour", "sur", "dans"}
+# Token overlap above which a stored script is offered to the agent as a starting point
+SIMILAR_TASK = 0.6
+# Stored scripts that fail validation this many times in a row are dropped
+MAX_FAILURES = 2
+
+def task_tokens(task: str) -> List[str]:
+    """Normalized task words: accents, case, punctuation and filler words removed, numbers kept ('top 10' is not 'top 5')"""
+    return [t for t in tokenize(task) if t not in STOPWORDS]
+
+def current_schema() -> Optional[str]:
+    return schema_fingerprint(workbook_schema(column_index_path)) if column_index_path.exists() else None
+
+def _outputs_since(output: Path, started: float) -> List[Path]:
+    files = [output] if output.is_file() else (output.rglob("*") if output.is_dir() else [])
+    return [f for f in files if f.is_file() and f.stat().st_mtime >= started and f.stat().st_size > 0]
+
+def _final_script(agent: str, started: float) -> Optional[Path]:
+    """The script of a step worth keeping: among those written during the step, the last one that names the agent's
+    output location (the others are usually exploration), else the last one"""
+    written = sorted((p for p in scripts_path.glob("*.py") if p.stat().st_mtime >= started), key=lambda p: p.stat().st_mtime)
+    if not written:
+        return None
+    target = OUTPUTS[agent].name
+    naming = [p for p in written if target in p.read_text(encoding="utf-8", errors="ignore")]
+    return (naming or written)[-1]
+
+class ScriptLibrary:
+    """Scripts that completed a cleaner, filter or plot task, indexed by workbook layout and normalized task.
+    A task seen before on the same layout replays its script (checked by running it and finding fresh outputs)
+    instead of generating code again; a similar task gets the stored script offered as a starting point."""
+    def __init__(self, root: Path = script_library_path):
+        self.root = Path(root)
+        self.index_path = self.root / "index.json"
+        self._lock = threading.Lock()
+
+    def _load(self) -> List[Dict]:
+        if not self.index_path.exists():
+            return []
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            return json.load(f)["scripts"]
+
+    def _save(self, entries: List[Dict]):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"scripts": entries}, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    def lookup(self, agent: str, task: str, schema: Optional[str] = None) -> Dict:
+        """{"exact": entry or None, "similar": [entries]} for a task on the current layout"""
+        schema = schema or current_schema()
+        tokens = task_tokens(task)
+        exact, similar = None, []
+        for entry in self._load():
+            if entry["agent"] != agent or entry["schema"] != schema:
+                continue
+            if entry["tokens"] == tokens:
+                exact = entry
+                continue
+            union = set(entry["tokens"]) | set(tokens)
+            overlap = len(set(entry["tokens"]) & set(tokens)) / len(union) if union else 0
+            if overlap >= SIMILAR_TASK:
+                similar.append({**entry, "overlap": round(overlap, 2)})
+        return {"exact": exact, "similar": sorted(similar, key=lambda e: -e["overlap"])[:3]}
+
+    def record(self, agent: str, task: str, started: float) -> Optional[Dict]:
+        """Keep the script of a step that succeeded and wrote its outputs"""
+        if agent not in OUTPUTS:
+            return None
+        script = _final_script(agent, started)
+        outputs = _outputs_since(OUTPUTS[agent], started)
+        schema = current_schema()
+        if script is None or not outputs or schema is None:
+            return None
+        code = script.read_text(encoding="utf-8")
+        digest = hashlib.sha256(code.encode("utf-8")).hexdigest()
+        tokens = task_tokens(task)
+        with self._lock:
+            same_task = [e for e in self._load() if e["agent"] == agent and e["schema"] == schema and e["tokens"] == tokens]
+            if same_task and same_task[0]["id"] == digest[:16]:
+                # A replay of the stored script: nothing new to keep
+                return same_task[0]
+            entries = [e for e in self._load() if e not in same_task]
+            (self.root / "scripts").mkdir(parents=True, exist_ok=True)
+            (self.root / "scripts" / f"{digest}.py").write_text(code, encoding="utf-8")
+            entry = {
+                "id": digest[:16], "agent": agent, "schema": schema, "task": task, "tokens": tokens,
+                "script": f"scripts/{digest}.py", "name": script.name, "created": time.time(), "uses": 0, "failures": 0,
+                "outputs": [p.relative_to(repo_path).as_posix() for p in outputs]
+            }
+            entries.append(entry)
+            self._save(entries)
+        return entry
+
+    def _update(self, entry_id: str, **changes):
+        with self._lock:
+            entries = self._load()
+            for e in entries:
+                if e["id"] == entry_id:
+                    e.update(changes)
+            self._save([e for e in entries if e["failures"] < MAX_FAILURES])
+
+    def replay(self, agent: str, task: str) -> Optional[Dict]:
+        """Run the stored script of the same task on the same layout. It counts as a success only when it exits cleanly
+        within the timeout and writes fresh, non-empty outputs where the agent would have; otherwise None and the
+        agent generates code as usual."""
+        if not SCRIPT_LIBRARY or agent not in OUTPUTS:
+            return None
+        entry = self.lookup(agent, task)["exact"]
+        if entry is None:
+            return None
+        scripts_path.mkdir(parents=True, exist_ok=True)
+        script = scripts_path / entry["name"]
+        shutil.copyfile(self.root / entry["script"], script)
+        started = time.time()
+        try:
+            # Generated scripts run in the server's working directory and import the core package, so do the same here
+            env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(BASE_DIR), os.environ.get("PYTHONPATH")]))}
+            result = subprocess.run([sys.executable, str(script)], cwd=os.getcwd(), env=env, capture_output=True, text=True, timeout=SCRIPT_REPLAY_TIMEOUT)
+            ok, error = result.returncode == 0, result.stderr[-500:]
+        except subprocess.TimeoutExpired:
+            ok, error = False, f"timed out after {SCRIPT_REPLAY_TIMEOUT}s"
+        outputs = _outputs_since(OUTPUTS[agent], started) if ok else []
+        written = {p.relative_to(repo_path).as_posix() for p in outputs}
+        missing = [o for o in entry["outputs"] if o not in written]
+        broken = [p.name for p in outputs if p.suffix.lower() in (".xlsx", ".xlsm") and not zipfile.is_zipfile(p)]
+        if not ok or missing or broken:
+            error = error if not ok else f"missing outputs {missing}" if missing else f"unreadable outputs {broken}"
+            self._update(entry["id"], failures=entry["failures"] + 1, last_error=error)
+            return None
+        self._update(entry["id"], uses=entry["uses"] + 1, failures=0, last_used=time.time())
+        return {"id": entry["id"], "task": entry["task"], "script": str(script), "outputs": [str(p) for p in outputs],
+                "seconds": round(time.time() - started, 2)}
+
+    def hint(self, agent: str, task: str) -> str:
+        """Prompt lines pointing the agent at verified scripts of similar tasks on the same layout"""
+        if not SCRIPT_LIBRARY or not column_index_path.exists():
+            return ""
+        similar = self.lookup(agent, task)["similar"]
+        if not similar:
+            return ""
+        lines = [f"- '{e['task']}': {self.root / e['script']}" for e in similar]
+        return ("## Verified scripts for similar tasks on this workbook layout (they ran and produced their outputs):\n" + "\n".join(lines) +
+                "\nRead the closest one with read_file_utf8 and adapt it rather than writing a script from scratch.")
+
+_library = None
+
+def script_library() -> ScriptLibrary:
+    global _library
+    if _library is None:
+        _library = ScriptLibrary()
+    return _library
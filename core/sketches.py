@@ -0,0 +1,163 @@
+import math
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+class HyperLogLog:
+    """Distinct-count sketch: 2^p one-byte registers whatever the number of values, relative error about 1.04 / sqrt(2^p).
+    Sketches of different chunks merge by taking the register-wise maximum."""
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    def add(self, values: pd.Series):
+        values = values.dropna()
+        if values.empty:
+            return
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy(dtype=np.uint64)
+        index = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.p)) - 1)
+        # Position of the first set bit of the remaining 64-p bits (they fit a float64 mantissa exactly when p >= 11)
+        bit_length = np.frexp(rest.astype(np.float64))[1]
+        rank = (64 - self.p - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+
+    def merge(self, other: "HyperLogLog"):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(self.m)
+
+    def estimate(self) -> float:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        raw = alpha * self.m ** 2 / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * self.m and zeros:
+            # Small cardinalities: linear counting is exact enough and unbiased
+            return self.m * math.log(self.m / zeros)
+        return float(raw)
+
+class TDigest:
+    """Quantile sketch (merging t-digest): centroids are small at the tails and larger in the middle, so extreme quantiles
+    stay accurate with a few hundred centroids. Batches are added with numpy and the digest is recompressed once per batch."""
+    def __init__(self, compression: float = 400):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.count, self.total, self.total_sq = 0, 0.0, 0.0
+        self.min, self.max = math.inf, -math.inf
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if values.size == 0:
+            return
+        self.count += values.size
+        self.total += float(values.sum())
+        self.total_sq += float(np.square(values).sum())
+        self.min, self.max = min(self.min, float(values.min())), max(self.max, float(values.max()))
+        self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(values.size)]))
+
+    def merge(self, other: "TDigest"):
+        if other.count == 0:
+            return
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        cumulative = np.cumsum(weights)
+        q = cumulative / cumulative[-1]
+        # k1 scale function: each centroid spans at most one unit of k
+        k = self.compression / (2 * math.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1))
+        groups = np.floor(k - k[0]).astype(np.int64)
+        groups = np.unique(groups, return_inverse=True)[1]
+        merged_weights = np.bincount(groups, weights=weights)
+        self.means = np.bincount(groups, weights=means * weights) / merged_weights
+        self.weights = merged_weights
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        centers = np.cumsum(self.weights) - self.weights / 2
+        points = np.concatenate([[0], centers, [self.count]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(q * self.count, points, values))
+
+    def cdf(self, x: float) -> float:
+        if self.count == 0:
+            return 0.0
+        centers = np.cumsum(self.weights) - self.weights / 2
+        points = np.concatenate([[0], centers, [self.count]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(x, values, points) / self.count)
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    @property
+    def std(self) -> Optional[float]:
+        if self.count < 2:
+            return None
+        variance = (self.total_sq - self.total ** 2 / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+class Reservoir:
+    """Uniform sample of at most k items from a stream of unknown length (algorithm R); used to keep a few example rows
+    of each anomaly without storing all of them"""
+    def __init__(self, k: int = 20, seed: int = 0):
+        self.k = k
+        self.items: List = []
+        self.seen = 0
+        self._rng = np.random.default_rng(seed)
+
+    def add(self, items):
+        for item in items:
+            self.seen += 1
+            if len(self.items) < self.k:
+                self.items.append(item)
+            else:
+                j = int(self._rng.integers(0, self.seen))
+                if j < self.k:
+                    self.items[j] = item
+
+    def merge(self, other: "Reservoir"):
+        # Weighted by how many items each side has seen, so the merged sample stays uniform
+        pool = [(item, self.seen) for item in self.items] + [(item, other.seen) for item in other.items]
+        total = self.seen + other.seen
+        if len(pool) > self.k:
+            weights = np.array([w for _, w in pool], dtype=float)
+            chosen = self._rng.choice(len(pool), size=self.k, replace=False, p=weights / weights.sum())
+            pool = [pool[i] for i in sorted(chosen)]
+        self.items, self.seen = [item for item, _ in pool], total
+
+def proportion_interval(hits: int, n: int, z: float = 1.96) -> List[float]:
+    """Wilson score interval for a proportion measured on n sampled rows"""
+    if n == 0:
+        return [0.0, 1.0]
+    p = hits / n
+    denominator = 1 + z ** 2 / n
+    center = (p + z ** 2 / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z ** 2 / (4 * n ** 2)) / denominator
+    return [max(0.0, center - margin), min(1.0, center + margin)]
+
+def rank_error(n: int, confidence: float = 0.95) -> float:
+    """Dvoretzky-Kiefer-Wolfowitz bound: every sampled quantile is within this rank distance of the true one"""
+    return math.sqrt(math.log(2 / (1 - confidence)) / (2 * n)) if n else 1.0
+
+def distinct_bounds(sample_distinct: float, sampled: int, total: int, relative_error: float) -> Dict:
+    """Population distinct count from the distinct count of a sample. The bounds always hold (the population has at least
+    the values seen and at most one new value per unseen row); the point estimate assumes a near-unique column keeps
+    growing with the rows and a saturated one (few repeated codes) does not."""
+    low = sample_distinct * (1 - 2 * relative_error)
+    high = min(total, sample_distinct * (1 + 2 * relative_error) + (total - sampled))
+    ratio = sample_distinct / sampled if sampled else 0
+    estimate = sample_distinct * total / sampled if ratio > 0.5 and sampled else sample_distinct
+    return {"estimate": round(min(max(estimate, low), high)), "bounds": [round(max(low, 0)), round(high)]}
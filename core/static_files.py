@@ -0,0 +1,88 @@
+import re, gzip, hashlib, mimetypes, threading, logging
+from pathlib import Path
+from typing import Dict, Optional
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger("peaqock_api")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+COMPRESSIBLE = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+def accepted_encoding(accept_encoding: str, available) -> str:
+    """Best content coding the client accepts among the precomputed ones (br, then gzip), honouring q=0"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = re.search(r"q=([0-9.]+)", params)
+        accepted[name.strip().lower()] = float(q.group(1)) if q else 1.0
+    for encoding in ("br", "gzip"):
+        if encoding in available and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+class CompressedAsset:
+    """A file held in memory with its precomputed gzip/brotli variants and one strong ETag per variant"""
+    def __init__(self, content: bytes, media_type: str, mtime: Optional[float] = None):
+        self.media_type = media_type
+        self.mtime = mtime
+        self.digest = hashlib.sha256(content).hexdigest()
+        self.variants = {"identity": content}
+        if media_type.startswith(COMPRESSIBLE) and len(content) > 1024:
+            candidates = {"gzip": gzip.compress(content, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                # Maximum quality takes seconds on multi-megabyte bundles such as plotly.js
+                candidates["br"] = brotli.compress(content, quality=11 if len(content) < 1_000_000 else 9)
+            self.variants.update({k: v for k, v in candidates.items() if len(v) < len(content)})
+        self.etags = {encoding: f'"{self.digest[:32]}{"" if encoding == "identity" else "-" + encoding}"' for encoding in self.variants}
+
+    def response(self, request: Request, cache_control: str = REVALIDATE_CACHE, headers: Optional[Dict] = None) -> Response:
+        encoding = accepted_encoding(request.headers.get("accept-encoding", ""), self.variants)
+        headers = {**(headers or {}), "ETag": self.etags[encoding], "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        # Any variant's validator proves the client holds the current content
+        if_none_match = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+        if any(tag in if_none_match for tag in self.etags.values()):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.variants[encoding], media_type=self.media_type, headers=headers)
+
+class StaticCache:
+    """Static folder loaded once into memory, compressed ahead of time.
+    With reload=True (development) a file is re-read when its modification time changes."""
+    def __init__(self, root: Path, reload: bool = False):
+        self.root = Path(root)
+        self.reload = reload
+        self._assets = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def _read(self, path: Path) -> CompressedAsset:
+        media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        if media_type.startswith("text/"):
+            media_type += "; charset=utf-8"
+        return CompressedAsset(path.read_bytes(), media_type, path.stat().st_mtime)
+
+    def load(self):
+        with self._lock:
+            self._assets = {p.relative_to(self.root).as_posix(): self._read(p) for p in self.root.rglob("*") if p.is_file()} if self.root.exists() else {}
+        logger.info(f"Loaded {len(self._assets)} static files into memory")
+
+    def get(self, name: str) -> Optional[CompressedAsset]:
+        asset = self._assets.get(name)
+        if self.reload:
+            path = (self.root / name).resolve()
+            if path.is_relative_to(self.root.resolve()) and path.is_file() and (asset is None or path.stat().st_mtime != asset.mtime):
+                with self._lock:
+                    asset = self._assets[name] = self._read(path)
+        return asset
+
+    def response(self, request: Request, name: str) -> Optional[Response]:
+        asset = self.get(name)
+        if asset is None:
+            return None
+        return asset.response(request, REVALIDATE_CACHE)
@@ -0,0 +1,184 @@
+import os, re, pickle, bisect, unicodedata
+from datetime import date, datetime, time
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, List, Optional
+from core.paths import text_index_path
+from core.readers import read_tables
+
+# A posting packs (sheet, column, row) into one int64: rows fit in 20 bits and columns in 14 bits (Excel limits)
+ROW_BITS, COL_BITS = 20, 14
+TOKEN_PATTERN = r"\w+"
+_loaded = {}
+
+def normalize_text(text: str) -> str:
+    """Lowercase and strip accents so 'Équipe' and 'equipe' index the same way"""
+    text = unicodedata.normalize("NFKD", str(text))
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(TOKEN_PATTERN, normalize_text(text))
+
+def _cell_text(values: pd.Series) -> pd.Series:
+    """Searchable text of a column's non-empty cells: strings as they are, whole numbers (codes, invoice numbers,
+    years) and dates (YYYY-MM-DD, with the time when there is one). Amounts with decimals are not indexed."""
+    if pd.api.types.is_bool_dtype(values):
+        return values.iloc[:0].astype(str)
+    if pd.api.types.is_datetime64_any_dtype(values):
+        timed = values.dt.normalize() != values
+        return values.dt.strftime("%Y-%m-%d").where(~timed, values.dt.strftime("%Y-%m-%d %H:%M:%S"))
+    if pd.api.types.is_numeric_dtype(values):
+        numbers = values.astype(float)
+        whole = numbers[(numbers == np.floor(numbers)) & (numbers.abs() < 1e15)]
+        return whole.astype(np.int64).astype(str)
+
+    def text(value):
+        if isinstance(value, str):
+            return value
+        if isinstance(value, (bool, np.bool_)):
+            return None
+        if isinstance(value, (int, np.integer)) or (isinstance(value, (float, np.floating)) and float(value).is_integer() and abs(value) < 1e15):
+            return str(int(value))
+        if isinstance(value, (pd.Timestamp, datetime, date)):
+            return value.strftime("%Y-%m-%d %H:%M:%S" if isinstance(value, datetime) and value.time() != time() else "%Y-%m-%d")
+        return None
+    return values.map(text).dropna()
+
+def _pack(sheet_id: int, col_id: int, rows: np.ndarray) -> np.ndarray:
+    return (np.int64(sheet_id) << (ROW_BITS + COL_BITS)) | (np.int64(col_id) << ROW_BITS) | rows.astype(np.int64)
+
+def _unpack(key: int):
+    return key >> (ROW_BITS + COL_BITS), (key >> ROW_BITS) & ((1 << COL_BITS) - 1), key & ((1 << ROW_BITS) - 1)
+
+def _levenshtein(a: str, b: str, max_dist: int) -> int:
+    """Edit distance with early exit once every cell of a row exceeds max_dist"""
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > max_dist:
+            return max_dist + 1
+        previous = current
+    return previous[-1]
+
+class TextIndex:
+    """Inverted index from normalized tokens to the (sheet, row, column) cells that contain them.
+    A "sheet" is a table label from read_tables; first_rows holds the Excel row of each table's first data row."""
+    def __init__(self, file_path: str, sheets: List[str], columns: List[List[str]], postings: Dict[str, np.ndarray], first_rows: Optional[List[int]] = None):
+        self.file_path = file_path
+        self.sheets = sheets
+        self.first_rows = first_rows or [2] * len(sheets)
+        self.columns = columns
+        self.postings = postings
+        self.vocabulary = sorted(postings)
+        self._trigrams = None
+
+    @classmethod
+    def build(cls, file_path: str) -> "TextIndex":
+        sheets, columns, first_rows, chunks = [], [], [], {}
+        for sheet_id, (sheet_name, region, df) in enumerate(read_tables(file_path)):
+            sheets.append(sheet_name)
+            first_rows.append(region["first_row"] + region["header_rows"] if region else 2)
+            columns.append([str(c) for c in df.columns])
+            for col_id, col in enumerate(df.columns):
+                values = _cell_text(df[col].dropna())
+                if values.empty:
+                    continue
+                # Business columns repeat the same names and codes, so each distinct value is tokenized once
+                vocabulary = {value: tokenize(value) for value in values.unique()}
+                tokens = values.map(vocabulary).explode().dropna()
+                if tokens.empty:
+                    continue
+                keys = _pack(sheet_id, col_id, tokens.index.to_numpy())
+                for token, group in pd.Series(keys).groupby(tokens.to_numpy()):
+                    chunks.setdefault(token, []).append(group.to_numpy())
+        postings = {token: np.unique(np.concatenate(parts)) for token, parts in chunks.items()}
+        return cls(file_path, sheets, columns, postings, first_rows)
+
+    def save(self, path=text_index_path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump({"file_path": self.file_path, "sheets": self.sheets, "columns": self.columns, "postings": self.postings, "first_rows": self.first_rows}, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path=text_index_path) -> "TextIndex":
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        return cls(data["file_path"], data["sheets"], data["columns"], data["postings"], data.get("first_rows"))
+
+    def _prefix_terms(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        end = bisect.bisect_left(self.vocabulary, prefix + "\uffff")
+        return self.vocabulary[start:end]
+
+    def _fuzzy_terms(self, term: str, max_dist: int) -> List[str]:
+        # Candidates share at least one trigram with the term; only those pay for an edit distance
+        if self._trigrams is None:
+            self._trigrams = {}
+            for word in self.vocabulary:
+                padded = f"  {word} "
+                for i in range(len(padded) - 2):
+                    self._trigrams.setdefault(padded[i:i + 3], set()).add(word)
+        padded = f"  {term} "
+        candidates = set()
+        for i in range(len(padded) - 2):
+            candidates |= self._trigrams.get(padded[i:i + 3], set())
+        return [w for w in candidates if _levenshtein(term, w, max_dist) <= max_dist]
+
+    def _term_keys(self, term: str, mode: str, max_dist: int) -> np.ndarray:
+        if mode == "prefix":
+            terms = self._prefix_terms(term)
+        elif mode == "fuzzy":
+            terms = self._fuzzy_terms(term, max_dist)
+        else:
+            terms = [term] if term in self.postings else []
+        if not terms:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([self.postings[t] for t in terms]))
+
+    def search(self, query: str, mode: str = "exact", sheet: Optional[str] = None, column: Optional[str] = None, limit: int = 50, max_dist: int = 1) -> Dict:
+        """Find cells containing every token of the query; the last token is matched as a prefix in 'prefix' mode"""
+        terms = tokenize(query)
+        if not terms:
+            return {"query": query, "total_hits": 0, "hits": []}
+        keys = None
+        for i, term in enumerate(terms):
+            term_mode = mode if (mode != "prefix" or i == len(terms) - 1) else "exact"
+            term_keys = self._term_keys(term, term_mode, max_dist)
+            keys = term_keys if keys is None else np.intersect1d(keys, term_keys, assume_unique=True)
+            if keys.size == 0:
+                break
+
+        hits, rows_by_sheet = [], {}
+        for key in keys.tolist():
+            sheet_id, col_id, row = _unpack(key)
+            sheet_name, col_name = self.sheets[sheet_id], self.columns[sheet_id][col_id]
+            if (sheet and sheet_name != sheet) or (column and col_name != column):
+                continue
+            rows_by_sheet.setdefault(sheet_name, []).append(row)
+            if len(hits) < limit:
+                hits.append({"sheet": sheet_name, "row": row, "excel_row": row + self.first_rows[sheet_id], "column": col_name})
+        return {
+            "query": query, "mode": mode, "total_hits": sum(len(r) for r in rows_by_sheet.values()),
+            "hits": hits, "rows_by_sheet": {s: sorted(set(r)) for s, r in rows_by_sheet.items()}
+        }
+
+def build_text_index(file_path: str, output_path=text_index_path) -> Dict:
+    """Build the inverted index for a workbook and persist it next to the other preprocessing artifacts"""
+    index = TextIndex.build(str(file_path))
+    index.save(output_path)
+    _loaded.pop(str(output_path), None)
+    return {"success": True, "sheets": len(index.sheets), "terms": len(index.vocabulary), "index_path": str(output_path)}
+
+def get_text_index(path=text_index_path) -> TextIndex:
+    """Return the index from disk, reusing the in-process copy while the file is unchanged"""
+    mtime = os.path.getmtime(path)
+    cached = _loaded.get(str(path))
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, TextIndex.load(path))
+        _loaded[str(path)] = cached
+    return cached[1]
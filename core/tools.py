@@ -1,9 +1,24 @@
 from agno.tools import tool, Toolkit
-import json, subprocess, os, shutil, zipfile, requests, re
+import json, os, shutil, zipfile, re, hashlib
 import pandas as pd
+from functools import partial
 from typing import Dict
 from pathlib import Path
-from core.paths import repo_path, excel_path, tectonic_path
+from core.paths import repo_path, excel_path, text_index_path, column_index_path, formula_graph_path
+from core.text_index import build_text_index, get_text_index
+from core.column_index import build_column_index, get_column_index
+from core.config import COLUMN_TOP_K, COLUMN_TRIM_THRESHOLD, INCREMENTAL_ANALYSIS, MODEL_API_KEY
+from core.renderer import get_renderer
+from core.latex_tables import escape_text, render_table_fragment
+from core.report_builder import get_report_builder
+from core.artifacts import register_artifact, workspace_registry
+from core.readers import read_tables, read_region
+from core.regions import get_regions
+from core.sampling import profile_table
+from core.parallel import map_tables
+from core.revisions import analysis_cache
+from core.model_router import model_router
+from core.formulas import build_formula_graph, get_formula_graph, column_dependencies
 
 @tool(show_result=True)
 def read_file_utf8(file_name: str) -> str:
@@ -30,31 +45,56 @@ def save_file_utf8(file_name: str, contents: str) -> str:
         
         with open(file_path, 'w', encoding='utf-8') as f:
             f.write(contents)
+        register_artifact(file_path)
         return f"Successfully saved to {file_name}"
     except Exception as e:
         return f"Error saving file {file_name}: {e}"
 
-@tool(show_result=True)
-def initial_data_scout(file_path: str, output_path: str) -> str:
+def _scout_table(label: str, region, df: pd.DataFrame):
+    """Missing-data issues of one table, and its sampled profile when the table was read as a sample"""
+    issues = []
+    if df.attrs.get("sampled"):
+        profile = profile_table(df)
+        for c in profile["columns"]:
+            nulls = c["nulls"]
+            if nulls["estimate"] > 0:
+                issues.append({"column": c["column"], "issue_type": "Missing Data", "approximate": True, "estimate": nulls["estimate"], "bounds": nulls["bounds"],
+                               "details": f"Column '{c['column']}' contains about {nulls['estimate']} null values (95% bounds {nulls['bounds'][0]}-{nulls['bounds'][1]}, estimated from {profile['profiled_rows']} of {profile['rows']} rows)."})
+        return issues, profile
+    for col in df.columns:
+        nulls = int(df[col].isnull().sum())
+        if nulls > 0:
+            issues.append({"column": col, "issue_type": "Missing Data", "details": f"Column '{col}' contains {nulls} null values."})
+    return issues, None
+
+def scout_workbook(file_path: str, output_path: str, exact: bool = False) -> str:
+    """Report the missing data of every table. Tables above the large-data threshold are profiled on a stratified sample,
+    with 95% bounds, unless exact is True. Sheets are scouted in parallel."""
     try:
-        excel_file = pd.ExcelFile(file_path, engine='openpyxl')
-        report = {"file_path": file_path, "sheets": {}}
-        for sheet_name in excel_file.sheet_names:
-            df = pd.read_excel(excel_file, sheet_name=sheet_name)
-            sheet_issues = []
-            for col in df.columns:
-                if df[col].isnull().sum() > 0:
-                    sheet_issues.append({"column": col, "issue_type": "Missing Data", "details": f"Column '{col}' contains {df[col].isnull().sum()} null values."})
+        report = {"file_path": file_path, "mode": "exact", "sheets": {}, "sampling": {}}
+        for sheet_name, (sheet_issues, profile) in map_tables(file_path, _scout_table, sample=not exact, cache="scout"):
+            if profile:
+                report["mode"] = "sampled"
+                report["sampling"][sheet_name] = profile
             if sheet_issues:
                 report["sheets"][sheet_name] = sheet_issues
+        if not report["sampling"]:
+            del report["sampling"]
         
         with open(output_path, 'w', encoding='utf-8') as f:
             json.dump(report, f, indent=4, ensure_ascii=False)
+        register_artifact(output_path, step="scout")
         
-        return f"Initial inspection complete. Report saved to {output_path}"
+        return f"Initial inspection complete ({report['mode']}). Report saved to {output_path}"
     except Exception as e:
         return f"Error during initial data scout: {e}"
 
+@tool(show_result=True)
+def initial_data_scout(file_path: str, output_path: str, exact: bool = False) -> str:
+    """Report the missing data of every table. Tables above the large-data threshold are profiled on a stratified sample,
+    with 95% bounds, unless exact is True."""
+    return scout_workbook(file_path, output_path, exact)
+
 def _extract_charts(excel_file: str = None) -> Dict:
     """Extract charts using Spire.XLS"""
     try:
@@ -68,16 +108,18 @@ def _extract_charts(excel_file: str = None) -> Dict:
         chart_files = []
         chart_counter = 0
         
-        for sheet in workbook.Worksheets:
-            for i, chart in enumerate(sheet.Charts):
-                chart_counter += 1
-                chart_filename = f"chart{chart_counter}.png"
-                image_path = os.path.join(output_dir, chart_filename)
-                chart.SaveToImage(image_path)
-                chart_files.append({
-                    "filename": chart_filename, "path": image_path, "sheet": sheet.Name,
-                    "chart_index": i + 1, "global_chart_number": chart_counter
-                })
+        with workspace_registry().batch():
+            for sheet in workbook.Worksheets:
+                for i, chart in enumerate(sheet.Charts):
+                    chart_counter += 1
+                    chart_filename = f"chart{chart_counter}.png"
+                    image_path = os.path.join(output_dir, chart_filename)
+                    chart.SaveToImage(image_path)
+                    register_artifact(image_path, type="chart", step="extraction")
+                    chart_files.append({
+                        "filename": chart_filename, "path": image_path, "sheet": sheet.Name,
+                        "chart_index": i + 1, "global_chart_number": chart_counter
+                    })
         
         return {"success": True, "total_charts": len(chart_files), "charts": chart_files, "output_directory": str(output_dir), "method": "spire_xls_extraction"}
     except ImportError:
@@ -99,14 +141,16 @@ def _extract_images(excel_filepath: str = None) -> Dict:
             zip_ref.extractall(temp_dir)
         
         media_path = temp_dir / 'xl' / 'media'
-        if media_path.exists():
-            for i, filename in enumerate(os.listdir(media_path)):
+        media_files = sorted(os.listdir(media_path)) if media_path.exists() else []
+        with workspace_registry().batch():
+            for i, filename in enumerate(media_files):
                 if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
                     source_path = media_path / filename
                     file_extension = os.path.splitext(filename)[1]
                     new_filename = f"image{i+1}{file_extension}"
                     output_path = output_dir / new_filename
                     shutil.copy(source_path, output_path)
+                    register_artifact(output_path, type="image", step="extraction")
                     extracted_images.append({"filename": new_filename, "path": str(output_path), "original_name": filename})
         
         return {"success": True, "total_images": len(extracted_images), "images": extracted_images, "output_directory": str(output_dir)}
@@ -124,15 +168,23 @@ def _analyze_image(image_path: str) -> Dict:
             return {"error": f"Image file not found: {image_path}"}
         
         with open(image_path, "rb") as image_file:
-            image_data = base64.b64encode(image_file.read()).decode('utf-8')
-        
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
+            image_bytes = image_file.read()
+        # Charts and images that did not change since an earlier upload keep their analysis
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        cached = analysis_cache().media_analysis(digest) if INCREMENTAL_ANALYSIS else None
+        if cached:
+            return {**cached, "image_path": image_path, "file_size": len(image_bytes), "cached": True}
+        image_data = base64.b64encode(image_bytes).decode('utf-8')
+        
+        router = model_router()
+        api_key = MODEL_API_KEY or os.getenv("OPENAI_API_KEY")
+        if not api_key and not router.base_url:
             return {"error": "OpenAI API key not found"}
         
-        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key}"}
+        model = router.pick("vision")["model"]
+        headers = {"Content-Type": "application/json", "Authorization": f"Bearer {api_key or 'local'}", **router.headers("vision")}
         payload = {
-            "model": "gpt-4o",
+            "model": model,
             "messages": [{
                 "role": "user",
                 "content": [{
@@ -146,14 +198,18 @@ def _analyze_image(image_path: str) -> Dict:
             "max_tokens": 400
         }
         
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload, timeout=30)
+        # Through the agents' client: shares their rate limits and retries, and lands in the run trace
+        response = router.http_client().post(f"{router.base_url or 'https://api.openai.com/v1'}/chat/completions", headers=headers, json=payload, timeout=30)
         if response.status_code == 200:
             result = response.json()
-            return {
+            analysis = {
                 "image_path": image_path, "analysis_success": True,
                 "description": result['choices'][0]['message']['content'],
                 "file_size": os.path.getsize(image_path), "message": "Image analyzed successfully with vision AI"
             }
+            if INCREMENTAL_ANALYSIS:
+                analysis_cache().store_media_analysis(digest, analysis)
+            return analysis
         else:
             return {"error": f"API call failed: {response.status_code}", "analysis_success": False}
     except Exception as e:
@@ -187,14 +243,44 @@ def _save_to_media_json(data_type: str, data: Dict):
     
     with open(media_json_path, 'w', encoding='utf-8') as f:
         json.dump(media_data, f, indent=4, ensure_ascii=False)
+    register_artifact(media_json_path, step="extraction")
+
+def _relevant_columns(df: pd.DataFrame, sheet_name: str, file_path: str, task: str, top_k: int, sheet_result: Dict) -> pd.DataFrame:
+    """Restrict a sheet to its top-k columns for the task and note how many were left out"""
+    if not column_index_path.exists():
+        build_column_index(file_path)
+    names = {str(c): c for c in df.columns}
+    keep = [names[c["column"]] for c in get_column_index().select(task, top_k, sheet=sheet_name) if c["column"] in names]
+    if not keep or len(keep) >= len(df.columns):
+        return df
+    sheet_result["columns_shown"] = len(keep)
+    sheet_result["columns_omitted"] = len(df.columns) - len(keep)
+    sheet_result["note"] = "Only the most relevant columns are shown. Use find_relevant_columns or get_column_details to fetch more."
+    return df[keep]
+
+def _describe_table(sheet_name: str, region, df: pd.DataFrame, file_path: str, task: str, top_k: int) -> Dict:
+    sheet_result = {"shape": df.shape}
+    if region:
+        # Where the table really is, so generated scripts can read just that range
+        sheet_result.update(sheet=region["sheet"], range=region["range"], header_rows=region["header_rows"], title=region["title"])
+    if df.attrs.get("sampled"):
+        sheet_result.update(shape=(df.attrs["total_rows"], df.shape[1]), sampled_rows=len(df),
+                            note_sampling="Large table: described from a stratified sample. Use profile_table_columns for exact statistics.")
+    if task or top_k or len(df.columns) > COLUMN_TRIM_THRESHOLD:
+        df = _relevant_columns(df, sheet_name, file_path, task, top_k or COLUMN_TOP_K, sheet_result)
+    sheet_result.update({
+        "columns": list(df.columns),
+        "dtypes": df.dtypes.to_dict(), "sample_data": df.head(3).to_dict()
+    })
+    return sheet_result
 
 class ExcelParserTool(Toolkit):
     """Streamlined Excel parsing tool with chart/image extraction and AI analysis"""
     def __init__(self):
         super().__init__(name="excel_parser", tools=[self.excel_parser, self.extract_and_analyze_charts, self.extract_and_analyze_images])
 
-    def excel_parser(self, file_path: str = None) -> Dict:
-        """Parse Excel file structure and data"""
+    def excel_parser(self, file_path: str = None, task: str = None, top_k: int = None) -> Dict:
+        """Parse Excel file structure and data, keeping only the columns relevant to the task on wide sheets"""
         file_path = file_path or str(excel_path)
         results = {"file_path": file_path, "sheets": {}, "success": False, "errors": []}
         
@@ -203,13 +289,12 @@ class ExcelParserTool(Toolkit):
             return results
         
         try:
-            excel_file = pd.ExcelFile(file_path)
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                results["sheets"][sheet_name] = {
-                    "shape": df.shape, "columns": list(df.columns),
-                    "dtypes": df.dtypes.to_dict(), "sample_data": df.head(3).to_dict()
-                }
+            # Workers only read the column index: build it once here rather than in several processes at a time
+            if not column_index_path.exists():
+                build_column_index(file_path)
+            describe = partial(_describe_table, file_path=file_path, task=task, top_k=top_k)
+            for sheet_name, sheet_result in map_tables(file_path, describe, sample=True):
+                results["sheets"][sheet_name] = sheet_result
             results["success"] = True
         except Exception as e:
             results["errors"].append(str(e))
@@ -269,8 +354,67 @@ class ExcelParserTool(Toolkit):
 
 # Tool functions for agent use
 @tool(show_result=True)
-def excel_structure_parser(file_path: str = None) -> Dict:
-    return ExcelParserTool().excel_parser(file_path)
+def excel_structure_parser(file_path: str = None, task: str = None, top_k: int = None) -> Dict:
+    """Describe every sheet (shape, columns, dtypes, 3 sample rows). Pass the task to only get the columns relevant to it."""
+    return ExcelParserTool().excel_parser(file_path, task, top_k)
+
+@tool(show_result=True)
+def find_relevant_columns(task: str, top_k: int = COLUMN_TOP_K, sheet: str = None, offset: int = 0) -> Dict:
+    """Rank the workbook columns by relevance to a task. Increase offset to page through less relevant columns."""
+    try:
+        if not column_index_path.exists():
+            build_column_index(str(excel_path))
+        columns = get_column_index().select(task, top_k, sheet=sheet, offset=offset)
+        return {"task": task, "offset": offset, "columns": columns}
+    except Exception as e:
+        return {"error": f"Error ranking columns: {e}", "columns": []}
+
+@tool(show_result=True)
+def get_column_details(columns: str, sheet: str = None) -> Dict:
+    """Get the profile (dtype, null %, unique count, samples, range) of specific columns, given as a comma-separated list of names"""
+    try:
+        if not column_index_path.exists():
+            build_column_index(str(excel_path))
+        wanted = {c.strip() for c in columns.split(",") if c.strip()}
+        found = [p for p in get_column_index().profiles if p["column"] in wanted and (not sheet or p["sheet"] == sheet)]
+        missing = sorted(wanted - {p["column"] for p in found})
+        return {"columns": found, "not_found": missing}
+    except Exception as e:
+        return {"error": f"Error reading column details: {e}", "columns": []}
+
+@tool(show_result=True)
+def get_formula_dependencies(column: str = None) -> Dict:
+    """Which columns are computed by Excel formulas and from what. With a column name ('Total' or 'Sheet'.'Total'),
+    returns its formula, the columns it is derived from and the columns derived from it; without one, all computed columns."""
+    try:
+        if not formula_graph_path.exists():
+            build_formula_graph(str(excel_path))
+        graph = get_formula_graph()
+        if column:
+            return column_dependencies(graph, column)
+        return {"derived_columns": graph["derived_columns"], "cross_sheet_links": graph["cross_sheet_links"]}
+    except Exception as e:
+        return {"error": f"Error reading formula dependencies: {e}", "derived_columns": []}
+
+@tool(show_result=True)
+def profile_table_columns(table: str = None, exact: bool = False) -> Dict:
+    """Column statistics of a table (nulls, distinct count, min/max, quantiles, mean, outliers). Large tables are profiled
+    on a stratified sample with 95% bounds, except min/max which are the sample's (sample_min/sample_max, no bounds);
+    exact=True reads the whole table instead (slower). table is a label from excel_structure_parser ('Sheet' or
+    'Sheet!A1:F900000'); all tables when omitted."""
+    try:
+        if exact and table:
+            index = get_regions(str(excel_path))
+            regions = {(s if len(info["regions"]) == 1 else f"{s}!{r['range']}"): r for s, info in (index or {"sheets": {}})["sheets"].items() for r in info["regions"]}
+            if table in regions:
+                return {table: profile_table(read_region(str(excel_path), regions[table]), exact=True)}
+        profiles = {}
+        for label, _, df in read_tables(str(excel_path), sample=not exact):
+            if table in (None, label):
+                profiles[label] = profile_table(df, exact=exact)
+        return profiles or {"error": f"Table not found: {table}"}
+    except Exception as e:
+        return {"error": f"Error profiling table: {e}"}
 
 @tool(show_result=True)
 def extract_and_analyze_charts_tool(file_path: str = None) -> Dict:
@@ -287,57 +431,60 @@ def analyze_extracted_image_content_tool(image_path: str) -> Dict:
 def excel_parser():
     return ExcelParserTool()
 
+@tool(show_result=True)
+def search_workbook_text(query: str, mode: str = "exact", sheet: str = None, column: str = None, limit: int = 50) -> Dict:
+    """Look up rows by name, product or code through the workbook text index. Text cells, whole numbers (codes, invoice
+    numbers, years) and dates (search them as YYYY-MM-DD) are indexed; amounts with decimals are not, filter those with pandas.
+    mode: 'exact' (whole words), 'prefix' (last word is a prefix) or 'fuzzy' (tolerates one typo per word).
+    Returns matching cells (sheet, 0-based row, excel_row, column) and the matching rows grouped per sheet."""
+    try:
+        if not text_index_path.exists():
+            build_text_index(str(excel_path))
+        return get_text_index().search(query, mode=mode, sheet=sheet, column=column, limit=limit)
+    except Exception as e:
+        return {"error": f"Error searching workbook text: {e}", "hits": []}
+
 #LATEX tools
 
 @tool("latex_runner")
-def compile_latex(tex_file_path: str):
+def compile_latex(tex_file_path: str) -> Dict:
+    """Compile a .tex file to PDF. On failure, 'errors' lists each error with its line number and the source line:
+    fix only those lines with write_latex_file_utf8 and compile again (unchanged documents are served from the build cache)."""
     try:
         # Use repo_path if relative path provided
         if not Path(tex_file_path).is_absolute():
             tex_file_path = str(repo_path / tex_file_path)
-        
-        # Get the directory where the .tex file is located
-        tex_file = Path(tex_file_path)
-        output_dir = str(tex_file.parent)
-        
-        # Compile with output directory set to same folder as .tex file
-        subprocess.run([str(tectonic_path), "--outdir", output_dir, tex_file_path], check=True)
-        print("✅ PDF generated successfully.")
-    except subprocess.CalledProcessError as e:
+        builder = get_report_builder()
+        result = builder.compile_async(tex_file_path).result(timeout=builder.timeout + 30)
+        if result["success"]:
+            register_artifact(result["pdf_path"], step="reporter")
+        print("✅ PDF generated successfully." if result["success"] else f"❌ Error during LaTeX compilation: {result['errors'][:3]}")
+        return result
+    except Exception as e:
         print("❌ Error during LaTeX compilation:", e)
+        return {"success": False, "errors": [{"line": None, "message": str(e), "context": ""}]}
 
 @tool("latex_escape")
 def escape_latex(text: str) -> str:
     if not isinstance(text, str):
         text = str(text)
-    accents_mapping = {
-        'é': 'e', 'è': 'e', 'ê': 'e', 'ë': 'e',
-        'à': 'a', 'á': 'a', 'â': 'a', 'ä': 'a',
-        'ù': 'u', 'ú': 'u', 'û': 'u', 'ü': 'u',
-        'ì': 'i', 'í': 'i', 'î': 'i', 'ï': 'i',
-        'ò': 'o', 'ó': 'o', 'ô': 'o', 'ö': 'o',
-        'ç': 'c', 'ñ': 'n',
-        'É': 'E', 'È': 'E', 'Ê': 'E', 'Ë': 'E',
-        'À': 'A', 'Á': 'A', 'Â': 'A', 'Ä': 'A',
-        'Ù': 'U', 'Ú': 'U', 'Û': 'U', 'Ü': 'U',
-        'Ì': 'I', 'Í': 'I', 'Î': 'I', 'Ï': 'I',
-        'Ò': 'O', 'Ó': 'O', 'Ô': 'O', 'Ö': 'O',
-        'Ç': 'C', 'Ñ': 'N',
-        'N°': 'Num'
-    }
-    
-    # Replace accented characters first
-    for accent, replacement in accents_mapping.items():
-        text = text.replace(accent, replacement)
-    
-    # Then handle LaTeX special characters
-    latex_mapping = {
-        '&': r'\&', '%': r'\%', '$': r'\$', '#': r'\#',
-        '_': r'\_', '{': r'\{', '}': r'\}', '~': r'\textasciitilde{}',
-        '^': r'\^{}', '\\': r'\textbackslash{}', '€': r'\euro{}'
-    }
-    pattern = re.compile('|'.join(re.escape(k) for k in latex_mapping))
-    return pattern.sub(lambda m: latex_mapping[m.group()], text)
+    return escape_text(text)
+
+@tool(show_result=True)
+def render_table(source: str, name: str, sheet: str = None, cell_range: str = None, columns: str = None, caption: str = "",
+                 max_rows: int = 200, max_columns: int = 8, decimals: int = 2) -> Dict:
+    """Turn a query result (CSV/Excel) or a sheet range into an escaped LaTeX longtable fragment saved as tables/<name>.tex.
+    source: file path relative to the repo (e.g. 'queries/top_products.xlsx' or 'cleaned_excel.xlsx').
+    cell_range: optional range such as 'A1:F200'. columns: optional comma-separated column names to keep.
+    Rows beyond max_rows are summarized, long tables break across pages with a repeated header, wide tables are split.
+    Include the result in the report with the returned 'latex' line (\\input{tables/<name>.tex}); never retype the table."""
+    try:
+        wanted = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+        result = render_table_fragment(source, name, sheet, cell_range, wanted, caption, max_rows, max_columns, decimals)
+        register_artifact(result["fragment_path"], step="reporter")
+        return result
+    except Exception as e:
+        return {"success": False, "error": f"Error rendering table: {e}"}
 
 @tool(name="write_latex_file_utf8")
 def proper_write_latex(latex_code: str, file_name: str = "latex.tex") -> str:
@@ -350,70 +497,48 @@ def proper_write_latex(latex_code: str, file_name: str = "latex.tex") -> str:
             
         with open(path, "w", encoding="utf-8") as f:
             f.write(latex_code)
+        register_artifact(path)
+        if path.suffix == ".tex" and "\\documentclass" in latex_code:
+            # Figures and the preamble format get ready while the agent moves on to compile_latex
+            get_report_builder().prepare(str(path))
         return f"LaTeX code successfully written to {path.resolve()}"
     except Exception as e:
         return f"Error writing LaTeX file: {e}"
 
+@tool(show_result=True)
+def prepare_report_figures(width: int = 1100, height: int = 650) -> Dict:
+    """Export a PNG for every plot spec (plots/*.json) through the shared renderer pool so it can be used with \\includegraphics.
+    Figures that were already rendered with the same spec and size are served from the render cache."""
+    try:
+        plots_dir = repo_path / "plots"
+        specs = sorted(plots_dir.glob("*.json")) if plots_dir.exists() else []
+        items = [{"fig": spec, "path": spec.with_suffix(".png"), "width": width, "height": height} for spec in specs]
+        rendered = get_renderer().render_many(items)
+        for rendered_path in rendered:
+            register_artifact(rendered_path, type="plot")
+        return {"success": True, "figures": [f"plots/{Path(p).name}" for p in rendered], "renderer_stats": dict(get_renderer().stats)}
+    except Exception as e:
+        return {"success": False, "error": f"Error exporting report figures: {e}", "figures": []}
+
 @tool(name="list_available_visualizations")
 def list_available_visualizations() -> str:
     """List all available plots, charts, and images for inclusion in reports"""
     try:
-        from core import repo_path, charts_path, images_path, plot_output_path, web_images
-        
-        available_files = {
-            "plots": [],
-            "charts": [],
-            "images": [],
-            "web_images": []
-        }
-        
-        # Check plots directory
-        plots_dir = repo_path / "plots"
-        if plots_dir.exists():
-            for file in plots_dir.glob("*"):
-                if file.is_file() and file.suffix.lower() in ['.png', '.jpg', '.jpeg', '.html', '.svg']:
-                    available_files["plots"].append({
-                        "filename": file.name,
-                        "path": str(file),
-                        "relative_path": f"plots/{file.name}",
-                        "type": file.suffix[1:].upper()
-                    })
-        
-        # Check charts directory
-        charts_dir = repo_path / "charts"
-        if charts_dir.exists():
-            for file in charts_dir.glob("*"):
-                if file.is_file() and file.suffix.lower() in ['.png', '.jpg', '.jpeg', '.svg']:
-                    available_files["charts"].append({
-                        "filename": file.name,
-                        "path": str(file),
-                        "relative_path": f"charts/{file.name}",
-                        "type": file.suffix[1:].upper()
-                    })
-        
-        # Check images directory
-        images_dir = repo_path / "images"
-        if images_dir.exists():
-            for file in images_dir.glob("*"):
-                if file.is_file() and file.suffix.lower() in ['.png', '.jpg', '.jpeg', '.svg']:
-                    available_files["images"].append({
-                        "filename": file.name,
-                        "path": str(file),
-                        "relative_path": f"images/{file.name}",
-                        "type": file.suffix[1:].upper()
-                    })
-        
-        # Check web_images directory
-        web_images_dir = repo_path / "web_images"
-        if web_images_dir.exists():
-            for file in web_images_dir.glob("*"):
-                if file.is_file() and file.suffix.lower() in ['.png', '.jpg', '.jpeg', '.svg']:
-                    available_files["web_images"].append({
-                        "filename": file.name,
-                        "path": str(file),
-                        "relative_path": f"web_images/{file.name}",
-                        "type": file.suffix[1:].upper()
-                    })
+        registry = workspace_registry()
+        if not registry.manifest.exists():
+            registry.sync()
+        
+        available_files = {}
+        for category, artifact, suffixes in (
+            ("plots", "plot", ('.png', '.jpg', '.jpeg', '.html', '.svg')),
+            ("charts", "chart", ('.png', '.jpg', '.jpeg', '.svg')),
+            ("images", "image", ('.png', '.jpg', '.jpeg', '.svg')),
+            ("web_images", "web_image", ('.png', '.jpg', '.jpeg', '.svg'))
+        ):
+            available_files[category] = [
+                {"filename": e["name"], "path": str(registry.absolute(e)), "relative_path": e["path"], "type": Path(e["name"]).suffix[1:].upper()}
+                for e in sorted(registry.find(type=artifact, suffixes=suffixes), key=lambda e: e["path"])
+            ]
         
         result = "AVAILABLE VISUALIZATIONS FOR REPORT:\n\n"
         
@@ -0,0 +1,229 @@
+import os, json, time, uuid, shutil, asyncio, hashlib
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, parse_options_header
+from core.paths import upload_cache_path
+from core.artifacts import file_hash
+from core.config import UPLOAD_MAX_BYTES, UPLOAD_CHUNK_SIZE, UPLOAD_EXPIRY_HOURS
+
+ALLOWED_SUFFIXES = ('.xlsx', '.xlsm', '.xlsb', '.xls')
+# Received bytes are handed to a worker thread for writing in batches of this size, keeping disk I/O off the event loop
+WRITE_BATCH = 1024 * 1024
+
+class UploadError(ValueError):
+    pass
+
+class UploadTooLarge(UploadError):
+    pass
+
+class UploadConflict(UploadError):
+    """The client's offset does not match what the server holds; it should resume from `offset`"""
+    def __init__(self, offset: int):
+        super().__init__(f"Upload offset mismatch, the server has {offset} bytes")
+        self.offset = offset
+
+def check_filename(filename: str):
+    if not filename or not filename.lower().endswith(ALLOWED_SUFFIXES):
+        raise UploadError("Only Excel files allowed")
+
+def _move(source: Path, target: Path):
+    target.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(source, target)
+    except OSError:
+        # The upload cache and the workspace are on different filesystems
+        shutil.move(str(source), str(target))
+
+class HashingWriter:
+    """File writer that hashes what it writes and stops as soon as the size limit is crossed"""
+    def __init__(self, path: Path, max_bytes: int = UPLOAD_MAX_BYTES, offset: int = 0, digest=None):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.size = offset
+        self.sha256 = digest or hashlib.sha256()
+        self._file = open(self.path, "r+b" if offset else "wb")
+        if offset:
+            self._file.seek(offset)
+            self._file.truncate()
+
+    def write(self, data: bytes):
+        if self.size + len(data) > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit")
+        self.size += len(data)
+        self.sha256.update(data)
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+async def _batches(stream: AsyncIterator[bytes], size: int = WRITE_BATCH) -> AsyncIterator[bytes]:
+    buffer = bytearray()
+    async for chunk in stream:
+        buffer += chunk
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+async def receive_multipart(request, target: Path, max_bytes: int = UPLOAD_MAX_BYTES) -> Dict:
+    """Parse a multipart upload as it arrives: the file part goes straight to `target` (through a temporary name) and is hashed
+    on the way, instead of being spooled by the form parser and copied afterwards. Returns the text fields and the file info."""
+    declared = int(request.headers.get("content-length") or 0)
+    if declared > max_bytes + 64 * 1024:
+        raise UploadTooLarge(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit")
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise UploadError("Expected a multipart/form-data body")
+
+    tmp = target.with_name(f".upload-{uuid.uuid4().hex[:8]}.part")
+    state = {"fields": {}, "headers": {}, "field": b"", "value": b"", "name": None, "data": bytearray(), "writer": None, "file": None}
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].decode("latin-1").lower()] = state["value"]
+        state["field"], state["value"] = b"", b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get("content-disposition", b""))
+        state["name"] = options.get(b"name", b"").decode("utf-8")
+        if b"filename" in options:
+            filename = Path(options[b"filename"].decode("utf-8")).name
+            check_filename(filename)
+            state["file"] = {"field": state["name"], "filename": filename}
+            state["writer"] = HashingWriter(tmp, max_bytes)
+
+    def on_part_data(data, start, end):
+        if state["writer"] is not None:
+            state["writer"].write(data[start:end])
+        else:
+            state["data"] += data[start:end]
+
+    def on_part_end():
+        if state["writer"] is not None:
+            state["writer"].close()
+            state["file"].update(size=state["writer"].size, sha256=state["writer"].sha256.hexdigest())
+            state["writer"] = None
+        else:
+            state["fields"][state["name"]] = state["data"].decode("utf-8")
+        state["headers"], state["data"] = {}, bytearray()
+
+    parser = MultipartParser(params[b"boundary"], {
+        "on_header_field": on_header_field, "on_header_value": on_header_value, "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished, "on_part_data": on_part_data, "on_part_end": on_part_end})
+    try:
+        # The parser callbacks write the file part, so parsing runs on a worker thread
+        async for batch in _batches(request.stream()):
+            await run_in_threadpool(parser.write, batch)
+        await run_in_threadpool(parser.finalize)
+        if state["file"] is None or "sha256" not in state["file"]:
+            raise UploadError("No file received")
+        await run_in_threadpool(_move, tmp, target)
+    finally:
+        if state["writer"] is not None:
+            state["writer"].close()
+        tmp.unlink(missing_ok=True)
+    return {"fields": state["fields"], "file": {**state["file"], "path": str(target)}}
+
+class UploadSessions:
+    """Resumable chunked uploads: the client declares the file, appends chunks at the offset the server reports
+    and resumes from that offset after a dropped connection. Chunks land in cache/uploads/<id>.part."""
+    def __init__(self, root: Path = upload_cache_path, max_bytes: int = UPLOAD_MAX_BYTES, expiry_hours: float = UPLOAD_EXPIRY_HOURS):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.expiry_hours = expiry_hours
+        self._hashers = {}
+        self._locks = {}
+
+    def _paths(self, upload_id: str):
+        if not upload_id.isalnum():
+            raise KeyError(upload_id)
+        return self.root / f"{upload_id}.json", self.root / f"{upload_id}.part"
+
+    def _meta(self, upload_id: str) -> Dict:
+        meta_path, _ = self._paths(upload_id)
+        if not meta_path.exists():
+            raise KeyError(upload_id)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def create(self, filename: str, size: int, sha256: Optional[str] = None) -> Dict:
+        check_filename(filename)
+        if size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes // (1024 * 1024)} MB limit")
+        self.expire()
+        self.root.mkdir(parents=True, exist_ok=True)
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._paths(upload_id)
+        meta = {"upload_id": upload_id, "filename": Path(filename).name, "size": size, "sha256": sha256, "created": time.time()}
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        part_path.touch()
+        self._hashers[upload_id] = (0, hashlib.sha256())
+        return self.status(upload_id)
+
+    def status(self, upload_id: str) -> Dict:
+        meta = self._meta(upload_id)
+        offset = self._paths(upload_id)[1].stat().st_size
+        return {**meta, "offset": offset, "complete": offset == meta["size"], "chunk_size": UPLOAD_CHUNK_SIZE}
+
+    async def append(self, upload_id: str, offset: int, stream: AsyncIterator[bytes]) -> Dict:
+        """Write a chunk at `offset`; whatever arrived before a disconnect is kept, so the next attempt resumes after it"""
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            status = self.status(upload_id)
+            if offset != status["offset"]:
+                raise UploadConflict(status["offset"])
+            # The running hash survives between chunks; after a restart it is recomputed once at the end
+            hashed_offset, digest = self._hashers.get(upload_id, (None, None))
+            writer = await run_in_threadpool(HashingWriter, self._paths(upload_id)[1], status["size"], offset,
+                                             digest if hashed_offset == offset else hashlib.sha256())
+            try:
+                async for batch in _batches(stream):
+                    await run_in_threadpool(writer.write, batch)
+            except UploadTooLarge:
+                raise UploadError(f"Chunk goes past the declared size of {status['size']} bytes")
+            finally:
+                writer.close()
+                self._hashers[upload_id] = (writer.size, writer.sha256) if hashed_offset == offset else (None, None)
+            return self.status(upload_id)
+
+    def finish(self, upload_id: str, target: Path) -> Dict:
+        """Check size and checksum, then move the assembled file into the workspace"""
+        status = self.status(upload_id)
+        if not status["complete"]:
+            raise UploadConflict(status["offset"])
+        meta_path, part_path = self._paths(upload_id)
+        hashed_offset, digest = self._hashers.pop(upload_id, (None, None))
+        sha256 = digest.hexdigest() if hashed_offset == status["size"] else file_hash(part_path)
+        if status["sha256"] and status["sha256"].lower() != sha256:
+            raise UploadError("Checksum mismatch: the uploaded file is corrupted, please upload it again")
+        _move(part_path, target)
+        meta_path.unlink(missing_ok=True)
+        self._locks.pop(upload_id, None)
+        return {"filename": status["filename"], "size": status["size"], "sha256": sha256, "path": str(target)}
+
+    def expire(self):
+        """Drop abandoned uploads"""
+        cutoff = time.time() - self.expiry_hours * 3600
+        for meta_path in self.root.glob("*.json"):
+            part_path = meta_path.with_suffix(".part")
+            last_activity = max(meta_path.stat().st_mtime, part_path.stat().st_mtime if part_path.exists() else 0)
+            if last_activity < cutoff:
+                meta_path.unlink(missing_ok=True)
+                part_path.unlink(missing_ok=True)
+                self._hashers.pop(meta_path.stem, None)
+
+_sessions = None
+
+def get_upload_sessions() -> UploadSessions:
+    global _sessions
+    if _sessions is None:
+        _sessions = UploadSessions()
+    return _sessions
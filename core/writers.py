@@ -0,0 +1,199 @@
+import re, importlib.util
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+from core.config import EXCEL_WRITER, EXPORT_CHUNK_ROWS
+
+# Excel's hard limit; longer tables continue on "<sheet> (2)", "<sheet> (3)"...
+MAX_ROWS = 1048576
+INVALID_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+DATE_FORMAT, DATETIME_FORMAT, DURATION_FORMAT = "yyyy-mm-dd", "yyyy-mm-dd hh:mm:ss", "[h]:mm:ss"
+Frames = Union[pd.DataFrame, Iterable[pd.DataFrame]]
+
+def writer_engine() -> str:
+    """xlsxwriter in constant-memory mode when installed (fastest), otherwise openpyxl's write-only mode"""
+    if EXCEL_WRITER in ("xlsxwriter", "openpyxl"):
+        return EXCEL_WRITER
+    return "xlsxwriter" if importlib.util.find_spec("xlsxwriter") else "openpyxl"
+
+def sheet_title(name: str, taken: set) -> str:
+    title = INVALID_SHEET_CHARS.sub("_", str(name)).strip("'")[:31] or "Sheet"
+    base, n = title, 2
+    while title.lower() in taken:
+        suffix = f" ({n})"
+        title, n = base[:31 - len(suffix)] + suffix, n + 1
+    taken.add(title.lower())
+    return title
+
+def _chunks(frames: Frames, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    for frame in [frames] if isinstance(frames, pd.DataFrame) else frames:
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows]
+        if len(frame) == 0:
+            yield frame
+
+def _column_format(series: pd.Series) -> Optional[str]:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dropna()
+        times = values.dt.tz_localize(None) if getattr(values.dt, "tz", None) is not None else values
+        return DATE_FORMAT if (times == times.dt.normalize()).all() else DATETIME_FORMAT
+    if pd.api.types.is_timedelta64_dtype(series):
+        return DURATION_FORMAT
+    return None
+
+def _cell_values(series: pd.Series) -> List:
+    """Column -> plain Python values the writers understand, with None for missing cells"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if getattr(series.dt, "tz", None) is not None:
+            series = series.dt.tz_localize(None)
+        # Timestamps are datetime objects, which both writers accept
+        return series.astype(object).where(series.notna(), None).tolist()
+    if pd.api.types.is_timedelta64_dtype(series):
+        # Excel durations are fractions of a day
+        return (series.dt.total_seconds() / 86400).astype(object).where(series.notna(), None).tolist()
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series) or pd.api.types.is_float_dtype(series):
+        values = series.astype(object).where(series.notna(), None).tolist()
+        return [v if v is None or not isinstance(v, float) or np.isfinite(v) else None for v in values]
+    values = series.astype(object).where(series.notna(), None).tolist()
+    return [v if v is None or isinstance(v, (str, int, float, bool)) or hasattr(v, "year") else str(v) for v in values]
+
+def _rows(chunk: pd.DataFrame) -> Iterator[tuple]:
+    return zip(*(_cell_values(chunk.iloc[:, i]) for i in range(chunk.shape[1]))) if chunk.shape[1] else iter(())
+
+def _widths(chunk: pd.DataFrame) -> List[float]:
+    """Column widths from the header and the first rows, like a double-click on the column border"""
+    sample = chunk.head(200)
+    widths = []
+    for i, col in enumerate(chunk.columns):
+        lengths = sample.iloc[:, i].dropna().astype(str).str.len()
+        widths.append(min(max([len(str(col)), *(lengths.tolist() or [0])]) + 2, 60))
+    return widths
+
+class _OpenpyxlSheets:
+    def __init__(self, path: Path):
+        from openpyxl import Workbook
+        from openpyxl.styles import Font
+        self.path, self.workbook, self.bold = path, Workbook(write_only=True), Font(bold=True)
+
+    def add(self, title: str, columns: List[str], formats: List[Optional[str]], widths: List[float]):
+        from openpyxl.utils import get_column_letter
+        self.sheet = self.workbook.create_sheet(title)
+        for i, width in enumerate(widths, start=1):
+            self.sheet.column_dimensions[get_column_letter(i)].width = width
+        self.sheet.freeze_panes = "A2"
+        self.formats = [(i, f) for i, f in enumerate(formats) if f]
+        self.sheet.append([self._cell(c, font=self.bold) for c in columns])
+
+    def _cell(self, value, number_format=None, font=None):
+        from openpyxl.cell import WriteOnlyCell
+        cell = WriteOnlyCell(self.sheet, value=value)
+        if number_format:
+            cell.number_format = number_format
+        if font:
+            cell.font = font
+        return cell
+
+    def write(self, row: tuple):
+        if self.formats or any(isinstance(v, str) and v.startswith("=") for v in row):
+            row = list(row)
+            for i, number_format in self.formats:
+                if row[i] is not None:
+                    row[i] = self._cell(row[i], number_format)
+            for i, value in enumerate(row):
+                # Text that looks like a formula stays text, as it was in the DataFrame
+                if isinstance(value, str) and value.startswith("="):
+                    row[i] = self._cell(value)
+                    row[i].data_type = "s"
+        self.sheet.append(row)
+
+    def finish_sheet(self, rows: int, cols: int):
+        from openpyxl.utils import get_column_letter
+        if cols:
+            self.sheet.auto_filter.ref = f"A1:{get_column_letter(cols)}{rows + 1}"
+
+    def close(self):
+        self.workbook.save(self.path)
+
+class _XlsxwriterSheets:
+    def __init__(self, path: Path):
+        import xlsxwriter
+        self.workbook = xlsxwriter.Workbook(str(path), {"constant_memory": True, "nan_inf_to_errors": True, "remove_timezone": True})
+        self.bold = self.workbook.add_format({"bold": True})
+        self._formats = {}
+
+    def add(self, title: str, columns: List[str], formats: List[Optional[str]], widths: List[float]):
+        self.sheet, self.row = self.workbook.add_worksheet(title), 0
+        self.cell_formats = []
+        for i, (width, number_format) in enumerate(zip(widths, formats)):
+            if number_format and number_format not in self._formats:
+                self._formats[number_format] = self.workbook.add_format({"num_format": number_format})
+            self.cell_formats.append(self._formats.get(number_format))
+            self.sheet.set_column(i, i, width)
+        self.sheet.freeze_panes(1, 0)
+        for i, column in enumerate(columns):
+            self.sheet.write_string(0, i, column, self.bold)
+
+    def write(self, row: tuple):
+        self.row += 1
+        sheet, r = self.sheet, self.row
+        for i, value in enumerate(row):
+            # Typed writes: write() would turn text starting with "=" into a formula
+            if value is None:
+                continue
+            if isinstance(value, str):
+                sheet.write_string(r, i, value)
+            elif isinstance(value, bool):
+                sheet.write_boolean(r, i, value)
+            elif isinstance(value, (int, float)):
+                sheet.write_number(r, i, value, self.cell_formats[i])
+            else:
+                sheet.write_datetime(r, i, value, self.cell_formats[i])
+
+    def finish_sheet(self, rows: int, cols: int):
+        if cols:
+            self.sheet.autofilter(0, 0, rows, cols - 1)
+
+    def close(self):
+        self.workbook.close()
+
+def write_excel(path: Union[str, Path], data: Union[Frames, Dict[str, Frames]], sheet_name: str = "Sheet1",
+                index: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS, engine: Optional[str] = None) -> Dict:
+    """Write one or several tables to an .xlsx file with a streaming writer: rows go to disk chunk by chunk, so memory
+    stays flat however long the tables are. Keeps numbers, dates, booleans and text as typed cells, with a bold frozen
+    header, an autofilter and fitted column widths.
+
+    data: a DataFrame, a {sheet name: DataFrame} dict, or DataFrame chunks (any iterable) for either.
+    Returns the path, the engine used and the rows written per sheet."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    sheets = data if isinstance(data, dict) else {sheet_name: data}
+    engine = engine or writer_engine()
+    tmp = path.with_name(f".{path.stem}.writing{path.suffix}")
+    out = (_XlsxwriterSheets if engine == "xlsxwriter" else _OpenpyxlSheets)(tmp)
+    taken, written = set(), {}
+    try:
+        for name, frames in sheets.items():
+            title, columns, rows = None, None, 0
+            for chunk in _chunks(frames, chunk_rows):
+                if index:
+                    chunk = chunk.reset_index()
+                if title is None or rows + len(chunk) > MAX_ROWS - 1:
+                    if title is not None:
+                        out.finish_sheet(rows, len(columns))
+                        written[title] = rows
+                    title, columns, rows = sheet_title(name, taken), [str(c) for c in chunk.columns], 0
+                    out.add(title, columns, [_column_format(chunk[c]) for c in chunk.columns], _widths(chunk))
+                for row in _rows(chunk):
+                    out.write(row)
+                rows += len(chunk)
+            if title is None:
+                title, columns = sheet_title(name, taken), []
+                out.add(title, columns, [], [])
+            out.finish_sheet(rows, len(columns))
+            written[title] = rows
+        out.close()
+        tmp.replace(path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return {"path": str(path), "engine": engine, "sheets": written}
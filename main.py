@@ -1,12 +1,27 @@
-import sys, os, shutil, time, gc, logging, uvicorn, glob
+import sys, os, shutil, time, gc, logging, uvicorn
+from contextlib import asynccontextmanager
 from pathlib import Path
 from dotenv import load_dotenv
 from agents.agents import AgentManager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import dashboard, upload, download, streaming
+from routers import dashboard, upload, download, streaming, assets
 from core.Structured_Output import OrchestratorDecision, CleanerResponse, FilterResponse, PlotResponse, ReportResponse, SummaryResponse
 from core.Yielding import log_agent_message, clear_agent_logs
+from core.text_index import build_text_index
+from core.column_index import build_column_index
+from core.regions import build_region_index
+from core.formulas import build_formula_graph
+from core.revisions import start_revision, finish_revision, layout_changes
+from core.schemas import match_schema, remember_schema
+from core.pipeline import extract_media, run_scout, choose_deliverable
+from core.config import LLM_TOOL_AGENTS
+from core.script_library import script_library, OUTPUTS
+from core.model_router import model_router
+from core.renderer import get_renderer
+from core.artifacts import workspace_registry
+from core.result_store import get_result_store
+from core.events import get_event_bus, publish_event
 
 from core.paths import (
     excel_path, context_path, profiler_notes_path, review_notes_path, cleaned_excel,
@@ -14,26 +29,70 @@ from core.paths import (
     filter_output_path, plot_output_path, images_path, queries_path, report_path)
 
 load_dotenv()
-key = os.getenv("OPENAI_API_KEY")
-os.environ["OPENAI_API_KEY"] = key
-manager = AgentManager("gpt-4o")
+_manager = None
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 def run_preprocessing(manager):
+    revision = start_revision(excel_path)
+    manager.revision = revision
+    if revision["status"] == "unchanged":
+        log_agent_message(f"♻️ This workbook was analysed before, reusing its analysis ({', '.join(revision['restored'])})")
+    elif revision["status"] == "revised":
+        changed = len(revision["diff"]["changed"]) + len(revision["diff"]["added"])
+        log_agent_message(f"♻️ Revision of an earlier upload: {changed} sheet(s) changed, {len(revision['diff']['unchanged'])} unchanged")
+
     log_agent_message("Data extraction started")
-    extractor = manager.get_data_extractor_agent()
-    extractor.run()
+    if LLM_TOOL_AGENTS:
+        extractor = manager.get_data_extractor_agent()
+        extractor.run()
+        # The agent may also have written files through its own scripts
+        workspace_registry().sync(step="extraction")
+    else:
+        # The extraction tools register the charts, images and media.json as they write them
+        media = extract_media(str(excel_path))
+        log_agent_message(f"Extracted {media['charts']} chart(s) and {media['images']} image(s)" + (f" ({'; '.join(media['errors'])})" if media["errors"] else ""))
     log_agent_message("✅ All Data extracted successfully")
 
+    log_agent_message("Locating the tables of the excel file...")
+    region_result = build_region_index(excel_path)
+    log_agent_message(f"✅ Region index built ({region_result['regions']} tables over {region_result['sheets']} sheets)")
+    formula_result = build_formula_graph(excel_path)
+    log_agent_message(f"✅ Formula graph built ({formula_result['derived_columns']} computed columns, {formula_result['formulas']} formula cells)")
+
+    log_agent_message("Indexing the text cells of the excel file...")
+    index_result = build_text_index(excel_path)
+    log_agent_message(f"✅ Text index built ({index_result['terms']} terms over {index_result['sheets']} sheets)")
+    column_result = build_column_index(excel_path)
+    log_agent_message(f"✅ Column index built ({column_result['columns']} columns profiled)")
+
+    if revision["status"] == "unchanged":
+        finish_revision(excel_path)
+        log_agent_message("✅ The Preprocessing is Done\n")
+        return
+
     log_agent_message("Scouting the excel file...")
-    scout = manager.get_scout_agent()
-    scout_response = scout.run(f"Run the initial data scout on '{excel_path}' and save the report to '{context_path}'.")
+    if LLM_TOOL_AGENTS:
+        scout = manager.get_scout_agent()
+        scout_response = scout.run(f"Run the initial data scout on '{excel_path}' and save the report to '{context_path}'.")
+    else:
+        log_agent_message(run_scout(excel_path, context_path))
     log_agent_message(f"✅ Scouting is finished.")
 
-    log_agent_message("Understanding excel file...")
-    profiler = manager.get_profiler_agent()
-    profiler_response = profiler.run(f"Analyze the data in '{excel_path}' to understand its business context and save your findings to '{profiler_notes_path}'.")
-    log_agent_message(f"✅ Understanding is finished.")
+    # A revision keeps its own previous notes; otherwise a workbook with a known layout reuses the notes stored for it
+    schema = match_schema() if revision["status"] == "new" else {"status": "skipped"}
+    manager.schema = schema
+    # Rows edited or appended under the same titles and headers do not change what the columns mean: the restored notes still hold
+    rows_only = revision["status"] == "revised" and "context_notes.txt" in revision["restored"] and not revision["diff"]["added"] \
+        and all(change["rows"] != "all" for change in revision["diff"]["changed"].values()) and layout_changes(revision, excel_path) == []
+    if schema["status"] == "matched":
+        log_agent_message(f"♻️ Known workbook layout (seen {schema['uses']} time(s) before): column semantics reused, skipping the profiling")
+    elif rows_only:
+        log_agent_message("♻️ Only rows changed since the previous upload: its profiler notes are kept, skipping the profiling")
+    else:
+        log_agent_message("Understanding excel file...")
+        profiler = manager.get_profiler_agent()
+        profiler_response = profiler.run(f"Analyze the data in '{excel_path}' to understand its business context and save your findings to '{profiler_notes_path}'.")
+        log_agent_message(f"✅ Understanding is finished.")
 
     log_agent_message("Analysing excel file...")
     analyst = manager.get_analyst_agent()
@@ -63,12 +122,24 @@ def run_preprocessing(manager):
             summary_exist = True
             log_agent_message("✅ The Preprocessing is Done\n")
         log_agent_message("Creating summary...\n")
+    finish_revision(excel_path)
+    remember_schema(schema)
         
 def run_agents(query, manager, decision):
     clear_agent_logs()
     log_agent_message(f"🎯 Agent to call: {decision.agent_to_call}")
+    registry = workspace_registry()
+    registry.step = decision.agent_to_call
     
     orchestrator = manager.get_orchestrator_agent(todo=todo)
+
+    # A task already solved on this workbook layout replays its verified script instead of generating code
+    reused = script_library().replay(decision.agent_to_call, decision.task_to_perform)
+    if reused:
+        registry.sync(OUTPUTS[decision.agent_to_call], step=decision.agent_to_call)
+        log_agent_message(f"♻️ Reused a verified script for '{reused['task']}' ({reused['seconds']}s, {len(reused['outputs'])} output(s))")
+        orchestrator.run(f"✅ the task '{decision.task_to_perform}' has been completed successfully. Summary: a verified script from an earlier run of the same task was replayed.")
+        return True
     
     if decision.agent_to_call == 'cleaner':
         log_agent_message("\n⏱ Cleaning ...")
@@ -81,7 +152,8 @@ def run_agents(query, manager, decision):
         cleaning_response = cleaner.run()
         
         if isinstance(cleaning_response.content, CleanerResponse) and cleaning_response.content.status == "success":
-            if os.path.isfile(cleaned_excel):
+            registry.sync(cleaned_excel, step="cleaner")
+            if registry.exists(type="cleaned"):
                 log_agent_message(f"✅ cleaning finished successfully.")
                 log_agent_message(f"Summary : {cleaning_response.content.summary}")
                 orchestrator.run(f"✅ the task '{decision.task_to_perform}' has been completed successfully. Summary: {cleaning_response.content.summary}")
@@ -99,8 +171,9 @@ def run_agents(query, manager, decision):
         filter_response = filter_agent.run()
         
         if isinstance(filter_response.content, FilterResponse) and filter_response.content.status == "success":
-            patterns = ["*.csv", "*.xlsx", "*.xls", "*.txt"]
-            if any(glob.glob(os.path.join(queries_path, pattern)) for pattern in patterns):
+            # Generated scripts write their outputs directly, so record them once after the step
+            registry.sync(queries_path, step="filter")
+            if registry.exists(type="query", suffixes=(".csv", ".xlsx", ".xls", ".txt")):
                 log_agent_message(f"✅ filtering has been finished successfully.")
                 log_agent_message(f"Summary: {filter_response.content.summary}")
                 orchestrator.run(f"✅ The task '{decision.task_to_perform}' has been completed successfully. Summary: {filter_response.content.summary}")
@@ -114,13 +187,17 @@ def run_agents(query, manager, decision):
             return False
     elif decision.agent_to_call == 'plot':
         log_agent_message("\n⏱ Ploting the user request ...")
+        get_renderer().start()
         plot_agent = manager.get_plot_agent(context_notes=profiler_notes_path, task=decision.task_to_perform, excel_path=cleaned_excel, output_path=plot_output_path)
         plot_response = plot_agent.run()
         
         if isinstance(plot_response.content, PlotResponse) and plot_response.content.status == "success":
-            if glob.glob(os.path.join(plot_output_path, "*.html")):
+            registry.sync(plot_output_path, step="plot")
+            if registry.exists(type="plot", suffixes=(".html",)):
                 log_agent_message(f"✅ Plotting finished successfully.")
                 log_agent_message(f"Summary: {plot_response.content.summary}")
+                if plot_response.content.reduction_ratio > 1:
+                    log_agent_message(f"📉 Large series were reduced {plot_response.content.reduction_ratio}x to keep the plot responsive")
                 orchestrator.run(f"✅ The task '{decision.task_to_perform}' has been completed successfully. Summary: {plot_response.content.summary}")
                 log_agent_message("📊 you can access your plots at: http://localhost:8001")
             else:
@@ -137,7 +214,8 @@ def run_agents(query, manager, decision):
         summary_response = summary_agent.run()
         
         if isinstance(summary_response.content, SummaryResponse) and summary_response.content.status == "success":
-            if os.path.isfile(summary_path):
+            registry.sync(summary_path, step="summary")
+            if registry.exists(type="summary"):
                 log_agent_message(f"✅ Summarizing finished successfully.")
                 orchestrator.run(f"✅ The task '{decision.task_to_perform}' has been completed successfully.")
             else:
@@ -156,7 +234,8 @@ def run_agents(query, manager, decision):
         report_response = report_agent.run()
         
         if isinstance(report_response.content, ReportResponse) and report_response.content.status == "success":
-            if os.path.isfile(report_path):
+            registry.sync(report_path, step="reporter")
+            if registry.exists(type="report"):
                 log_agent_message(f"✅ Report finished successfully.")
                 log_agent_message(f"Summary: {report_response.content.summary}")
                 log_agent_message(f"Content overview: {report_response.content.content_overview}")
@@ -180,8 +259,17 @@ def run_agents(query, manager, decision):
     
     return True
 
-def main_function(query: str):
+def get_manager() -> AgentManager:
+    global _manager
+    if _manager is None:
+        _manager = AgentManager()
+    return _manager
+
+def main_function(query: str, job_id: str = None):
     final_message = ""
+    manager = get_manager()
+    job_id = get_event_bus().start_job(job_id)
+    model_router().start_run(job_id)
     
     log_agent_message("⏱ Preprocessing ...")
     run_preprocessing(manager)
@@ -190,6 +278,7 @@ def main_function(query: str):
     planner = manager.get_planner_agent(query=query, todo=todo).run()
     log_agent_message("✅The plan has been created succefully ,  You can follow the steps of my plan in the Task Progress section\n⏱ Running first step ...")
     orchestrator = manager.get_orchestrator_agent(todo=todo)
+    completed = []
     
     while True:
         decision_response = orchestrator.run("Read the todo.md file and decide the next step.")
@@ -204,34 +293,45 @@ def main_function(query: str):
             log_agent_message("✅ All tasks are complete. Workflow finished.")
             break
         else:
+            started = time.time()
             agent_success = run_agents(query, manager, decision)
-            if not agent_success:
+            if agent_success:
+                completed.append(decision.agent_to_call)
+                script_library().record(decision.agent_to_call, decision.task_to_perform, started)
+            else:
                 log_agent_message("❌ Agent execution failed.")
 
     log_agent_message("⏱ The output is being generated...")
-    delivery_agent = manager.get_delivery_agent(query=query, repo_path=repo_path, excel_path=excel_path, profiler_notes_path=profiler_notes_path, workspace_path=workspace_path).run()
-    output = delivery_agent.content.chosen_path
-    clickable_link = getattr(delivery_agent.content, 'clickable_link', '')
+    if LLM_TOOL_AGENTS:
+        delivery = manager.get_delivery_agent(query=query, repo_path=repo_path, excel_path=excel_path, profiler_notes_path=profiler_notes_path, workspace_path=workspace_path).run().content
+    else:
+        delivery = choose_deliverable(query, completed)
+        log_agent_message(f"Delivering {Path(delivery.chosen_path).name}")
+    output = delivery.chosen_path
+    clickable_link = getattr(delivery, 'clickable_link', '')
 
     gc.collect()
     time.sleep(1)
 
     log_agent_message("⏱ one more second...")
     try:
-        final = "output"; os.makedirs(final, exist_ok=True)
-        shutil.copy(output, final) if os.path.isfile(output) else shutil.copytree(output, os.path.join(final, os.path.basename(output)), dirs_exist_ok=True)
-        
-        output_dir_path = Path(final)
-        html_files = list(output_dir_path.glob('*.html'))
+        job = get_result_store().publish(output, step="delivery", job_id=job_id)
+        log_agent_message(f"📦 Results published as job {job['job_id']} ({len(job['files'])} files)")
         
         if os.path.exists(repo_path): shutil.rmtree(repo_path)
     except FileNotFoundError as e:
         log_agent_message(f"❌ PeaQock Manus failed, File not found: {e}")
         final_message = f"❌ Error: File not found - {e}"
     except Exception as e:
-        log_agent_message(f"❌ Error copying output: {e}")
-        final_message = f"❌ Error copying output: {e}"
+        log_agent_message(f"❌ Error publishing output: {e}")
+        final_message = f"❌ Error publishing output: {e}"
     
+    usage = model_router().summary(job_id)
+    model_router().save_trace(get_result_store().jobs / job_id / "trace.json", job_id)
+    model_router().finish_run(job_id)
+    if usage["models"]:
+        log_agent_message("🧭 Models used: " + ", ".join(f"{m} ({u['calls']} calls, {u['seconds']:.0f}s)" for m, u in usage["models"].items()) + f", ~${usage['cost']:.4f}")
+    publish_event("job", {"status": "failed" if final_message else "completed", "message": final_message or "✅ Task completed successfully!"}, job_id=job_id)
     return final_message if final_message else "✅ Task completed successfully!"
 
 # Import routers
@@ -240,23 +340,25 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("peaqock_api")
 
-app = FastAPI(title="PeaQock Manus API", description="API for PeaQock_Manus Agent", version="1.0.0")
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Server process only: profiling workers import this module again and must not repeat any of it
+    key = os.getenv("OPENAI_API_KEY")
+    os.environ["OPENAI_API_KEY"] = key
+    # Earlier results are kept in the result store; retention is enforced in the background
+    get_result_store().start_sweeper()
+    yield
+
+app = FastAPI(title="PeaQock Manus API", description="API for PeaQock_Manus Agent", version="1.0.0", lifespan=lifespan)
+# The dashboard calls the API cross-origin and reads Upload-Offset to resume chunked uploads
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"], expose_headers=["Upload-Offset"])
 
 # Include routers
 app.include_router(dashboard.router, tags=["dashboard"])
 app.include_router(upload.router, tags=["upload"])
 app.include_router(download.router, tags=["download"])  
 app.include_router(streaming.router, tags=["streaming"])
-
-if output_path.exists():
-    try:
-        shutil.rmtree(output_path)
-        logger.info("Cleaned output folder on startup")
-    except PermissionError:
-        logger.warning("Could not clean output folder - in use by another process")
-    except Exception as e:
-        logger.warning(f"Could not clean output folder: {e}")
+app.include_router(assets.router, tags=["assets"])
 
 if __name__ == "__main__":
     print("API server starting at http://127.0.0.1:8000/")
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, Request
+import logging
+from core.plotting import plotlyjs_bundle, plotlyjs_filename
+from core.static_files import CompressedAsset, IMMUTABLE_CACHE
+
+logger = logging.getLogger("peaqock_api")
+router = APIRouter()
+
+_bundle = {}
+
+def _plotlyjs() -> CompressedAsset:
+    """Load the plotly.js bundle once per process, with its strong ETag and precompressed variants"""
+    if not _bundle:
+        _bundle["asset"] = CompressedAsset(plotlyjs_bundle().encode("utf-8"), "application/javascript")
+    return _bundle["asset"]
+
+@router.get("/assets/{filename}")
+def get_asset(filename: str, request: Request):
+    """Serve the shared plotly.js bundle referenced by every plot HTML file"""
+    if filename != plotlyjs_filename():
+        raise HTTPException(status_code=404, detail=f"Asset '{filename}' not found")
+    return _plotlyjs().response(request, IMMUTABLE_CACHE)
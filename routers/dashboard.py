@@ -1,19 +1,28 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.responses import HTMLResponse
-from pathlib import Path
 import logging
+from core.paths import static_path
+from core.config import DASHBOARD_RELOAD
+from core.static_files import StaticCache
 
 logger = logging.getLogger("peaqock_api")
 router = APIRouter()
 
+# Read and compressed once when the API starts
+static_files = StaticCache(static_path, reload=DASHBOARD_RELOAD)
+
 @router.get("/", response_class=HTMLResponse)
-def get_dashboard():
-    """Serve the main dashboard HTML"""
-    html_file = Path(__file__).parent.parent / "static" / "index.html"
-    if not html_file.exists():
+def get_dashboard(request: Request):
+    """Serve the main dashboard HTML (revalidated with its ETag, so a reload is usually a 304)"""
+    response = static_files.response(request, "index.html")
+    if response is None:
         raise HTTPException(status_code=404, detail="Dashboard HTML file not found")
-    
-    with open(html_file, "r", encoding="utf-8") as f:
-        html_content = f.read()
-    
-    return HTMLResponse(content=html_content)
+    return response
+
+@router.get("/static/{filename}")
+def get_static_file(filename: str, request: Request):
+    """Serve a static file from memory, revalidated with its ETag"""
+    response = static_files.response(request, filename)
+    if response is None:
+        raise HTTPException(status_code=404, detail=f"Static file '{filename}' not found")
+    return response
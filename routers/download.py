@@ -1,8 +1,12 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pathlib import Path
-import logging
+import time, zlib, zipfile, logging
+from typing import Dict, Iterator, List, Optional
 from core.paths import output_path
+from core.plotting import inline_plotlyjs
+from core.artifacts import output_registry
+from core.result_store import get_result_store
 
 logger = logging.getLogger("peaqock_api")
 router = APIRouter()
@@ -20,27 +24,34 @@ MEDIA_TYPES = {
     '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
     '.doc': 'application/msword'
 }
+# Text formats are gzipped on the fly when the client accepts it; the rest is already compressed or binary
+GZIP_TYPES = {'.csv', '.html', '.txt', '.json', '.tex', '.md'}
+CHUNK_SIZE = 1024 * 1024
+
+def _published_files():
+    """Top-level files of the output folder, from its manifest (built once from disk when it is missing)"""
+    registry = output_registry()
+    if not registry.manifest.exists():
+        registry.sync()
+    entries = [e for e in registry.find() if "/" not in e["path"] and registry.absolute(e).is_file()]
+    return registry, sorted(entries, key=lambda e: e["name"])
 
 @router.get("/download")
-def download_output_file():
+def download_output_file(request: Request):
     """Auto-detect and download the highest priority file from output folder"""
     if not output_path.exists():
         raise HTTPException(404, "Output folder not found")
     
-    files = [f for f in output_path.iterdir() if f.is_file()]
-    if not files:
+    registry, entries = _published_files()
+    if not entries:
         raise HTTPException(404, "No files found")
     
     for ext in ['.pdf', '.xlsx', '.xls', '.html', '.png', '.jpg', '.jpeg']:
-        for f in files:
-            if f.suffix.lower() == ext:
-                media_type = MEDIA_TYPES.get(ext.lower(), 'application/octet-stream')
-                return FileResponse(f, filename=f.name, media_type=media_type)
+        for e in entries:
+            if e["name"].lower().endswith(ext):
+                return _send_file(request, registry.absolute(e), e)
     
-    file = files[0]
-    ext = file.suffix.lower()
-    media_type = MEDIA_TYPES.get(ext, 'application/octet-stream')
-    return FileResponse(file, filename=file.name, media_type=media_type)
+    return _send_file(request, registry.absolute(entries[0]), entries[0])
 
 @router.get("/list_output_files")
 def list_output_files():
@@ -49,27 +60,128 @@ def list_output_files():
         return []
     
     try:
-        return [
-            {"name": file_path.name, "size": file_path.stat().st_size}
-            for file_path in output_path.iterdir()
-            if file_path.is_file()
-        ]
+        _, entries = _published_files()
+        return [{"name": e["name"], "size": e["size"], "type": e["type"], "sha256": e["sha256"]} for e in entries]
     except Exception as e:
         logger.error(f"Error listing output files: {str(e)}")
         return []
 
-@router.get("/download/{filename}")
-def download_specific_file(filename: str):
-    """Download a specific file from the output directory"""    
+def _standalone_html(file_path: Path) -> Response:
+    """HTML plot with the plotly.js bundle inlined, for files opened outside the dashboard"""
+    html = inline_plotlyjs(file_path.read_text(encoding="utf-8"))
+    return Response(content=html, media_type="text/html", headers={"Content-Disposition": f'attachment; filename="{file_path.name}"'})
+
+@router.api_route("/download/{filename}", methods=["GET", "HEAD"])
+def download_specific_file(filename: str, request: Request, standalone: bool = False):
+    """Download a specific file from the output directory (standalone=true inlines plotly.js into HTML plots)"""    
     if not output_path.exists():
         raise HTTPException(status_code=404, detail="Output folder not found")
     
     safe_filename = Path(filename).name
     file_path = output_path / safe_filename
     
-    if not file_path.exists() or not file_path.is_file():
+    registry = output_registry()
+    published = registry.get(file_path) is not None if registry.manifest.exists() else True
+    if not published or not file_path.is_file():
         raise HTTPException(status_code=404, detail=f"File '{safe_filename}' not found")
     
+    ext = file_path.suffix.lower()
+    if standalone and ext == '.html':
+        return _standalone_html(file_path)
+    return _send_file(request, file_path, registry.get(file_path) if registry.manifest.exists() else None)
+
+def _etag(file_path: Path, entry: Optional[Dict]) -> str:
+    """Strong ETag from the content hash recorded at publication, mtime/size otherwise"""
+    if entry and entry.get("sha256"):
+        return f'"{entry["sha256"][:32]}"'
+    stat = file_path.stat()
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+def _gzip_stream(file_path: Path) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+    yield compressor.flush()
+
+def _send_file(request: Request, file_path: Path, entry: Optional[Dict]) -> Response:
+    """Conditional (If-None-Match -> 304), resumable (Range / If-Range) and, for text formats, gzip-encoded file download"""
     ext = file_path.suffix.lower()
     media_type = MEDIA_TYPES.get(ext, 'application/octet-stream')
-    return FileResponse(file_path, filename=safe_filename, media_type=media_type)
+    etag = _etag(file_path, entry)
+    gzipped = ext in GZIP_TYPES and "gzip" in request.headers.get("accept-encoding", "") and "range" not in request.headers
+    # The gzip variant is a different representation, so it gets its own validator
+    current = f'{etag[:-1]}-gzip"' if gzipped else etag
+    headers = {"ETag": current, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or current in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    if gzipped:
+        headers.update({"Content-Encoding": "gzip", "Content-Disposition": f'attachment; filename="{file_path.name}"'})
+        return StreamingResponse(_gzip_stream(file_path), media_type=media_type, headers=headers)
+    # FileResponse answers Range and If-Range itself (206 / 416, multipart for several ranges) and keeps our ETag
+    return FileResponse(file_path, filename=file_path.name, media_type=media_type, headers=headers)
+
+class _ZipSink:
+    """Write-only, non-seekable target for ZipFile: what is written is handed out in chunks as the archive grows"""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+
+    def write(self, data: bytes) -> int:
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def _zip_stream(files: List[tuple]) -> Iterator[bytes]:
+    """Build the zip incrementally: no temp file, memory bounded by one chunk.
+    ZipFile falls back to data descriptors on a non-seekable target, so entries can be written as they are read."""
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as archive:
+        for path, name in files:
+            stored = path.suffix.lower() not in GZIP_TYPES
+            info = zipfile.ZipInfo(name, date_time=time.localtime(path.stat().st_mtime)[:6])
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            with open(path, "rb") as source, archive.open(info, "w", force_zip64=path.stat().st_size > 2 ** 31) as target:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    target.write(chunk)
+                    if sink.buffer:
+                        yield sink.take()
+            yield sink.take()
+    yield sink.take()
+
+@router.get("/download_bundle")
+def download_bundle(job_id: Optional[str] = None):
+    """All the outputs of the current job (or of an earlier job kept in the result store) as one streamed zip"""
+    if job_id:
+        job = next((j for j in get_result_store().list_jobs() if j["job_id"] == job_id), None)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+        root = get_result_store().jobs / job_id
+        files = [(root / f["path"], f["path"]) for f in job["files"]]
+    else:
+        registry = output_registry()
+        if not registry.manifest.exists():
+            registry.sync()
+        root = output_path
+        files = [(registry.absolute(e), e["path"]) for e in sorted(registry.find(), key=lambda e: e["path"])]
+        job_id = "output"
+    files = [(path, name) for path, name in files if path.is_file()]
+    if not files:
+        raise HTTPException(status_code=404, detail="No files found")
+    headers = {"Content-Disposition": f'attachment; filename="peaqock-{job_id}.zip"', "Cache-Control": "no-cache"}
+    return StreamingResponse(_zip_stream(files), media_type="application/zip", headers=headers)
@@ -1,7 +1,9 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
-import time, logging
+from typing import Optional
+import time, asyncio, logging
 from core.paths import todo, agent_logs
+from core.events import get_event_bus, format_sse
 
 logger = logging.getLogger("peaqock_api")
 router = APIRouter()
@@ -27,7 +29,8 @@ def todo_stream():
         content = content or "[Todo list is being prepared...]"
         
         if content != last_content or i % 20 == 0:
-            yield f"data: {content.replace(chr(10), '\\n')}\n\n"
+            escaped = content.replace(chr(10), '\\n')
+            yield f"data: {escaped}\n\n"
             last_content = content
         
         time.sleep(0.2)
@@ -101,3 +104,32 @@ async def clear_agent_logs_session():
 async def stream_agent_logs(from_line: int = 0):
     """Stream agent logs file starting from a specific line"""
     return StreamingResponse(agent_logs_stream(from_line), media_type="text/event-stream")
+
+async def job_event_stream(request: Request, job_id: Optional[str], last_event_id: int):
+    """Replay what the client missed, then forward live events; a comment line every 15s keeps proxies from closing the stream"""
+    bus = get_event_bus()
+    queue = bus.subscribe(job_id)
+    try:
+        yield "retry: 3000\n\n"
+        sent = last_event_id
+        for event in bus.history(job_id, after=last_event_id):
+            sent = event["id"]
+            yield format_sse(event)
+        while not shutdown_flag and not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=15)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if event["id"] > sent:
+                sent = event["id"]
+                yield format_sse(event)
+    finally:
+        bus.unsubscribe(queue)
+
+@router.get("/events")
+async def stream_events(request: Request, job_id: Optional[str] = None, last_event_id: int = 0):
+    """One multiplexed stream per job: log, todo, artifact, artifact_removed and job events (all jobs when job_id is omitted)"""
+    resume_from = int(request.headers.get("last-event-id") or last_event_id)
+    return StreamingResponse(job_event_stream(request, job_id, resume_from), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,56 +1,143 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel
 from pathlib import Path
-import shutil, logging
-from core.paths import repo_path, output_path
+from typing import Optional
+import json, logging
+from core.paths import repo_path
+from core.events import publish_event
+from core.artifacts import register_artifact
+from core.readers import UnsupportedWorkbook, normalize_workbook
+from core.uploads import UploadError, UploadTooLarge, UploadConflict, receive_multipart, get_upload_sessions
 
 logger = logging.getLogger("peaqock_api")
 router = APIRouter()
 
 class UploadResponse(BaseModel):
     file_path: str
+    sha256: Optional[str] = None
 
-@router.post("/upload", response_model=UploadResponse)
-def upload_excel(file: UploadFile = File(...), query: str = Form("")):
-    """Upload Excel file for analysis and processing"""
-    
-    if not file.filename.lower().endswith(('.xlsx', '.xls')):
-        raise HTTPException(status_code=400, detail="Only Excel files allowed")
-    
+class UploadInit(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+class UploadComplete(BaseModel):
+    query: str = ""
+    job_id: str = ""
+
+def _prepare_workspace() -> Path:
     repo_dir = Path(repo_path)
     repo_dir.mkdir(exist_ok=True)
     (repo_dir / "scripts").mkdir(exist_ok=True)
-    
-    if output_path.exists():
-        shutil.rmtree(output_path)
-    
+
     target_file = repo_dir / "data.xlsx"
     target_file.unlink(missing_ok=True)
-    
-    with open(target_file, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    logger.info(f"File uploaded: {target_file}, Query: {query}")
-    
+    return target_file
+
+def _upload_error(e: UploadError) -> HTTPException:
+    if isinstance(e, UploadConflict):
+        return HTTPException(status_code=409, detail=str(e), headers={"Upload-Offset": str(e.offset)})
+    return HTTPException(status_code=413 if isinstance(e, UploadTooLarge) else 400, detail=str(e))
+
+def run_job(target_file: Path, sha256: str, query: str, job_id: str):
+    """Run the agents on an uploaded workbook"""
+    try:
+        workbook = normalize_workbook(target_file)
+    except UnsupportedWorkbook as e:
+        target_file.unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    if workbook["converted"]:
+        logger.info(f"{workbook['format']} upload kept as {workbook['source']} and converted to {target_file.name}")
+        register_artifact(workbook["source"], type="source", step="upload", digest=sha256)
+    register_artifact(target_file, type="source", step="upload", digest=None if workbook["converted"] else sha256)
+    logger.info(f"File uploaded: {target_file} (sha256 {sha256[:12]}), Query: {query}")
+
     try:
         from main import main_function
-        result = main_function(query)
+        # The dashboard picks the job id so it can subscribe to /events?job_id=... before the upload returns
+        result = main_function(query, job_id or None)
         logger.info("Main function executed successfully")
-        
-        response_data = {"file_path": str(target_file)}
-        
+
+        response_data = {"file_path": str(target_file), "sha256": sha256}
+
         if result and result.strip():
             response_data["message"] = result
             response_data["has_custom_message"] = True
         else:
             response_data["message"] = "Query processed successfully. Results available for download."
             response_data["has_custom_message"] = False
-            
+
         return response_data
     except Exception as e:
         logger.error(f"Error executing main function: {str(e)}")
+        publish_event("job", {"status": "failed", "message": f"Error processing query: {str(e)}"}, job_id=job_id or None)
         return {
-            "file_path": str(target_file), 
-            "message": f"Error processing query: {str(e)}", 
+            "file_path": str(target_file),
+            "message": f"Error processing query: {str(e)}",
             "has_custom_message": True
         }
+
+@router.post("/upload", response_model=UploadResponse)
+async def upload_excel(request: Request):
+    """Upload Excel file for analysis and processing (multipart fields: file, query, job_id).
+    The file is streamed into the workspace and hashed as it arrives."""
+    target_file = _prepare_workspace()
+    try:
+        upload = await receive_multipart(request, target_file)
+    except UploadError as e:
+        raise _upload_error(e)
+    except ClientDisconnect:
+        raise HTTPException(status_code=400, detail="Upload interrupted, please send the file again")
+    fields = upload["fields"]
+    return await run_in_threadpool(run_job, target_file, upload["file"]["sha256"], fields.get("query", ""), fields.get("job_id", ""))
+
+# Resumable uploads: POST /uploads, then PATCH /uploads/{id} chunks with Upload-Offset, then POST /uploads/{id}/complete
+@router.post("/uploads")
+def create_upload(init: UploadInit):
+    """Start a resumable upload; the response gives its id and the suggested chunk size"""
+    try:
+        return get_upload_sessions().create(init.filename, init.size, init.sha256)
+    except UploadError as e:
+        raise _upload_error(e)
+
+@router.api_route("/uploads/{upload_id}", methods=["GET", "HEAD"])
+def upload_status(upload_id: str):
+    """How many bytes the server holds, i.e. where the client should resume"""
+    try:
+        status = get_upload_sessions().status(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return Response(content=json.dumps(status), media_type="application/json", headers={"Upload-Offset": str(status["offset"]), "Cache-Control": "no-store"})
+
+@router.patch("/uploads/{upload_id}")
+async def append_upload(upload_id: str, request: Request):
+    """Append the request body at the Upload-Offset header"""
+    offset = request.headers.get("upload-offset")
+    if offset is None or not offset.isdigit():
+        raise HTTPException(status_code=400, detail="Missing Upload-Offset header")
+    try:
+        status = await get_upload_sessions().append(upload_id, int(offset), request.stream())
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    except UploadError as e:
+        raise _upload_error(e)
+    except ClientDisconnect:
+        # What arrived before the disconnect is kept: the session stays open and the client resumes from the reported offset
+        held = get_upload_sessions().status(upload_id)["offset"]
+        raise HTTPException(status_code=400, detail="Chunk interrupted, resume from Upload-Offset", headers={"Upload-Offset": str(held)})
+    return Response(status_code=204, headers={"Upload-Offset": str(status["offset"])})
+
+@router.post("/uploads/{upload_id}/complete", response_model=UploadResponse)
+async def complete_upload(upload_id: str, body: UploadComplete):
+    """Verify the assembled file, move it into the workspace and run the query on it"""
+    target_file = _prepare_workspace()
+    try:
+        # Hashing a resumed upload and moving it across filesystems can take a while, off the event loop
+        upload = await run_in_threadpool(get_upload_sessions().finish, upload_id, target_file)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    except UploadError as e:
+        raise _upload_error(e)
+    return await run_in_threadpool(run_job, target_file, upload["sha256"], body.query, body.job_id)